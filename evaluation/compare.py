@@ -2,64 +2,168 @@ import os
 import sys
 import json
 import time
+import argparse
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
 # Add current folder and root to path
 sys.path.append(os.path.dirname(__file__))
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
-from metrics import evaluate_answer, calculate_average_metrics
+from metrics import evaluate_answer, evaluate_retrieval, calculate_cost, calculate_average_metrics, judge
+from tools.llm_client import call_metrics, metrics as llm_metrics
+from tools.tracing import start_trace, span, stage_percentiles, span_percentiles, format_stage_table
 
+# (name, folder) of each backend, in report order
+BACKENDS = [("OpenAI", "openai-rag"), ("Local", "local-model-rag"), ("PageIndex", "pageindex-rag")]
 
-def run_evaluation(rag_name, query_func):
+# Queries in flight per backend: the local model serves few requests at once
+BACKEND_CONCURRENCY = {"OpenAI": 8, "Local": 2, "PageIndex": 4}
+
+# Judge calls in flight per backend run
+JUDGE_CONCURRENCY = 8
+
+
+def run_batch(query_batch_func, queries):
+    """
+    Answers every query with one query_batch call. Returns {id: (answer,
+    chunks)}, the wall time and the batch's trace, or (None, None, None)
+    if the batch failed.
+    """
+    print(f"Querying {len(queries)} questions as one batch...")
+    start_time = time.time()
+    try:
+        # One trace for the whole batch: its stages are shared by every query
+        with start_trace() as trace:
+            outputs = query_batch_func([q['query'] for q in queries])
+    except Exception as e:
+        print(f"Batch query failed, falling back to one query at a time: {e}")
+        return None, None, None
+    return {q['id']: output for q, output in zip(queries, outputs)}, time.time() - start_time, trace
+
+def answer_query(q, query_func, query_stream_func=None, batch_outputs=None, batch_time=None, n_queries=1):
+    """Returns (answer, chunks, latency, stream metrics) for one query."""
+    print(f"Querying [{q['id']}]: {q['query']}")
+    start_time = time.time()
+    # query_func now returns (answer, context_chunks)
+    stream_metrics = {}
+    if batch_outputs is not None:
+        # Batched queries share their wall time evenly
+        answer, chunks = batch_outputs[q['id']]
+        latency = batch_time / n_queries
+    elif query_stream_func is not None:
+        streamed = query_stream_func(q['query'])
+        answer, chunks = streamed.consume(), streamed.chunks
+        stream_metrics = streamed.metrics
+        latency = stream_metrics["total_latency"]
+    else:
+        answer, chunks = query_func(q['query'])
+        latency = time.time() - start_time
+    return answer, chunks, latency, stream_metrics
+
+def judge_query(rag_name, q, answer, chunks, judge_pool):
+    """Scores one answer; the answer and retrieval judge calls run concurrently on `judge_pool`."""
+    # Step 2 of Evaluation Protocol: Metrics
+    eval_future = judge_pool.submit(evaluate_answer, q['query'], "\n".join(chunks) if chunks else "PageIndex Internal", answer)
+    
+    # Precision@K estimate
+    precision_future = judge_pool.submit(evaluate_retrieval, q['query'], chunks) if chunks else None
+    
+    # Step 3: Cost tracking (simplified estimate)
+    cost = 0.0
+    if rag_name == "OpenAI":
+        # Estimate: query + context + prompt ~ 1500 tokens. Answer ~ 200 tokens.
+        cost = calculate_cost(1500, 200)
+    
+    eval_results = eval_future.result()
+    return {
+        "relevance": eval_results["relevance"],
+        "faithfulness": eval_results["faithfulness"],
+        "precision": precision_future.result() if precision_future is not None else 1.0,
+        "cost": cost
+    }
+
+def run_evaluation(rag_name, query_func, index_load_time=None, query_batch_func=None, query_stream_func=None,
+                   concurrency=1, judge_concurrency=JUDGE_CONCURRENCY):
+    """
+    Answers and judges every query, with up to `concurrency` queries and
+    `judge_concurrency` judge calls in flight. Results keep the order of
+    queries.json. With concurrency > 1, per-query latency includes
+    contention between in-flight queries; use 1 for isolated latencies.
+    Each result carries its query's stage trace, and the summary has
+    p50/p95/p99 per stage (see tools/tracing.py). In batch mode those
+    traces only hold judging; the batch's own stages are summarized
+    separately as batch_stage_latency.
+    """
     print(f"\n--- Evaluating {rag_name} ---")
     queries_path = os.path.join(os.path.dirname(__file__), "queries.json")
     with open(queries_path, "r") as f:
         queries = json.load(f)
 
-    
-    results = []
-    for q in queries:
-        print(f"Querying [{q['id']}]: {q['query']}")
-        start_time = time.time()
-        try:
-            # query_func now returns (answer, context_chunks)
-            answer, chunks = query_func(q['query'])
-            latency = time.time() - start_time
-            
-            # Step 2 of Evaluation Protocol: Metrics
-            eval_results = evaluate_answer(q['query'], "\n".join(chunks) if chunks else "PageIndex Internal", answer)
-            
-            # Precision@K estimate
-            from metrics import evaluate_retrieval
-            precision = evaluate_retrieval(q['query'], chunks) if chunks else 1.0
-            
-            # Step 3: Cost tracking (simplified estimate)
-            cost = 0.0
-            if rag_name == "OpenAI":
-                from metrics import calculate_cost
-                # Estimate: query + context + prompt ~ 1500 tokens. Answer ~ 200 tokens.
-                cost = calculate_cost(1500, 200)
-            
-            results.append({
+    # Model call counters cover this backend's run only
+    llm_metrics.reset()
+    run_start = time.time()
+
+    batch_outputs, batch_time, batch_trace = None, None, None
+    if query_batch_func is not None:
+        batch_outputs, batch_time, batch_trace = run_batch(query_batch_func, queries)
+
+    def evaluate(q, judge_pool):
+        with start_trace() as trace:
+            answer, chunks, latency, stream_metrics = answer_query(q, query_func, query_stream_func,
+                                                                   batch_outputs, batch_time, len(queries))
+            result = {
                 "id": q["id"],
                 "query": q["query"],
                 "answer": answer,
                 "latency": latency,
-                "relevance": eval_results["relevance"],
-                "faithfulness": eval_results["faithfulness"],
-                "precision": precision,
-                "cost": cost
-            })
-        except Exception as e:
-            print(f"Error evaluating {q['id']}: {e}")
+            }
+            with span("judge"):
+                result.update(judge_query(rag_name, q, answer, chunks, judge_pool))
+        if stream_metrics:
+            result["ttft"] = stream_metrics["ttft"]
+            result["tokens_per_sec"] = stream_metrics["tokens_per_sec"]
+        result["trace"] = trace.to_dict()
+        return result
 
+    results = []
+    with ThreadPoolExecutor(max_workers=judge_concurrency) as judge_pool, \
+            ThreadPoolExecutor(max_workers=max(1, concurrency)) as query_pool:
+        futures = [query_pool.submit(evaluate, q, judge_pool) for q in queries]
+        # Collected in query order, whatever order they finish in
+        for q, future in zip(queries, futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                print(f"Error evaluating {q['id']}: {e}")
 
     summary = calculate_average_metrics(results)
+    if index_load_time is not None:
+        # Reported on its own so it is not folded into per-query latency
+        summary["index_load_time"] = index_load_time
+    if batch_time is not None:
+        summary["batch_time"] = batch_time
+    summary["wall_time"] = time.time() - run_start
+    for key in ("ttft", "tokens_per_sec"):
+        values = [r[key] for r in results if r.get(key) is not None]
+        if values:
+            summary[f"avg_{key}"] = sum(values) / len(values)
+    summary["stage_latency"] = stage_percentiles([r["trace"] for r in results])
+    print(f"\n{rag_name} stage latency (per query):\n{format_stage_table(summary['stage_latency'])}")
+    if batch_trace is not None:
+        # The batch's stages ran once for all queries, or once per question on
+        # shared threads, so they can't go into the per-query traces
+        summary["batch_stage_latency"] = span_percentiles(batch_trace)
+        print(f"\n{rag_name} stage latency (batch, per span; shared stages ran once for "
+              f"all {len(queries)} queries):\n{format_stage_table(summary['batch_stage_latency'])}")
     output = {
         "rag_name": rag_name,
         "results": results,
-        "summary": summary
+        "summary": summary,
+        "llm_calls": call_metrics()
     }
+    if batch_trace is not None:
+        output["batch_trace"] = batch_trace.to_dict()
     
     results_dir = os.path.join(os.path.dirname(__file__), "results")
     if not os.path.exists(results_dir):
@@ -74,8 +178,8 @@ def run_evaluation(rag_name, query_func):
 
 import importlib.util
 
-def import_query_func(folder_name):
-    """Dynamically imports the query function from a specific RAG folder."""
+def import_backend(folder_name):
+    """Dynamically imports the query module from a specific RAG folder."""
     root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
     file_path = os.path.join(root_dir, folder_name, "query.py")
     
@@ -91,36 +195,94 @@ def import_query_func(folder_name):
         
     spec.loader.exec_module(module)
     sys.path.pop(0)
-    return module.query
+    return module
 
-def compare_all():
-    summary_table = {}
+def import_query_func(folder_name):
+    """Dynamically imports the query function from a specific RAG folder."""
+    return import_backend(folder_name).query
 
-    # 1. OpenAI RAG
-    try:
-        openai_query = import_query_func("openai-rag")
-        summary_table["OpenAI"] = run_evaluation("OpenAI", openai_query)
-    except Exception as e:
-        print(f"Skipping OpenAI: {e}")
+def warm_up(module):
+    """
+    Loads a backend's resident index and creates its model client and the
+    judge's up-front, so the SDK import and client construction are not
+    timed inside the first queries' stages. Returns the index load time.
+    """
+    for llm in (getattr(module, "llm", None), judge):
+        try:
+            if llm is not None:
+                llm.client
+        except Exception as e:
+            # e.g. a missing API key: the queries report it themselves
+            print(f"Could not create the {llm.name} client up-front: {e}")
+    resident_index = getattr(module, "resident_index", None)
+    if resident_index is None:
+        return None
+    resident_index.get()
+    return resident_index.load_time
 
-    # 2. Local RAG
+def evaluate_backend(rag_name, folder_name, batch=False, stream=False, concurrency=None):
+    """
+    Imports one backend and evaluates it. With batch=True, vector backends
+    answer all queries through query_batch(); with stream=True, through
+    query_stream(), recording time-to-first-token and tokens/sec. The
+    backend's semantic answer cache is off, so every query is answered.
+    """
     try:
-        local_query = import_query_func("local-model-rag")
-        summary_table["Local"] = run_evaluation("Local", local_query)
-    except Exception as e:
-        print(f"Skipping Local: {e}")
+        module = import_backend(folder_name)
+    except SystemExit as e:
+        # Backends exit when a dependency is missing; report it as a skip instead
+        raise RuntimeError(f"{folder_name}/query.py exited during import (code {e.code})") from None
+    query_cache = getattr(module, "query_cache", None)
+    if query_cache is not None:
+        # With queries in flight concurrently, whether a near-duplicate question
+        # hits the answer cache would depend on completion order
+        query_cache.disable_answers()
+    query_batch = getattr(module, "query_batch", None) if batch else None
+    return run_evaluation(rag_name, module.query, warm_up(module), query_batch,
+                          module.query_stream if stream else None,
+                          concurrency=concurrency or BACKEND_CONCURRENCY.get(rag_name, 1))
 
-    # 3. PageIndex RAG
-    try:
-        pi_query = import_query_func("pageindex-rag")
-        summary_table["PageIndex"] = run_evaluation("PageIndex", pi_query)
-    except Exception as e:
-        print(f"Skipping PageIndex: {e}")
+def compare_all(batch=False, stream=False, parallel=True, concurrency=None):
+    """
+    Evaluates every backend (see evaluate_backend). With parallel=True each
+    runs in its own worker process, so their `config` modules and model
+    call counters stay isolated and a slow backend does not hold up the
+    others. `concurrency` overrides BACKEND_CONCURRENCY for every backend.
+    The summary lists backends in BACKENDS order either way.
+    """
+    summary_table = {}
+
+    if parallel:
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=len(BACKENDS), mp_context=context) as pool:
+            futures = [pool.submit(evaluate_backend, name, folder, batch, stream, concurrency)
+                       for name, folder in BACKENDS]
+            for (name, _), future in zip(BACKENDS, futures):
+                try:
+                    summary_table[name] = future.result()
+                except Exception as e:
+                    print(f"Skipping {name}: {e}")
+    else:
+        for name, folder in BACKENDS:
+            try:
+                summary_table[name] = evaluate_backend(name, folder, batch, stream, concurrency)
+            except Exception as e:
+                print(f"Skipping {name}: {e}")
 
 
     print("\n--- COMPARISON SUMMARY ---")
     print(json.dumps(summary_table, indent=4))
 
 if __name__ == "__main__":
-    compare_all()
+    parser = argparse.ArgumentParser(description="Evaluate and compare the RAG backends.")
+    parser.add_argument("--batch", action="store_true",
+                        help="Answer queries with each vector backend's query_batch() for higher throughput.")
+    parser.add_argument("--stream", action="store_true",
+                        help="Answer queries with each backend's query_stream() and record TTFT and tokens/sec.")
+    parser.add_argument("--sequential", action="store_true",
+                        help="Evaluate the backends one after another in this process.")
+    parser.add_argument("--concurrency", type=int, default=None,
+                        help="Queries in flight per backend (default: BACKEND_CONCURRENCY; 1 for isolated latencies).")
+    args = parser.parse_args()
+    compare_all(batch=args.batch, stream=args.stream, parallel=not args.sequential, concurrency=args.concurrency)
 
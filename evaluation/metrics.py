@@ -1,10 +1,14 @@
 import os
+import sys
 import time
-from openai import OpenAI
 from dotenv import load_dotenv
 
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from tools.llm_client import get_client
+
 load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Judge calls go through the shared client layer, counted apart from the backends'
+judge = get_client("openai", api_key=os.getenv("OPENAI_API_KEY"), base_url=os.getenv("OPENAI_BASE_URL"), name="judge")
 
 def evaluate_answer(query, context, answer):
     """
@@ -29,12 +33,9 @@ def evaluate_answer(query, context, answer):
     """
     
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "system", "content": "You are a rigorous evaluation judge."},
-                      {"role": "user", "content": prompt}]
-        )
-        content = response.choices[0].message.content
+        content = judge.chat("gpt-4o-mini",
+                             [{"role": "system", "content": "You are a rigorous evaluation judge."},
+                              {"role": "user", "content": prompt}])
         
         # Simple parsing logic
         relevance = 0
@@ -80,11 +81,7 @@ def evaluate_retrieval(query, chunks):
     Format: [True, False, True...]
     """
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": prompt}]
-        )
-        content = response.choices[0].message.content
+        content = judge.chat("gpt-4o-mini", [{"role": "user", "content": prompt}])
         # Simple extraction of bools
         import ast
         try:
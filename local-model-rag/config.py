@@ -3,17 +3,75 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+# Ollama server; None uses OLLAMA_HOST or http://127.0.0.1:11434. Point it at
+# tools/mock_llm_server.py (e.g. http://127.0.0.1:8900) to benchmark offline.
+OLLAMA_HOST = os.getenv("OLLAMA_HOST")
 OLLAMA_MODEL = "llama3.2:latest"
 EMBED_MODEL = "mxbai-embed-large"
 ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 DATA_PATH = os.path.join(ROOT_DIR, "data", "mtsamples.csv")
 INDEX_PATH = os.path.join(os.path.dirname(__file__), "vector_index.faiss")
-METADATA_PATH = os.path.join(os.path.dirname(__file__), "metadata.pkl")
+# Columnar chunk text/metadata store (a directory), opened via mmap at query time
+CHUNK_STORE_PATH = os.path.join(os.path.dirname(__file__), "chunk_store")
+# BM25 inverted index over the chunk text, rebuilt by each ingest
+LEXICAL_INDEX_PATH = os.path.join(os.path.dirname(__file__), "lexical_index")
+MANIFEST_PATH = os.path.join(os.path.dirname(__file__), "ingest_manifest.json")
+# Shared across ingest runs (and backends); entries are keyed by embedding model
+EMBEDDING_CACHE_PATH = os.path.join(ROOT_DIR, "data", "embedding_cache.sqlite")
 
 
 CHUNK_SIZE = 400
 
 CHUNK_OVERLAP = 50
 TOP_K = 5
+# Most prompt tokens the retrieved context may take (see tools/context_builder.py)
+CONTEXT_TOKEN_BUDGET = 2000
+
+# Vector index: "flat" (exact), "ivf_flat", "ivf_pq" or "hnsw".
+# IVF types are trained automatically during ingest.
+INDEX_TYPE = "flat"
+IVF_NLIST = 100       # IVF: number of clusters
+PQ_M = 32             # IVF-PQ: sub-quantizers (must divide the embedding dimension)
+HNSW_M = 32           # HNSW: graph neighbours per node
+# Query-time search parameters (higher = better recall, slower search)
+NPROBE = 8            # IVF: clusters visited per query
+EF_SEARCH = 64        # HNSW: candidate list size
+
+# Retrieval: "vector" (FAISS), "bm25" (lexical, no embedding call) or
+# "hybrid" (both, fused with reciprocal-rank fusion over HYBRID_CANDIDATES each)
+RETRIEVAL_MODE = "vector"
+HYBRID_CANDIDATES = 20
+RRF_K = 60
+
+# Optional diversification: over-fetch MMR_CANDIDATES, drop near-duplicate
+# chunks of the same sample (cosine >= DEDUPE_THRESHOLD, e.g. overlapping
+# neighbours), then pick TOP_K by maximal marginal relevance
+# (MMR_LAMBDA 1.0 = pure relevance, lower = more diverse)
+DIVERSIFY = False
+MMR_CANDIDATES = 20
+MMR_LAMBDA = 0.7
+DEDUPE_THRESHOLD = 0.95
+
+# query_batch(): answers generated concurrently
+QUERY_BATCH_CONCURRENCY = 4
+
+# Query cache: normalized query -> embedding (LRU), and stored answers reused
+# for any query within ANSWER_CACHE_THRESHOLD cosine similarity of a cached
+# one (None disables the answer cache). Answers are dropped when the index changes.
+QUERY_EMBEDDING_CACHE_SIZE = 1024
+ANSWER_CACHE_SIZE = 256
+ANSWER_CACHE_THRESHOLD = 0.95
+
+# Only the first N cleaned rows are ingested, for a standardized comparison.
+# Set to None to stream the full CSV.
+SAMPLE_LIMIT = 500
+# Rows collected before each chunk -> embed -> index -> metadata step
+INGEST_BATCH_SIZE = 200
+
+# Ingest embedding pipeline: chunks per ollama.embed call, parallel requests,
+# and attempts per embed request (transient failures are retried)
+EMBED_BATCH_SIZE = 16
+EMBED_WORKERS = 4
+EMBED_MAX_RETRIES = 3
 
 
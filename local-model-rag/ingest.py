@@ -5,20 +5,29 @@ This script runs a fully private ingestion pipeline using Ollama. It manages
 local embedding generation and handles errors like missing models or 
 context length overflows.
 """
-import pandas as pd
-import numpy as np
-
-import faiss
-import pickle
 import os
 import sys
+import time
+import argparse
 import ollama
-from config import (DATA_PATH, INDEX_PATH, METADATA_PATH, 
-                   EMBED_MODEL, CHUNK_SIZE, CHUNK_OVERLAP)
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from config import (DATA_PATH, INDEX_PATH, CHUNK_STORE_PATH, MANIFEST_PATH, EMBEDDING_CACHE_PATH,
+                   LEXICAL_INDEX_PATH,
+                   EMBED_MODEL, OLLAMA_HOST, CHUNK_SIZE, CHUNK_OVERLAP, SAMPLE_LIMIT, INGEST_BATCH_SIZE,
+                   INDEX_TYPE, IVF_NLIST, PQ_M, HNSW_M,
+                   EMBED_BATCH_SIZE, EMBED_WORKERS, EMBED_MAX_RETRIES)
 
 # Add parent dir to path to import tools
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
-from tools.data_processor import load_and_clean_data, normalize_data, get_token_chunks
+from tools.ingest_pipeline import run_ingest
+from tools.llm_client import get_client
+
+# /api/embed returns L2-normalized vectors, unlike the older /api/embeddings,
+# so cached vectors and the index are keyed by model and endpoint
+EMBED_CACHE_KEY = f"{EMBED_MODEL}@api/embed"
+
+# Shared pooled client; it retries transient failures with backoff and jitter
+llm = get_client("ollama", base_url=OLLAMA_HOST, max_concurrency=EMBED_WORKERS, max_retries=EMBED_MAX_RETRIES - 1)
 
 def ensure_model_available(model_name):
     """
@@ -26,83 +35,121 @@ def ensure_model_available(model_name):
     """
     print(f"Checking if model '{model_name}' is available...")
     try:
-        ollama.show(model_name)
+        llm.client.show(model_name)
     except ollama.ResponseError:
         print(f"Model '{model_name}' not found. Pulling it now...")
-        ollama.pull(model_name)
+        llm.client.pull(model_name)
         print(f"Model '{model_name}' pulled successfully.")
 
 
-def ingest():
+def embed_single(text):
+    """
+    Embeds one chunk (transient failures are retried by the client).
+    Returns None if it cannot be embedded.
+    """
+    try:
+        return llm.embed(EMBED_MODEL, [text], options={"num_ctx": 1024})[0]
+    except Exception as e:
+        print(f"Warning: Embedding failed: {e}")
+    return None
+
+
+def embed_batch(texts):
+    """
+    Embeds a batch through Ollama's multi-input embed API. If the batch call
+    fails, each chunk is retried on its own, so one bad chunk (e.g. a context
+    overflow) only costs itself. Returns a list aligned with `texts`, with
+    None for chunks that could not be embedded.
+    """
+    try:
+        # We explicitly set a larger context locally just in case, 
+        # though model architectural limits apply.
+        return llm.embed(EMBED_MODEL, texts, options={"num_ctx": 1024})
+    except Exception as e:
+        print(f"Warning: Batch of {len(texts)} chunks failed ({e}). Retrying chunk by chunk...")
+    return [embed_single(text) for text in texts]
+
+
+def embed_texts(texts, on_batch=None):
+    """
+    Embeds `texts` in batches of EMBED_BATCH_SIZE on a pool of EMBED_WORKERS
+    threads. At most 2 * EMBED_WORKERS batches are queued at a time, so a slow
+    Ollama server applies backpressure instead of piling up requests.
+    `on_batch(batch_texts, vectors)` is called as each batch completes.
+    Returns a list aligned with `texts`, with None for failed chunks.
+    """
+    results = [None] * len(texts)
+    batches = iter(range(0, len(texts), EMBED_BATCH_SIZE))
+    max_in_flight = EMBED_WORKERS * 2
+    processed = 0
+    start_time = time.time()
+
+    with ThreadPoolExecutor(max_workers=EMBED_WORKERS) as pool:
+        in_flight = {}
+        while True:
+            while len(in_flight) < max_in_flight:
+                start = next(batches, None)
+                if start is None:
+                    break
+                batch = texts[start:start + EMBED_BATCH_SIZE]
+                in_flight[pool.submit(embed_batch, batch)] = start
+            if not in_flight:
+                break
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                start = in_flight.pop(future)
+                vectors = future.result()
+                results[start:start + len(vectors)] = vectors
+                if on_batch:
+                    on_batch(texts[start:start + len(vectors)], vectors)
+                processed += len(vectors)
+
+            elapsed = time.time() - start_time
+            print(f"Processed {processed}/{len(texts)} chunks ({processed / max(elapsed, 1e-9):.1f} chunks/sec)...")
+
+    elapsed = time.time() - start_time
+    if texts:
+        print(f"Embedded {len(texts)} chunks in {elapsed:.1f}s ({len(texts) / max(elapsed, 1e-9):.1f} chunks/sec).")
+    return results
+
+
+def ingest(incremental=False):
     print(f"Loading data from {DATA_PATH}...")
-    df = load_and_clean_data(DATA_PATH)
-    df = normalize_data(df)
 
     # Ensure models are available before starting
     ensure_model_available(EMBED_MODEL)
-    
-    # Limit to 500 for standardized comparison
-    if len(df) > 500:
-        print("Limiting to 500 samples for standardized comparison.")
-        df = df.head(500)
 
+    # Rows stream from the CSV through chunking, embedding and indexing;
+    # chunks that fail to embed are skipped along with their metadata.
+    indexed = run_ingest(
+        embed_texts,
+        data_path=DATA_PATH,
+        index_path=INDEX_PATH,
+        chunk_store_path=CHUNK_STORE_PATH,
+        manifest_path=MANIFEST_PATH,
+        cache_path=EMBEDDING_CACHE_PATH,
+        embed_model=EMBED_CACHE_KEY,
+        chunk_model="gpt-4o-mini",  # tiktoken model used for chunk boundaries
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP,
+        sample_limit=SAMPLE_LIMIT,
+        batch_size=INGEST_BATCH_SIZE,
+        index_params={'index_type': INDEX_TYPE, 'nlist': IVF_NLIST, 'pq_m': PQ_M, 'hnsw_m': HNSW_M},
+        incremental=incremental,
+        lexical_index_path=LEXICAL_INDEX_PATH,
+    )
 
-    
-    all_chunks = []
-    print("Chunking transcriptions (tokens)...")
-    for idx, row in df.iterrows():
-        chunks = get_token_chunks(row['transcription'], chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP)
-        for chunk in chunks:
-
-            all_chunks.append({
-                'text': chunk,
-                'medical_specialty': row['medical_specialty'],
-                'sample_name': row['sample_name']
-            })
-    
-    print(f"Total chunks: {len(all_chunks)}")
-    
-    print(f"Generating embeddings using {EMBED_MODEL}...")
-    embeddings = []
-    successful_chunks = []
-    for i, chunk in enumerate(all_chunks):
-        try:
-            # We explicitly set a larger context locally just in case, 
-            # though model architectural limits apply.
-            response = ollama.embeddings(
-                model=EMBED_MODEL, 
-                prompt=chunk['text'],
-                options={"num_ctx": 1024}
-            )
-            embeddings.append(response['embedding'])
-            successful_chunks.append(chunk)
-            if (i+1) % 10 == 0:
-                print(f"Processed {i+1}/{len(all_chunks)} chunks...")
-        except Exception as e:
-            print(f"Warning: Skipping chunk {i} due to error: {e}")
-            continue
-    
-    if not embeddings:
+    if not indexed:
         print("Error: No embeddings were generated. Check your Ollama logs.")
         return
-
-    embeddings = np.array(embeddings).astype('float32')
-    
-    print(f"Creating FAISS index...")
-    dimension = embeddings.shape[1]
-    index = faiss.IndexFlatL2(dimension)
-    index.add(embeddings)
-    
-    print(f"Saving index to {INDEX_PATH}...")
-    faiss.write_index(index, INDEX_PATH)
-    
-    print(f"Saving metadata to {METADATA_PATH}...")
-    with open(METADATA_PATH, 'wb') as f:
-        pickle.dump(successful_chunks, f)
-
     
     print("Local Ingestion complete!")
 
 if __name__ == "__main__":
-    ingest()
+    parser = argparse.ArgumentParser(description="Build the local Ollama RAG FAISS index.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only embed rows that are new or changed since the last ingest.")
+    args = parser.parse_args()
+    ingest(incremental=args.incremental)
 
@@ -5,99 +5,147 @@ This script handles the process of loading medical transcriptions, chunking them
 into token-based segments, generating embeddings using OpenAI's API, 
 and storing them in a FAISS vector index for fast retrieval.
 """
-import pandas as pd
-import numpy as np
-import faiss
-import pickle
 import os
 import sys
-from openai import OpenAI
-from config import (DATA_PATH, INDEX_PATH, METADATA_PATH, 
-                   EMBEDDING_MODEL, CHAT_MODEL, CHUNK_SIZE, CHUNK_OVERLAP, OPENAI_API_KEY)
+import time
+import asyncio
+import argparse
+import tiktoken
+from config import (DATA_PATH, INDEX_PATH, CHUNK_STORE_PATH, MANIFEST_PATH, EMBEDDING_CACHE_PATH,
+                   LEXICAL_INDEX_PATH,
+                   EMBEDDING_MODEL, CHAT_MODEL, CHUNK_SIZE, CHUNK_OVERLAP, OPENAI_API_KEY, OPENAI_BASE_URL,
+                   SAMPLE_LIMIT, INGEST_BATCH_SIZE,
+                   INDEX_TYPE, IVF_NLIST, PQ_M, HNSW_M,
+                   EMBEDDING_BATCH_SIZE, EMBEDDING_CONCURRENCY, EMBEDDING_TPM, EMBEDDING_RPM,
+                   EMBEDDING_MAX_RETRIES)
 
 # Add parent dir to path to import tools
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
-from tools.data_processor import load_and_clean_data, normalize_data, get_token_chunks
+from tools.ingest_pipeline import run_ingest
+from tools.rate_limiter import AsyncTokenBucket, retry_after_seconds, backoff_delay
+from tools.llm_client import get_client, is_retryable
 
-client = OpenAI(api_key=OPENAI_API_KEY)
 
+async def embed_batch_async(llm, batch, batch_tokens, token_bucket, request_bucket):
+    """
+    Embeds one batch once the token and request buckets allow it. Retries use
+    the server's retry-after hint when present, else exponential backoff with
+    jitter; each attempt waits for the buckets again.
+    """
+    for attempt in range(EMBEDDING_MAX_RETRIES):
+        await token_bucket.acquire(batch_tokens)
+        await request_bucket.acquire(1)
+        try:
+            return await llm.aembed(EMBEDDING_MODEL, batch)
+        except Exception as e:
+            if attempt == EMBEDDING_MAX_RETRIES - 1 or not is_retryable(e):
+                raise
+            delay = retry_after_seconds(e) or backoff_delay(attempt)
+            print(f"{type(e).__name__} on batch of {len(batch)}. Retrying in {delay:.1f}s...")
+            await asyncio.sleep(delay)
+
+
+class EmbeddingDispatcher:
+    """
+    Embeds texts with up to EMBEDDING_CONCURRENCY batches in flight.
+    Dispatch is paced by token buckets sized from the configured TPM/RPM
+    quota and each batch's actual token count, so throughput runs close to
+    the quota ceiling without tripping it. The event loop, client and
+    buckets live for the whole ingest, so the quota is tracked across the
+    streamed batches.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.encoding = tiktoken.encoding_for_model(EMBEDDING_MODEL)
+        # Client-level retries would bypass the buckets; retry here instead
+        self.llm = get_client("openai", api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL, name="ingest",
+                              max_concurrency=EMBEDDING_CONCURRENCY, max_retries=0)
+        self.token_bucket = AsyncTokenBucket(EMBEDDING_TPM)
+        self.request_bucket = AsyncTokenBucket(EMBEDDING_RPM)
+        self.embedded = 0
+        self.elapsed = 0.0
+
+    async def _embed(self, texts, on_batch):
+        results = [None] * len(texts)
+        processed = 0
 
-def ingest():
+        async def run(start):
+            nonlocal processed
+            batch = texts[start:start + EMBEDDING_BATCH_SIZE]
+            batch_tokens = sum(len(t) for t in self.encoding.encode_batch(batch))
+            vectors = await embed_batch_async(self.llm, batch, batch_tokens,
+                                              self.token_bucket, self.request_bucket)
+            results[start:start + len(vectors)] = vectors
+            if on_batch:
+                on_batch(batch, vectors)
+            processed += len(vectors)
+            print(f"Processed {processed}/{len(texts)} chunks...")
+
+        await asyncio.gather(*(run(start) for start in range(0, len(texts), EMBEDDING_BATCH_SIZE)))
+        return results
+
+    def embed(self, texts, on_batch=None):
+        """Returns embeddings aligned with `texts`; calls on_batch(texts, vectors) per batch."""
+        start_time = time.time()
+        results = self.loop.run_until_complete(self._embed(texts, on_batch))
+        self.elapsed += time.time() - start_time
+        self.embedded += len(texts)
+        return results
+
+    def close(self):
+        self.loop.run_until_complete(self.llm.aclose())
+        self.loop.close()
+        if self.embedded:
+            print(f"Embedded {self.embedded} chunks in {self.elapsed:.1f}s "
+                  f"({self.embedded / max(self.elapsed, 1e-9):.1f} chunks/sec).")
+
+
+def ingest(incremental=False):
     """
-    Orchestrates the ingestion pipeline:
-    1. Loads and cleans raw CSV data.
+    Orchestrates the ingestion pipeline, streaming rows end to end:
+    1. Reads and cleans the raw CSV a chunk of rows at a time.
     2. Chunks transcriptions into 400-token segments.
-    3. Converts text chunks into vector embeddings via OpenAI.
-    4. Saves vectors into a FAISS index and stores text metadata in a PKL file.
+    3. Converts text chunks into vector embeddings via OpenAI, reusing any
+       embeddings already in the on-disk cache.
+    4. Adds each batch of vectors to the FAISS index and appends its text
+       and metadata to the columnar chunk store as it goes.
+
+    With incremental=True, only rows that are new or changed since the last
+    run (per the ingest manifest) are chunked and embedded; their stale
+    vectors and metadata are replaced in place.
     """
     print(f"Loading data from {DATA_PATH}...")
-    df = load_and_clean_data(DATA_PATH)
-    df = normalize_data(df)
-    
-    # Limit to 500 for standardized comparison
-    print("Limiting to 500 samples for standardized comparison.")
-    df = df.head(500)
-    
-    all_chunks = []
-    print("Chunking transcriptions (tokens)...")
-    for idx, row in df.iterrows():
-        chunks = get_token_chunks(row['transcription'], model=CHAT_MODEL, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP)
-        for chunk in chunks:
-
-            all_chunks.append({
-                'text': chunk,
-                'medical_specialty': row['medical_specialty'],
-                'sample_name': row['sample_name']
-            })
-    
-    print(f"Total chunks: {len(all_chunks)}")
-    
-    print("Generating embeddings...")
-    texts = [c['text'] for c in all_chunks]
-    
-    # Process in batches to avoid rate limits/large payloads
-    batch_size = 50 # Reduced from 100 for safer limits
-    embeddings = []
-    import time
-    
-    for i in range(0, len(texts), batch_size):
-        batch = texts[i:i+batch_size]
-        
-        # Simple retry logic for Rate Limits
-        max_retries = 3
-        for attempt in range(max_retries):
-            try:
-                response = client.embeddings.create(input=batch, model=EMBEDDING_MODEL)
-                batch_embeddings = [record.embedding for record in response.data]
-                embeddings.extend(batch_embeddings)
-                break
-            except Exception as e:
-                if "rate_limit_exceeded" in str(e).lower() and attempt < max_retries - 1:
-                    print(f"Rate limit hit at batch {i}. Sleeping for 5s...")
-                    time.sleep(5)
-                else:
-                    raise e
-                    
-        print(f"Processed {min(i+batch_size, len(texts))}/{len(texts)} chunks...")
-        time.sleep(0.5) # Short pause between batches to respect TPM
-
-
-    embeddings = np.array(embeddings).astype('float32')
-    
-    print(f"Creating FAISS index...")
-    dimension = embeddings.shape[1]
-    index = faiss.IndexFlatL2(dimension)
-    index.add(embeddings)
-    
-    print(f"Saving index to {INDEX_PATH}...")
-    faiss.write_index(index, INDEX_PATH)
-    
-    print(f"Saving metadata to {METADATA_PATH}...")
-    with open(METADATA_PATH, 'wb') as f:
-        pickle.dump(all_chunks, f)
-    
+    dispatcher = EmbeddingDispatcher()
+    try:
+        indexed = run_ingest(
+            dispatcher.embed,
+            data_path=DATA_PATH,
+            index_path=INDEX_PATH,
+            chunk_store_path=CHUNK_STORE_PATH,
+            manifest_path=MANIFEST_PATH,
+            cache_path=EMBEDDING_CACHE_PATH,
+            embed_model=EMBEDDING_MODEL,
+            chunk_model=CHAT_MODEL,
+            chunk_size=CHUNK_SIZE,
+            chunk_overlap=CHUNK_OVERLAP,
+            sample_limit=SAMPLE_LIMIT,
+            batch_size=INGEST_BATCH_SIZE,
+            index_params={'index_type': INDEX_TYPE, 'nlist': IVF_NLIST, 'pq_m': PQ_M, 'hnsw_m': HNSW_M},
+            incremental=incremental,
+            lexical_index_path=LEXICAL_INDEX_PATH,
+        )
+    finally:
+        dispatcher.close()
+
+    if not indexed:
+        print("Error: No chunks to index.")
+        return
     print("Ingestion complete!")
 
 if __name__ == "__main__":
-    ingest()
-
+    parser = argparse.ArgumentParser(description="Build the OpenAI RAG FAISS index.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only embed rows that are new or changed since the last ingest.")
+    args = parser.parse_args()
+    ingest(incremental=args.incremental)
@@ -5,35 +5,128 @@ This script manages the retrieval and generation loop. It searches the FAISS ind
 for relevant medical context and uses GPT-4o-mini to generate an answer based 
 only on that retrieved information.
 """
-import faiss
-import pickle
 import numpy as np
 import os
 import sys
-from openai import OpenAI
-from config import (INDEX_PATH, METADATA_PATH, EMBEDDING_MODEL, 
-                   CHAT_MODEL, TOP_K, OPENAI_API_KEY)
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from config import (INDEX_PATH, CHUNK_STORE_PATH, EMBEDDING_MODEL, 
+                   CHAT_MODEL, TOP_K, OPENAI_API_KEY, OPENAI_BASE_URL,
+                   NPROBE, EF_SEARCH, QUERY_BATCH_CONCURRENCY, LEXICAL_INDEX_PATH,
+                   RETRIEVAL_MODE, HYBRID_CANDIDATES, RRF_K,
+                   DIVERSIFY, MMR_CANDIDATES, MMR_LAMBDA, DEDUPE_THRESHOLD, CONTEXT_TOKEN_BUDGET,
+                   QUERY_EMBEDDING_CACHE_SIZE, ANSWER_CACHE_SIZE, ANSWER_CACHE_THRESHOLD)
 
 # Add parent dir to path to import tools
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 from tools.data_processor import normalize_query
+from tools.query_service import ResidentIndex
+from tools.chunk_store import ChunkStore, store_exists
+from tools.faiss_index import read_index, configure_search
+from tools.query_cache import QueryCache, index_version
+from tools.streaming import StreamingAnswer, format_metrics
+from tools.retrieval import retrieve
+from tools.lexical_index import LexicalIndex, lexical_index_exists
+from tools.context_builder import build_context
+from tools.llm_client import get_client
+from tools.tracing import span, in_current_trace
 
-client = OpenAI(api_key=OPENAI_API_KEY)
+# Shared pooled client: retries, concurrency limit and call metrics
+llm = get_client("openai", api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL)
 
 def load_index():
     """
     Loads the pre-built FAISS index and the associated text metadata.
     """
 
-    if not os.path.exists(INDEX_PATH) or not os.path.exists(METADATA_PATH):
+    if not os.path.exists(INDEX_PATH) or not store_exists(CHUNK_STORE_PATH):
         raise FileNotFoundError("Index or Metadata not found. Run ingest.py first.")
     
-    index = faiss.read_index(INDEX_PATH)
-    with open(METADATA_PATH, 'rb') as f:
-        metadata = pickle.load(f)
-    return index, metadata
+    # Both are memory-mapped: only the rows a query touches are read in
+    index = configure_search(read_index(INDEX_PATH), nprobe=NPROBE, ef_search=EF_SEARCH)
+    metadata = ChunkStore(CHUNK_STORE_PATH)
+    # BM25 index for "bm25"/"hybrid" retrieval; missing if built before it existed
+    lexical = LexicalIndex(LEXICAL_INDEX_PATH) if lexical_index_exists(LEXICAL_INDEX_PATH) else None
+    return index, metadata, lexical
 
-def query(question):
+# Loaded on the first query and kept in memory for every query after it.
+resident_index = ResidentIndex(load_index)
+
+# Repeated and near-identical questions skip embedding and/or generation
+query_cache = QueryCache(lambda: index_version(INDEX_PATH, CHUNK_STORE_PATH, LEXICAL_INDEX_PATH),
+                         threshold=ANSWER_CACHE_THRESHOLD,
+                         max_embeddings=QUERY_EMBEDDING_CACHE_SIZE,
+                         max_answers=ANSWER_CACHE_SIZE)
+
+# Settings for the optional MMR / near-duplicate stage (see tools/retrieval.py)
+DIVERSITY = {'candidates': MMR_CANDIDATES, 'mmr_lambda': MMR_LAMBDA,
+             'dedupe_threshold': DEDUPE_THRESHOLD} if DIVERSIFY else None
+
+# Most inputs the embeddings endpoint accepts in one request
+MAX_EMBEDDING_INPUTS = 2048
+
+SYSTEM_PROMPT = """You are a medical assistant. Use the following pieces of retrieved context 
+    from medical transcriptions to answer the user's question. If you don't know the answer 
+    based on the context, say that you don't know. Keep the answer professional and concise."""
+
+def embed_queries(questions):
+    """Embeds normalized questions, one request per MAX_EMBEDDING_INPUTS."""
+    embeddings = []
+    for i in range(0, len(questions), MAX_EMBEDDING_INPUTS):
+        embeddings.extend(llm.embed(EMBEDDING_MODEL, questions[i:i + MAX_EMBEDDING_INPUTS]))
+    return np.array(embeddings).astype('float32')
+
+def search(questions, query_embeddings, filters=None, mode=RETRIEVAL_MODE):
+    """
+    Retrieves the TOP_K chunks for each question with one search over all
+    of them. `mode` is "vector", "bm25" (no embeddings needed) or "hybrid"
+    (see tools/retrieval.py). With `filters` (e.g. {'medical_specialty':
+    'Urology'}), only the matching partition of the chunk store is searched.
+    With DIVERSIFY on, candidates are de-duplicated and re-ranked by MMR.
+    """
+    # Only the first query pays for loading; later ones record ~0
+    with span("index_load"):
+        index, metadata, lexical = resident_index.get()
+    with span("search"):
+        ranked = retrieve(index, metadata, lexical, questions, query_embeddings, TOP_K,
+                          filters=filters, mode=mode, candidates=HYBRID_CANDIDATES, rrf_k=RRF_K,
+                          diversity=DIVERSITY)
+        return [metadata.get_many(ids) for ids in ranked]
+
+def embed_for_mode(questions, mode):
+    """Query embeddings (via the query cache), or None when `mode` doesn't use them."""
+    if mode == "bm25":
+        return None
+    with span("embed"):
+        return query_cache.embed(questions, embed_queries)
+
+def uses_answer_cache(filters, mode):
+    # Cached answers come from unfiltered, embedding-keyed retrieval in the configured mode
+    return not filters and mode == RETRIEVAL_MODE and mode != "bm25"
+
+def build_messages(question, retrieved_chunks):
+    with span("context_build"):
+        context, info = build_context(retrieved_chunks, CONTEXT_TOKEN_BUDGET, model=CHAT_MODEL)
+    print(f"Context: {info['tokens']}/{info['budget']} tokens, {info['chunks']} chunks in {info['passages']} passages")
+    user_prompt = f"Context:\n{context}\n\nQuestion: {question}"
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt}
+    ]
+
+def generate_answer(question, retrieved_chunks):
+    messages = build_messages(question, retrieved_chunks)
+    with span("generate"):
+        return llm.chat(CHAT_MODEL, messages)
+
+def stream_answer(question, retrieved_chunks):
+    """Yields the answer text token by token as the completion streams in."""
+    messages = build_messages(question, retrieved_chunks)
+    with span("generate"):
+        yield from llm.chat_stream(CHAT_MODEL, messages)
+
+def query(question, filters=None, mode=RETRIEVAL_MODE):
     """
     Performs the full RAG cycle for a user question:
     1. Normalizes the question.
@@ -43,45 +136,110 @@ def query(question):
     5. Returns the LLM-generated answer and the source chunks.
     """
     # Step 1 of RAG Query Flow: Preprocessing
-    question = normalize_query(question)
+    with span("normalize"):
+        question = normalize_query(question)
     print(f"Normalized Query: {question}")
     
-    index, metadata = load_index()
-
-    
     # 1. Embed the query
-    response = client.embeddings.create(input=[question], model=EMBEDDING_MODEL)
-    query_embedding = np.array([response.data[0].embedding]).astype('float32')
+    query_embedding = embed_for_mode([question], mode)
     
-    # 2. Search FAISS
-    distances, indices = index.search(query_embedding, TOP_K)
+    use_cache = uses_answer_cache(filters, mode)
+    cached = query_cache.lookup_answer(query_embedding[0]) if use_cache else None
+    if cached is not None:
+        print("\nAnswer (cached):")
+        print(cached[0])
+        return cached
     
-    retrieved_chunks = [metadata[i] for i in indices[0]]
-    context = "\n\n---\n\n".join([c['text'] for c in retrieved_chunks])
+    # 2. Search FAISS (and/or the BM25 index)
+    retrieved_chunks = search([question], query_embedding, filters, mode)[0]
     
     # 3. Generate Answer
-    system_prompt = """You are a medical assistant. Use the following pieces of retrieved context 
-    from medical transcriptions to answer the user's question. If you don't know the answer 
-    based on the context, say that you don't know. Keep the answer professional and concise."""
-    
-    user_prompt = f"Context:\n{context}\n\nQuestion: {question}"
-    
-    completion = client.chat.completions.create(
-        model=CHAT_MODEL,
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ]
-    )
-    
-    answer = completion.choices[0].message.content
+    answer = generate_answer(question, retrieved_chunks)
     print("\nAnswer:")
     print(answer)
-    return answer, [c['text'] for c in retrieved_chunks]
+    result = (answer, [c['text'] for c in retrieved_chunks])
+    if use_cache:
+        query_cache.store_answer(query_embedding[0], result)
+    return result
 
+def query_batch(questions, max_workers=QUERY_BATCH_CONCURRENCY, filters=None, mode=RETRIEVAL_MODE):
+    """
+    Answers many questions at once: a single embeddings request, a single
+    FAISS search over all query vectors, then up to `max_workers` chat
+    completions in flight. Returns a list of (answer, chunks) in input
+    order, the same as calling query() on each question. Questions the
+    query cache can answer skip search and generation. `filters` and
+    `mode` apply to every question.
+    """
+    if not questions:
+        return []
+    start_time = time.time()
+    with span("normalize"):
+        questions = [normalize_query(q) for q in questions]
+    query_embeddings = embed_for_mode(questions, mode)
+    use_cache = uses_answer_cache(filters, mode)
+    results = [query_cache.lookup_answer(e) for e in query_embeddings] if use_cache else [None] * len(questions)
+    
+    todo = [i for i, result in enumerate(results) if result is None]
+    if todo:
+        retrieved = search([questions[i] for i in todo],
+                           query_embeddings[todo] if query_embeddings is not None else None, filters, mode)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            answers = list(executor.map(in_current_trace(generate_answer), [questions[i] for i in todo], retrieved))
+        for i, answer, chunks in zip(todo, answers, retrieved):
+            results[i] = (answer, [c['text'] for c in chunks])
+            if use_cache:
+                query_cache.store_answer(query_embeddings[i], results[i])
+    
+    print(f"Answered {len(questions)} questions ({len(questions) - len(todo)} from cache) in {time.time() - start_time:.2f}s")
+    return results
+
+def query_stream(question, filters=None, mode=RETRIEVAL_MODE):
+    """
+    Streaming variant of query(). Retrieval runs before it returns; the
+    returned StreamingAnswer then yields answer tokens as the model
+    produces them and records time-to-first-token, tokens/sec and total
+    latency in its `metrics`.
+    """
+    start_time = time.perf_counter()
+    with span("normalize"):
+        question = normalize_query(question)
+    print(f"Normalized Query: {question}")
+    
+    query_embedding = embed_for_mode([question], mode)
+    use_cache = uses_answer_cache(filters, mode)
+    cached = query_cache.lookup_answer(query_embedding[0]) if use_cache else None
+    if cached is not None:
+        answer, chunks = cached
+        return StreamingAnswer(iter([answer]), chunks, start_time)
+    
+    retrieved_chunks = search([question], query_embedding, filters, mode)[0]
+    
+    def remember(answer, chunks):
+        query_cache.store_answer(query_embedding[0], (answer, chunks))
+    
+    return StreamingAnswer(stream_answer(question, retrieved_chunks),
+                           [c['text'] for c in retrieved_chunks], start_time,
+                           on_complete=remember if use_cache else None)
 
 
 if __name__ == "__main__":
-    query("What are the symptoms and diagnosis for the patient in the records?")
+    parser = argparse.ArgumentParser(description="Ask the OpenAI RAG a question.")
+    parser.add_argument("question", nargs="?", default="What are the symptoms and diagnosis for the patient in the records?")
+    parser.add_argument("--stream", action="store_true", help="Print the answer as it is generated.")
+    parser.add_argument("--specialty", action="append", help="Only retrieve chunks of this medical specialty (repeatable).")
+    parser.add_argument("--sample-name", action="append", help="Only retrieve chunks of this sample (repeatable).")
+    parser.add_argument("--mode", choices=["vector", "bm25", "hybrid"], default=RETRIEVAL_MODE,
+                        help="Retrieval mode (default: RETRIEVAL_MODE in config.py).")
+    args = parser.parse_args()
+    filters = {field: values for field, values in (("medical_specialty", args.specialty),
+                                                   ("sample_name", args.sample_name)) if values}
+    if args.stream:
+        streamed = query_stream(args.question, filters, args.mode)
+        streamed.consume(echo=True)
+        print(format_metrics(streamed.metrics))
+    else:
+        query(args.question, filters, args.mode)
+
 
 
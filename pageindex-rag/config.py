@@ -6,7 +6,44 @@ load_dotenv()
 ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 DATA_PATH = os.path.join(ROOT_DIR, "data", "mtsamples.csv")
 DOCS_DIR = os.path.join(os.path.dirname(__file__), "docs")
+# Directory: a manifest of doc names/summaries plus doc shards read on demand
 INDEX_PATH = os.path.join(os.path.dirname(__file__), "page_index_store")
 MODEL = "gpt-4o" 
+# API base URL; None uses api.openai.com. Point it at tools/mock_llm_server.py
+# (e.g. http://127.0.0.1:8900/v1) to benchmark offline.
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")
 
+# Indexing: every doc in DOCS_DIR is summarized on one event loop, with at most
+# INDEX_CONCURRENCY LLM requests in flight across all docs. INDEX_DOC_LIMIT
+# (None = all) caps the number of docs for quick trial runs.
+INDEX_CONCURRENCY = 16
+INDEX_DOC_LIMIT = None
+# Markdown is parsed across PARSE_WORKERS processes (None = one per CPU)
+# before any LLM work starts.
+PARSE_WORKERS = None
 
+# Node summaries are cached on disk by (model, text hash), and each finished
+# doc's tree is checkpointed, so an interrupted ingest resumes and a rerun over
+# unchanged markdown makes no LLM calls.
+SUMMARY_CACHE_PATH = os.path.join(ROOT_DIR, "data", "summary_cache.sqlite")
+CHECKPOINT_DIR = os.path.join(os.path.dirname(__file__), "index_checkpoints")
+
+# Doc selection: a BM25 index over doc names, node titles and summaries (built
+# at ingest) shortlists SHORTLIST_SIZE candidate docs per query; only those
+# are listed in the LLM selection prompt.
+SHORTLIST_INDEX_PATH = os.path.join(os.path.dirname(__file__), "shortlist_index")
+SHORTLIST_SIZE = 20
+
+# Token budget for the node texts packed into the answer prompt
+CONTEXT_TOKEN_BUDGET = 2500
+
+
+# Used only to embed queries for the query cache
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+# Query cache: normalized query -> embedding (LRU), and stored answers reused
+# for any query within ANSWER_CACHE_THRESHOLD cosine similarity of a cached
+# one (None disables the answer cache). Answers are dropped when the index changes.
+QUERY_EMBEDDING_CACHE_SIZE = 1024
+ANSWER_CACHE_SIZE = 256
+ANSWER_CACHE_THRESHOLD = 0.95
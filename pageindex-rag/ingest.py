@@ -4,7 +4,11 @@ import sys
 # Add the current directory to sys.path to find the local 'pageindex' shim
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from config import DOCS_DIR, INDEX_PATH
+# Add parent dir to path to import tools
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from config import (DOCS_DIR, INDEX_PATH, MODEL, INDEX_CONCURRENCY, INDEX_DOC_LIMIT,
+                    SUMMARY_CACHE_PATH, CHECKPOINT_DIR, SHORTLIST_INDEX_PATH, PARSE_WORKERS)
 
 try:
     from pageindex import PageIndex
@@ -25,10 +29,15 @@ def ingest():
     pi = PageIndex()
     
     # Build the tree structure index
-    pi.index(DOCS_DIR)
+    pi.index(DOCS_DIR, model=MODEL, concurrency=INDEX_CONCURRENCY, limit=INDEX_DOC_LIMIT,
+             summary_cache_path=SUMMARY_CACHE_PATH, checkpoint_dir=CHECKPOINT_DIR,
+             parse_workers=PARSE_WORKERS)
     
     # Save the index to disk
     pi.save(INDEX_PATH)
+
+    # Shortlist index for document selection at query time
+    pi.build_shortlist(SHORTLIST_INDEX_PATH)
     
     print(f"PageIndex indexing complete! Index saved to {INDEX_PATH}")
 
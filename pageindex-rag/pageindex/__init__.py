@@ -1,56 +1,208 @@
 from .page_index import *
-from .page_index_md import md_to_tree
+from .page_index_md import md_to_tree, parse_markdown_batch
+from .summary_cache import SummaryCache, text_hash
+from .store import ShardedDocs, doc_entry, store_exists, write_store
 import json
 import os
 import asyncio
+import time
+
+from tools.tracing import span
 
 class PageIndex:
     def __init__(self):
         self.tree = {"docs": []}
+        self.shortlist = None
+
+    def index(self, input_path, model="gpt-4o", concurrency=16, limit=None,
+              summary_cache_path=None, checkpoint_dir=None, parse_workers=None):
+        """
+        Builds a tree for every .md file in `input_path` (the first `limit`
+        if given). All docs are processed on one event loop sharing one
+        pooled client, with at most `concurrency` LLM requests in flight.
 
-    def index(self, input_path, model="gpt-4o"):
+        With `summary_cache_path`, node summaries are cached on disk by
+        (model, text hash). With `checkpoint_dir`, each finished doc's tree
+        is saved as it completes and reused while the markdown is unchanged,
+        so an interrupted run resumes where it stopped.
+
+        Markdown is parsed up front, across `parse_workers` processes (None =
+        one per CPU), before any LLM work starts.
+        """
         print(f"Indexing documents in {input_path}...")
         if os.path.isdir(input_path):
             files = [f for f in sorted(os.listdir(input_path)) if f.endswith('.md')]
-            # To avoid hitting rate limits or timeouts, we could process in batches
-            # For this task, we'll process the first 20 docs as a representative sample
-            for file in files[:5]:
-                if file == ".gitkeep": continue
-                
-                fpath = os.path.join(input_path, file)
-                print(f"  Analysing {file}...")
-                doc_tree = asyncio.run(md_to_tree(
-                    md_path=fpath,
-                    if_add_node_summary='yes',
-                    model=model
-                ))
-                self.tree['docs'].append(doc_tree)
+            if limit is not None:
+                files = files[:limit]
+            paths = [os.path.join(input_path, f) for f in files]
+            cache = SummaryCache(summary_cache_path) if summary_cache_path else None
+            try:
+                self.tree['docs'].extend(asyncio.run(self._index_all(paths, model, concurrency, cache, checkpoint_dir, parse_workers)))
+            finally:
+                if cache is not None:
+                    cache.report()
+                    cache.close()
         return self
 
+    @staticmethod
+    def _checkpoint_path(checkpoint_dir, md_path):
+        return os.path.join(checkpoint_dir, os.path.basename(md_path) + ".json")
+
+    @staticmethod
+    def _load_checkpoint(path, source_hash, model):
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                checkpoint = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if checkpoint.get('source_hash') != source_hash or checkpoint.get('model') != model:
+            return None
+        return checkpoint['tree']
+
+    @staticmethod
+    def _save_checkpoint(path, source_hash, model, doc_tree):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'source_hash': source_hash, 'model': model, 'tree': doc_tree}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    async def _index_all(paths, model, concurrency, cache=None, checkpoint_dir=None, parse_workers=None):
+        from . import utils
+
+        utils.set_max_concurrent_requests(concurrency)
+        if checkpoint_dir and not os.path.exists(checkpoint_dir):
+            os.makedirs(checkpoint_dir)
+        start = time.perf_counter()
+
+        trees = [None] * len(paths)
+        pending = []
+        for i, path in enumerate(paths):
+            if checkpoint_dir:
+                with open(path, 'rb') as f:
+                    source_hash = text_hash(f.read().decode('utf-8'))
+                trees[i] = PageIndex._load_checkpoint(PageIndex._checkpoint_path(checkpoint_dir, path), source_hash, model)
+                if trees[i] is not None:
+                    continue
+            else:
+                source_hash = None
+            pending.append((i, path, source_hash))
+        if len(pending) < len(paths):
+            print(f"  Resuming: {len(paths) - len(pending)} of {len(paths)} docs already checkpointed.")
+
+        parse_start = time.perf_counter()
+        structures = parse_markdown_batch([path for _, path, _ in pending], parse_workers)
+        print(f"  Parsed {len(pending)} docs in {time.perf_counter() - parse_start:.1f}s")
+
+        async def build(i, path, source_hash, structure):
+            try:
+                doc_tree = await md_to_tree(md_path=path, if_add_node_summary='yes', model=model,
+                                            summary_cache=cache, structure=structure)
+            except Exception as e:
+                print(f"  Failed to index {os.path.basename(path)}: {e}")
+                return i, None
+            # Only checkpoint complete docs; a failed summary is retried next run
+            if checkpoint_dir and all(n.get('summary') != "Error" for n in utils.structure_to_list(doc_tree['structure'])):
+                PageIndex._save_checkpoint(PageIndex._checkpoint_path(checkpoint_dir, path), source_hash, model, doc_tree)
+            return i, doc_tree
+
+        try:
+            tasks = [build(i, path, source_hash, structure)
+                     for (i, path, source_hash), structure in zip(pending, structures)]
+            for done, task in enumerate(asyncio.as_completed(tasks), start=1):
+                i, doc_tree = await task
+                trees[i] = doc_tree
+                elapsed = time.perf_counter() - start
+                eta = elapsed / done * (len(pending) - done)
+                print(f"  [{done}/{len(pending)}] {os.path.basename(paths[i])} "
+                      f"({elapsed:.0f}s elapsed, ~{eta:.0f}s left)")
+        finally:
+            await utils.close_async_clients()
+        # Keep file order so doc indices are stable across runs
+        return [t for t in trees if t is not None]
+
     def save(self, path):
+        """Writes the index to the `path` directory as a manifest plus doc shards (see store.py)."""
         print(f"Saving index to {path}...")
-        with open(path, 'w', encoding='utf-8') as f:
-            json.dump(self.tree, f, indent=4, ensure_ascii=False)
+        write_store(path, self.tree['docs'])
 
     def load(self, path):
+        """
+        Opens a saved index. Only the manifest is read; doc trees are read
+        from their shards when a query first needs them. A single-file
+        JSON index from before sharding is still loaded whole.
+        """
         print(f"Loading index from {path}...")
-        if os.path.exists(path):
+        if store_exists(path):
+            self.tree = {"docs": ShardedDocs(path)}
+        elif os.path.isfile(path):
             with open(path, 'r', encoding='utf-8') as f:
                 self.tree = json.load(f)
         return self
 
-    def query(self, question, model="gpt-4o"):
+    def doc_entry(self, i):
+        """Name and summary of doc `i`, from the manifest when the index is sharded."""
+        docs = self.tree['docs']
+        return docs.entry(i) if isinstance(docs, ShardedDocs) else doc_entry(docs[i], i)
+
+    @staticmethod
+    def _doc_profile(doc):
+        """Text the shortlist index sees for a doc: its name, node titles and summaries."""
+        from .utils import structure_to_list
+        parts = [doc.get('doc_name', '')]
+        for node in structure_to_list(doc.get('structure', [])):
+            parts.append(node.get('title', ''))
+            parts.append(node.get('summary', ''))
+        return "\n".join(parts)
+
+    def build_shortlist(self, path):
+        """Writes a BM25 index over the doc and node summaries (IDs = doc positions) to `path`."""
+        from tools.lexical_index import build_lexical_index_from_texts
+        count = build_lexical_index_from_texts(
+            ((i, self._doc_profile(doc)) for i, doc in enumerate(self.tree['docs'])), path)
+        print(f"Shortlist index built over {count} docs at {path}")
+        return self
+
+    def load_shortlist(self, path):
+        """Loads the shortlist index if it exists; without it every doc goes to the selection step."""
+        from tools.lexical_index import LexicalIndex, lexical_index_exists
+        if lexical_index_exists(path):
+            self.shortlist = LexicalIndex(path)
+        else:
+            print(f"No shortlist index at {path}; selection will consider every doc.")
+        return self
+
+    def candidates(self, question, limit=20):
+        """Positions of the docs offered to the LLM selection step, best first."""
+        docs = self.tree.get('docs', [])
+        if self.shortlist is None or len(docs) <= limit:
+            return list(range(len(docs)))
+        _, ids = self.shortlist.search(question, limit)
+        found = [int(i) for i in ids if i < len(docs)]
+        # No term overlap at all: fall back to a bounded slice rather than every doc
+        return found or list(range(limit))
+
+    def retrieve(self, question, model="gpt-4o", shortlist_size=20):
+        """
+        Steps 1-2 of a query: picks the relevant documents and returns their
+        node texts. Only the `shortlist_size` best docs from the shortlist
+        index are offered to the LLM, so the selection prompt stays the
+        same size as the corpus grows.
+        """
         from .utils import ChatGPT_API
         
         print(f"Querying PageIndex with: {question}")
         
         # Step 1: Find relevant documents
-        doc_summaries = []
-        for i, doc in enumerate(self.tree.get('docs', [])):
-            doc_name = doc.get('doc_name', f"Doc {i}")
-            # Use the first node's summary as doc summary if needed
-            summary = doc.get('structure', [{}])[0].get('summary', 'No summary')
-            doc_summaries.append(f"Doc {i}: {doc_name} - {summary[:200]}...")
+        with span("shortlist"):
+            candidates = self.candidates(question, shortlist_size)
+            doc_summaries = []
+            for i in candidates:
+                # The first node's summary stands in for the doc summary
+                entry = self.doc_entry(i)
+                doc_summaries.append(f"Doc {i}: {entry['doc_name']} - {entry['summary'][:200]}...")
             
         summary_text = "\n".join(doc_summaries)
         select_prompt = f"""Given these documents, which ones (by index) might contain the answer to: "{question}"?
@@ -58,29 +210,59 @@ class PageIndex:
         Return a list of indices, e.g. [0, 2]. Limit to top 3.
         """
         
-        selection_res = ChatGPT_API(model=model, prompt=select_prompt)
+        with span("select"):
+            selection_res = ChatGPT_API(model=model, prompt=select_prompt)
         try:
             import ast
             selected_indices = ast.literal_eval(selection_res.strip())
         except:
-            selected_indices = [0] if self.tree['docs'] else []
+            selected_indices = candidates[:1]
             
         # Step 2: Retrieve from selected docs
         context_chunks = []
-        for idx in selected_indices:
-            if idx < len(self.tree['docs']):
-                doc = self.tree['docs'][idx]
-                for node in doc.get('structure', []):
-                    # For simplicity, add all nodes from relevant documents
-                    context_chunks.append(node.get('text', ''))
-        
-        context = "\n\n".join(context_chunks)[:10000] # Cap context
+        with span("search"):
+            for idx in selected_indices:
+                if idx in candidates:
+                    doc = self.tree['docs'][idx]
+                    for node in doc.get('structure', []):
+                        # For simplicity, add all nodes from relevant documents
+                        context_chunks.append(node.get('text', ''))
+        return context_chunks
+
+    @staticmethod
+    def answer_prompt(question, context_chunks, context_budget=2500, model="gpt-4o"):
+        from tools.context_builder import build_context
         
-        # Step 3: Answer
-        answer_prompt = f"""Context: {context}
+        # Packs node texts best-first into a token budget
+        with span("context_build"):
+            context, info = build_context(context_chunks, context_budget, model=model, separator="\n\n")
+        print(f"Context: {info['tokens']}/{info['budget']} tokens from {info['chunks']} of {len(context_chunks)} nodes")
+        return f"""Context: {context}
         Question: {question}
         Answer based on context.
         """
-        answer = ChatGPT_API(model=model, prompt=answer_prompt)
+
+    def query(self, question, model="gpt-4o", context_budget=2500, shortlist_size=20):
+        from .utils import ChatGPT_API
+        
+        context_chunks = self.retrieve(question, model=model, shortlist_size=shortlist_size)
+        
+        # Step 3: Answer
+        prompt = self.answer_prompt(question, context_chunks, context_budget, model)
+        with span("generate"):
+            # Raises on failure, so an error is never returned (or cached) as an answer
+            answer = ChatGPT_API(model=model, prompt=prompt, raise_errors=True)
         
         return answer, context_chunks
+
+    def query_stream(self, question, model="gpt-4o", context_budget=2500, shortlist_size=20):
+        """Like query(), but the answer step streams: returns (token generator, context_chunks)."""
+        from .utils import ChatGPT_API_stream
+        
+        context_chunks = self.retrieve(question, model=model, shortlist_size=shortlist_size)
+        prompt = self.answer_prompt(question, context_chunks, context_budget, model)
+
+        def pieces():
+            with span("generate"):
+                yield from ChatGPT_API_stream(model=model, prompt=prompt, raise_errors=True)
+        return pieces(), context_chunks
@@ -1,32 +1,45 @@
 import asyncio
 import os
 import re
+from concurrent.futures import ProcessPoolExecutor
 from .utils import count_tokens, generate_summaries_for_structure, write_node_id
 
-async def md_to_tree(md_path, if_thinning='no', min_token_threshold=5000, if_add_node_summary='yes', summary_token_threshold=200, model="gpt-4o", if_add_doc_description='no', if_add_node_text='yes'):
-    with open(md_path, 'r', encoding='utf-8') as f:
-        content = f.read()
+HEADER_PATTERN = re.compile(r'^(#+)\s+(.+)$')
+
+# Below this many files a process pool costs more than it saves
+MIN_FILES_PER_POOL = 32
+
 
-    # Simple markdown header parsing
-    lines = content.split('\n')
+def parse_markdown(md_path):
+    """
+    Parses a markdown file into its header tree (with node IDs), reading it
+    line by line. Each node's text is collected as a list of lines and
+    joined once, so parsing is linear in the file size.
+    """
     nodes = []
-    current_node = None
-    
-    for line in lines:
-        match = re.match(r'^(#+)\s+(.+)$', line)
-        if match:
-            level = len(match.group(1))
-            title = match.group(2)
-            node = {'title': title, 'level': level, 'text': '', 'nodes': []}
-            nodes.append(node)
-            current_node = node
-        elif current_node:
-            current_node['text'] += line + '\n'
+    parts = None
+    ends_with_newline = True
+    with open(md_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            ends_with_newline = line.endswith('\n')
+            if ends_with_newline:
+                line = line[:-1]
+            match = HEADER_PATTERN.match(line)
+            if match:
+                parts = []
+                nodes.append(({'title': match.group(2), 'level': len(match.group(1)), 'text': '', 'nodes': []}, parts))
+            elif parts is not None:
+                parts.append(line)
+    # Like content.split('\n'), a trailing newline leaves one final empty line
+    if ends_with_newline and parts is not None:
+        parts.append('')
+    for node, node_parts in nodes:
+        node['text'] = ''.join(part + '\n' for part in node_parts)
 
     # Build hierarchy
     root_nodes = []
     stack = []
-    for node in nodes:
+    for node, _ in nodes:
         while stack and stack[-1]['level'] >= node['level']:
             stack.pop()
         if stack:
@@ -36,9 +49,27 @@ async def md_to_tree(md_path, if_thinning='no', min_token_threshold=5000, if_add
         stack.append(node)
 
     write_node_id(root_nodes)
-    
+    return root_nodes
+
+
+def parse_markdown_batch(md_paths, max_workers=None):
+    """
+    parse_markdown() for many files, spread over a process pool (in-process
+    for small batches or max_workers=1). Returns the trees in input order.
+    """
+    if max_workers == 1 or len(md_paths) < MIN_FILES_PER_POOL:
+        return [parse_markdown(path) for path in md_paths]
+    workers = max_workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(parse_markdown, md_paths, chunksize=max(1, len(md_paths) // (workers * 4))))
+
+
+async def md_to_tree(md_path, if_thinning='no', min_token_threshold=5000, if_add_node_summary='yes', summary_token_threshold=200, model="gpt-4o", if_add_doc_description='no', if_add_node_text='yes', summary_cache=None, structure=None):
+    """Tree of one markdown file with node summaries; `structure` skips parsing if already parsed."""
+    root_nodes = structure if structure is not None else parse_markdown(md_path)
+
     if if_add_node_summary == 'yes':
-        await generate_summaries_for_structure(root_nodes, model=model)
+        await generate_summaries_for_structure(root_nodes, model=model, cache=summary_cache)
 
     return {
         'doc_name': os.path.basename(md_path),
@@ -0,0 +1,117 @@
+"""
+Sharded PageIndex Store
+-----------------------
+The saved index is a directory instead of one JSON file:
+
+    manifest.json       per doc: name, summary (its first node's), shard
+                        number and the byte offset/length of its record
+    shard_00000.jsonl   one compact JSON record per doc: the doc's full
+    shard_00001.jsonl   tree (node titles, texts, summaries, subtrees)
+    ...
+
+Loading reads only the manifest. Document selection works from the
+manifest's names and summaries; a doc's tree is read from its shard (one
+seek + read) the first time a query touches it, and a bounded number of
+parsed trees are kept in memory.
+"""
+import os
+import json
+import threading
+from collections import OrderedDict
+
+MANIFEST_FILE = "manifest.json"
+SHARD_SIZE = 64
+
+
+def _shard_name(shard):
+    return f"shard_{shard:05d}.jsonl"
+
+
+def doc_entry(doc, position=None):
+    """Manifest fields of an in-memory doc tree (no shard location)."""
+    structure = doc.get('structure') or [{}]
+    return {
+        'doc_name': doc.get('doc_name', f"Doc {position}"),
+        'summary': structure[0].get('summary', 'No summary'),
+    }
+
+
+def store_exists(path):
+    return os.path.exists(os.path.join(path, MANIFEST_FILE))
+
+
+def write_store(path, docs, shard_size=SHARD_SIZE):
+    """Writes `docs` (doc trees) as shards plus a manifest; the manifest is replaced last."""
+    if os.path.isfile(path):
+        # A single-file index from before sharding
+        os.remove(path)
+    if not os.path.exists(path):
+        os.makedirs(path)
+
+    entries = []
+    for shard, start in enumerate(range(0, len(docs), shard_size)):
+        offset = 0
+        with open(os.path.join(path, _shard_name(shard)), 'wb') as f:
+            for i in range(start, min(start + shard_size, len(docs))):
+                record = json.dumps(docs[i], ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n'
+                f.write(record)
+                entries.append(dict(doc_entry(docs[i], i), shard=shard, offset=offset, length=len(record)))
+                offset += len(record)
+    shard_count = (len(docs) + shard_size - 1) // shard_size
+
+    tmp_path = os.path.join(path, MANIFEST_FILE + ".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'shards': shard_count, 'docs': entries}, f, ensure_ascii=False)
+    os.replace(tmp_path, os.path.join(path, MANIFEST_FILE))
+
+    # Shards left over from a larger previous index
+    for name in os.listdir(path):
+        if name.startswith("shard_") and name.endswith(".jsonl") and int(name[6:11]) >= shard_count:
+            os.remove(os.path.join(path, name))
+
+
+class ShardedDocs:
+    """
+    Read-only sequence of doc trees backed by a store directory. Indexing
+    loads a doc from its shard on first access; `entry(i)` returns the
+    manifest fields without touching the shards. Safe to share between
+    query threads.
+    """
+
+    def __init__(self, path, cache_size=128):
+        with open(os.path.join(path, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        self.path = path
+        self.entries = manifest['docs']
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def entry(self, i):
+        return self.entries[i]
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self.entries)
+        with self._lock:
+            doc = self._cache.get(i)
+            if doc is not None:
+                self._cache.move_to_end(i)
+                return doc
+        # Read outside the lock; two threads missing on the same doc both read it
+        entry = self.entries[i]
+        with open(os.path.join(self.path, _shard_name(entry['shard'])), 'rb') as f:
+            f.seek(entry['offset'])
+            doc = json.loads(f.read(entry['length']).decode('utf-8'))
+        with self._lock:
+            self._cache[i] = doc
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return doc
+
+    def __iter__(self):
+        for i in range(len(self.entries)):
+            yield self[i]
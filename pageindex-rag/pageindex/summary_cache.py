@@ -0,0 +1,23 @@
+"""
+Node Summary Cache
+------------------
+A persistent SQLite store of node summaries keyed by (model, SHA-256 of the
+node text). generate_summaries_for_structure looks nodes up here before
+calling the LLM and stores each summary as soon as it arrives, so an
+interrupted ingest keeps every summary it paid for and re-indexing unchanged
+markdown makes no LLM calls.
+"""
+from tools.keyed_cache import KeyedCache, text_hash
+
+
+class SummaryCache(KeyedCache):
+    """On-disk node summary cache. Hit and miss counts are kept for reporting."""
+
+    def __init__(self, path):
+        super().__init__(path, "summaries", "summary", "TEXT", label="Summary cache")
+
+    def get(self, model, text):
+        return self.get_values(model, [text])[0]
+
+    def put(self, model, text, summary):
+        self.put_values(model, [text], [summary])
@@ -5,18 +5,18 @@ import os
 from datetime import datetime
 import time
 import json
-import PyPDF2
 import copy
 import asyncio
-import pymupdf
-from io import BytesIO
 from dotenv import load_dotenv
 import yaml
 from pathlib import Path
 from types import SimpleNamespace as config
 
+from tools.llm_client import get_client
+
 load_dotenv()
 CHATGPT_API_KEY = os.getenv("CHATGPT_API_KEY")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")
 
 def count_tokens(text, model="gpt-4o"):
     if not text:
@@ -25,52 +25,69 @@ def count_tokens(text, model="gpt-4o"):
     tokens = enc.encode(text)
     return len(tokens)
 
-def ChatGPT_API_with_finish_reason(model, prompt, api_key=None, chat_history=None):
-    if not api_key: api_key = CHATGPT_API_KEY
-    max_retries = 10
-    client = openai.OpenAI(api_key=api_key)
-    for i in range(max_retries):
-        try:
-            messages = chat_history.copy() if chat_history else []
-            messages.append({"role": "user", "content": prompt})
-            response = client.chat.completions.create(
-                model=model,
-                messages=messages,
-                temperature=0,
-            )
-            if response.choices[0].finish_reason == "length":
-                return response.choices[0].message.content, "max_output_reached"
-            else:
-                return response.choices[0].message.content, "finished"
-        except Exception as e:
-            if i < max_retries - 1:
-                time.sleep(1)
-            else:
-                return "Error", "failed"
-
-def ChatGPT_API(model, prompt, api_key=None, chat_history=None):
+def _llm(api_key=None):
+    # Shared pooled client: keep-alive connections, retries with backoff and jitter, call metrics
+    return get_client("openai", api_key=api_key or CHATGPT_API_KEY, base_url=OPENAI_BASE_URL)
+
+def _messages(prompt, chat_history=None):
+    messages = chat_history.copy() if chat_history else []
+    messages.append({"role": "user", "content": prompt})
+    return messages
+
+def ChatGPT_API_with_finish_reason(model, prompt, api_key=None, chat_history=None, raise_errors=False):
+    """
+    (text, finish status). A failed call returns ("Error", "failed"), or
+    raises with `raise_errors` so callers can tell a failure from an answer.
+    """
+    try:
+        response = _llm(api_key).chat_response(model, _messages(prompt, chat_history), temperature=0)
+    except Exception as e:
+        if raise_errors:
+            raise
+        return "Error", "failed"
+    if response.choices[0].finish_reason == "length":
+        return response.choices[0].message.content, "max_output_reached"
+    else:
+        return response.choices[0].message.content, "finished"
+
+def ChatGPT_API(model, prompt, api_key=None, chat_history=None, raise_errors=False):
     if not api_key: api_key = CHATGPT_API_KEY
-    res, _ = ChatGPT_API_with_finish_reason(model, prompt, api_key, chat_history)
+    res, _ = ChatGPT_API_with_finish_reason(model, prompt, api_key, chat_history, raise_errors)
     return res
 
+def ChatGPT_API_stream(model, prompt, api_key=None, chat_history=None, raise_errors=False):
+    """
+    Yields the completion text as it streams in. Retries only until the
+    first token arrives; a call that fails before then yields "Error", or
+    raises with `raise_errors`.
+    """
+    started = False
+    pieces = _llm(api_key).chat_stream(model, _messages(prompt, chat_history), temperature=0)
+    try:
+        for piece in pieces:
+            started = True
+            yield piece
+    except Exception as e:
+        if started or raise_errors:
+            raise
+        yield "Error"
+    finally:
+        # Frees the client's concurrency slot if the caller stops early
+        pieces.close()
+
+def set_max_concurrent_requests(max_concurrency, api_key=None):
+    """Caps in-flight LLM requests (per event loop for async calls); call before indexing."""
+    _llm(api_key).set_concurrency(max_concurrency)
+
+async def close_async_clients(api_key=None):
+    """Closes the running loop's async client; call before the loop ends."""
+    await _llm(api_key).aclose()
+
 async def ChatGPT_API_async(model, prompt, api_key=None):
-    if not api_key: api_key = CHATGPT_API_KEY
-    max_retries = 10
-    messages = [{"role": "user", "content": prompt}]
-    for i in range(max_retries):
-        try:
-            async with openai.AsyncOpenAI(api_key=api_key) as client:
-                response = await client.chat.completions.create(
-                    model=model,
-                    messages=messages,
-                    temperature=0,
-                )
-                return response.choices[0].message.content
-        except Exception as e:
-            if i < max_retries - 1:
-                await asyncio.sleep(1)
-            else:
-                return "Error"
+    try:
+        return await _llm(api_key).achat(model, _messages(prompt), temperature=0)
+    except Exception as e:
+        return "Error"
 
 def extract_json(content):
     try:
@@ -109,13 +126,22 @@ def structure_to_list(structure):
             nodes.extend(structure_to_list(item))
         return nodes
 
-async def generate_node_summary(node, model=None):
-    prompt = f"Summarize this part of the document: {node.get('text', '')}"
-    return await ChatGPT_API_async(model, prompt)
+async def generate_node_summary(node, model=None, cache=None):
+    text = node.get('text', '')
+    if cache is not None:
+        summary = cache.get(model, text)
+        if summary is not None:
+            return summary
+    prompt = f"Summarize this part of the document: {text}"
+    summary = await ChatGPT_API_async(model, prompt)
+    # Failed calls return "Error"; leave those uncached so the next run retries
+    if cache is not None and summary != "Error":
+        cache.put(model, text, summary)
+    return summary
 
-async def generate_summaries_for_structure(structure, model=None):
+async def generate_summaries_for_structure(structure, model=None, cache=None):
     nodes = structure_to_list(structure)
-    tasks = [generate_node_summary(node, model=model) for node in nodes]
+    tasks = [generate_node_summary(node, model=model, cache=cache) for node in nodes]
     summaries = await asyncio.gather(*tasks)
     for node, summary in zip(nodes, summaries):
         node['summary'] = summary
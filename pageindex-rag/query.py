@@ -1,6 +1,10 @@
 import os
 import sys
-from config import INDEX_PATH, MODEL
+import time
+import argparse
+from config import (INDEX_PATH, MODEL, CONTEXT_TOKEN_BUDGET, EMBEDDING_MODEL, QUERY_EMBEDDING_CACHE_SIZE,
+                   ANSWER_CACHE_SIZE, ANSWER_CACHE_THRESHOLD, SHORTLIST_INDEX_PATH, SHORTLIST_SIZE,
+                   OPENAI_BASE_URL)
 
 # Add the current directory to sys.path to find the local 'pageindex' shim
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
@@ -8,33 +12,121 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 # Add parent dir to path to import tools
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 from tools.data_processor import normalize_query
+from tools.query_cache import QueryCache, index_version
+from tools.query_service import ResidentIndex
+from tools.streaming import StreamingAnswer, format_metrics
+from tools.llm_client import get_client
+from tools.tracing import span
 
 try:
     from pageindex import PageIndex
+    from pageindex.utils import CHATGPT_API_KEY
 except ImportError as e:
     print(f"Error importing PageIndex: {e}")
     sys.exit(1)
 
+# The same shared client the PageIndex LLM calls use
+llm = get_client("openai", api_key=CHATGPT_API_KEY, base_url=OPENAI_BASE_URL)
+
+def load_index():
+    """
+    Opens the saved index and its shortlist. Only the manifest is read up
+    front; doc trees are read from their shards as queries need them.
+    """
+    if not os.path.exists(INDEX_PATH):
+        raise FileNotFoundError(f"Index not found at {INDEX_PATH}. Run ingest.py first.")
+    return PageIndex().load(INDEX_PATH).load_shortlist(SHORTLIST_INDEX_PATH)
+
+# Loaded on the first query and kept in memory, along with the doc trees
+# parsed so far, for every query after it.
+resident_index = ResidentIndex(load_index)
+
+# Repeated and near-identical questions skip the tree search and answer step
+query_cache = QueryCache(lambda: index_version(INDEX_PATH, SHORTLIST_INDEX_PATH),
+                         threshold=ANSWER_CACHE_THRESHOLD,
+                         max_embeddings=QUERY_EMBEDDING_CACHE_SIZE,
+                         max_answers=ANSWER_CACHE_SIZE)
+
+def embed_queries(questions):
+    return llm.embed(EMBEDDING_MODEL, questions)
+
+def lookup_cached(question):
+    """
+    (query embedding, cached (answer, chunks) or None). The cache is only an
+    optimization: if the embeddings call fails, returns (None, None) and the
+    query is answered without it.
+    """
+    try:
+        with span("embed"):
+            query_embedding = query_cache.embed([question], embed_queries)[0]
+    except Exception as e:
+        print(f"Query cache unavailable ({e}); answering without it.")
+        return None, None
+    return query_embedding, query_cache.lookup_answer(query_embedding)
+
+def remember(query_embedding, answer, chunks):
+    if query_embedding is not None:
+        query_cache.store_answer(query_embedding, (answer, chunks))
+
 def query(question):
     # Step 1 of RAG Query Flow: Preprocessing
-    question = normalize_query(question)
+    with span("normalize"):
+        question = normalize_query(question)
     print(f"Normalized Query: {question}")
 
-    if not os.path.exists(INDEX_PATH):
-        raise FileNotFoundError(f"Index not found at {INDEX_PATH}. Run ingest.py first.")
+    query_embedding, cached = lookup_cached(question)
+    if cached is not None:
+        print("\nPageIndex Answer (cached):")
+        print(cached[0])
+        return cached
 
-    # Load the index
-    pi = PageIndex().load(INDEX_PATH)
+    # Load the index (only the first query reads it)
+    with span("index_load"):
+        pi = resident_index.get()
     
     # Perform reasoning-based query
     # PageIndex navigates the tree structure to find the answer
-    answer, chunks = pi.query(question, model=MODEL)
+    answer, chunks = pi.query(question, model=MODEL, context_budget=CONTEXT_TOKEN_BUDGET,
+                              shortlist_size=SHORTLIST_SIZE)
     
     print("\nPageIndex Answer:")
     print(answer)
+    remember(query_embedding, answer, chunks)
     return answer, chunks
 
+def query_stream(question):
+    """
+    Streaming variant of query(): document selection runs before it
+    returns, then the StreamingAnswer yields the answer step's tokens as
+    they arrive and records TTFT, tokens/sec and total latency.
+    """
+    start_time = time.perf_counter()
+    with span("normalize"):
+        question = normalize_query(question)
+    print(f"Normalized Query: {question}")
 
-if __name__ == "__main__":
-    query("What are the most common symptoms mentioned in these medical records?")
+    query_embedding, cached = lookup_cached(question)
+    if cached is not None:
+        answer, chunks = cached
+        return StreamingAnswer(iter([answer]), chunks, start_time)
 
+    with span("index_load"):
+        pi = resident_index.get()
+    pieces, chunks = pi.query_stream(question, model=MODEL, context_budget=CONTEXT_TOKEN_BUDGET,
+                                     shortlist_size=SHORTLIST_SIZE)
+
+    return StreamingAnswer(pieces, chunks, start_time,
+                           on_complete=lambda answer, chunks: remember(query_embedding, answer, chunks))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ask the PageIndex RAG a question.")
+    parser.add_argument("question", nargs="?", default="What are the most common symptoms mentioned in these medical records?")
+    parser.add_argument("--stream", action="store_true", help="Print the answer as it is generated.")
+    args = parser.parse_args()
+    if args.stream:
+        streamed = query_stream(args.question)
+        streamed.consume(echo=True)
+        print(format_metrics(streamed.metrics))
+    else:
+        query(args.question)
@@ -0,0 +1,46 @@
+"""
+Shared test fixtures. The suite runs offline: tokenization uses a small
+byte-level BPE built with tiktoken (no encoding files are downloaded), and
+model calls go to tools/mock_llm_server.py on a local port.
+"""
+import os
+import sys
+import pytest
+import tiktoken
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT_DIR)
+
+# A few multi-byte merges, so token boundaries don't always fall on characters
+MERGES = [b"th", b"he", b"the", b" t", b" the", b"in", b"ing", b" a", b"er", b" p", b"ain", b"en", b"ed"]
+PATTERN = r"""'s|'t|'re|'ve|'m|'ll|'d| ?\p{L}+| ?\p{N}+| ?[^\s\p{L}\p{N}]+|\s+(?!\S)|\s+"""
+
+
+def offline_encoding():
+    ranks = {bytes([i]): i for i in range(256)}
+    for merge in MERGES:
+        ranks[merge] = len(ranks)
+    return tiktoken.Encoding("offline_test", pat_str=PATTERN, mergeable_ranks=ranks, special_tokens={})
+
+
+@pytest.fixture
+def encoding(monkeypatch):
+    """The offline encoding, patched in wherever the tools resolve one."""
+    import tools.data_processor
+    import tools.context_builder
+    enc = offline_encoding()
+    monkeypatch.setattr(tools.data_processor, "get_encoding", lambda model="gpt-4o-mini": enc)
+    monkeypatch.setattr(tools.context_builder, "get_encoding", lambda model="gpt-4o-mini": enc)
+    return enc
+
+
+@pytest.fixture
+def mock_llm():
+    """A fast mock OpenAI/Ollama server; yields (server, base URL without /v1)."""
+    from tools.mock_llm_server import MockLLMServer
+    server = MockLLMServer(ttft_ms=1.0, latency_sigma=0.0, tokens_per_sec=5000.0, tokens_per_sec_sd=0.0,
+                           embed_ms=0.0, embed_ms_per_input=0.0, answer_tokens=8, dim=8, retry_after_ms=1)
+    httpd = server.start("127.0.0.1")
+    yield server, f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
@@ -0,0 +1,140 @@
+import os
+import numpy as np
+import pytest
+
+from tools.chunk_store import ChunkStore, ChunkStoreWriter, compact_store, store_exists
+
+
+def make_chunk(i, specialty="Urology", sample="Sample A", row_key="0"):
+    return {'text': f"chunk {i} text é", 'medical_specialty': specialty, 'sample_name': sample,
+            'row_key': row_key, 'ordinal': i, 'token_start': i * 10, 'token_end': i * 10 + 12,
+            'overlap_chars': 0 if i == 0 else 3}
+
+
+def write_store(path, chunks, vectors=None):
+    writer = ChunkStoreWriter(path)
+    if vectors is None:
+        vectors = np.arange(len(chunks) * 4, dtype=np.float32).reshape(len(chunks), 4)
+    writer.write(chunks, vectors=vectors)
+    writer.close()
+    return vectors
+
+
+@pytest.fixture
+def store_path(tmp_path):
+    return str(tmp_path / "chunk_store")
+
+
+def test_round_trip(store_path):
+    chunks = {i: make_chunk(i, specialty="Urology" if i % 2 else "Cardiology") for i in range(5)}
+    vectors = write_store(store_path, chunks)
+
+    store = ChunkStore(store_path)
+    assert store_exists(store_path)
+    assert len(store) == 5
+    assert store[3] == chunks[3]
+    assert [c['ordinal'] for c in store.get_many([4, 99, 1])] == [4, 1]
+    assert 2 in store and 99 not in store
+    np.testing.assert_array_equal(store.vectors, vectors)
+    store.close()
+
+
+def test_ids_must_increase(store_path):
+    writer = ChunkStoreWriter(store_path)
+    writer.write({5: make_chunk(0)}, vectors=np.zeros((1, 4)))
+    with pytest.raises(ValueError):
+        writer.write({3: make_chunk(1)}, vectors=np.zeros((1, 4)))
+    writer.close()
+
+
+def test_append_keeps_vocab_and_rows(store_path):
+    write_store(store_path, {0: make_chunk(0, specialty="Urology")})
+    writer = ChunkStoreWriter(store_path, append=True)
+    writer.write({1: make_chunk(1, specialty="Neurology"), 2: make_chunk(2, specialty="Urology")},
+                 vectors=np.ones((2, 4)))
+    writer.close()
+
+    store = ChunkStore(store_path)
+    assert len(store) == 3
+    assert store.vocab['medical_specialty'] == ["Urology", "Neurology"]
+    assert [store[i]['medical_specialty'] for i in range(3)] == ["Urology", "Neurology", "Urology"]
+
+
+def test_tombstones_hide_removed_chunks(store_path):
+    writer = ChunkStoreWriter(store_path)
+    writer.write({i: make_chunk(i) for i in range(4)}, vectors=np.zeros((4, 4)))
+    writer.remove([1, 2])
+    writer.close()
+
+    store = ChunkStore(store_path)
+    assert len(store) == 2
+    assert 1 not in store and 3 in store
+    with pytest.raises(KeyError):
+        store[2]
+    assert [c['ordinal'] for c in store.get_many([0, 1, 2, 3])] == [0, 3]
+    assert store.positions([0, 1, 3, 7]).tolist() == [0, -1, 3, -1]
+    assert store.removed_ratio() == 0.5
+
+
+def test_partitions_filter_case_insensitively_and_skip_removed(store_path):
+    specialties = ["Urology", "Cardiology", "urology ", "Neurology", "Urology"]
+    writer = ChunkStoreWriter(store_path)
+    writer.write({i: make_chunk(i, specialty=s, sample=f"S{i % 2}") for i, s in enumerate(specialties)},
+                 vectors=np.zeros((5, 4)))
+    writer.remove([4])
+    writer.close()
+
+    store = ChunkStore(store_path)
+    assert store.partition('medical_specialty', 'UROLOGY').tolist() == [0, 2]
+    assert store.partition('medical_specialty', ['Cardiology', 'Neurology']).tolist() == [1, 3]
+    assert store.filter_ids({'medical_specialty': 'urology', 'sample_name': 'S0'}).tolist() == [0, 2]
+    assert store.filter_ids({'medical_specialty': 'Dermatology'}).tolist() == []
+    with pytest.raises(ValueError):
+        store.partition('ordinal', 1)
+
+
+def test_compaction_drops_removed_rows_and_keeps_ids(store_path):
+    chunks = {i: make_chunk(i, specialty="Urology" if i < 3 else "Cardiology") for i in range(6)}
+    vectors = write_store(store_path, chunks)
+    writer = ChunkStoreWriter(store_path, append=True)
+    writer.remove([0, 4])
+    writer.close()
+
+    assert compact_store(store_path) == 2
+    store = ChunkStore(store_path)
+    assert store.columns['id'].tolist() == [1, 2, 3, 5]
+    assert store.removed_ratio() == 0.0
+    assert store[5] == chunks[5]
+    np.testing.assert_array_equal(store.vectors, vectors[[1, 2, 3, 5]])
+    assert store.filter_ids({'medical_specialty': 'Urology'}).tolist() == [1, 2]
+    assert not os.path.exists(store_path + ".build") and not os.path.exists(store_path + ".old")
+
+
+def test_store_without_newer_column(store_path):
+    # Stores written before overlap_chars existed read it as -1 and are back-filled on append
+    write_store(store_path, {0: make_chunk(0), 1: make_chunk(1)})
+    os.remove(os.path.join(store_path, "overlap_chars.bin"))
+
+    assert ChunkStore(store_path)[1]['overlap_chars'] == -1
+    writer = ChunkStoreWriter(store_path, append=True)
+    writer.write({2: make_chunk(2)}, vectors=np.zeros((1, 4)))
+    writer.close()
+    store = ChunkStore(store_path)
+    assert [store[i]['overlap_chars'] for i in range(3)] == [-1, -1, 3]
+
+
+def test_rewrite_leaves_open_readers_intact(store_path):
+    chunks = {i: make_chunk(i) for i in range(4)}
+    vectors = write_store(store_path, chunks)
+    reader = ChunkStore(store_path)
+
+    writer = ChunkStoreWriter(store_path)
+    writer.write({0: make_chunk(9)}, vectors=np.zeros((1, 4)))
+    # Until close() the new store is built elsewhere
+    assert len(ChunkStore(store_path)) == 4
+    writer.close()
+
+    assert len(ChunkStore(store_path)) == 1
+    assert len(reader) == 4 and reader[3] == chunks[3]
+    np.testing.assert_array_equal(reader.vectors, vectors)
+    reader.close()
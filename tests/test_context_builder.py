@@ -0,0 +1,77 @@
+from tools.context_builder import SEPARATOR, build_context, merge_adjacent
+from tools.data_processor import chunk_rows
+
+TEXT = ("The patient presents with pain in the abdomen. The pain started three days ago "
+        "and is worse after eating. There is no fever. The patient denies nausea. "
+        "Physical exam: tenderness in the right upper quadrant, rebound absent. "
+        "Plan: ultrasound of the gallbladder, then the surgical consult.")
+
+
+def sample_chunks(text=TEXT, key="7", chunk_size=12, overlap=4):
+    row = {'transcription': text, 'medical_specialty': "Gastroenterology", 'sample_name': "Abdominal pain"}
+    chunks = chunk_rows([row], chunk_size=chunk_size, overlap=overlap)[0]
+    return [dict(chunk, row_key=key) for chunk in chunks]
+
+
+def ranked(chunks):
+    return [dict(chunk, rank=rank) for rank, chunk in enumerate(chunks)]
+
+
+def test_merging_adjacent_chunks_restores_the_text(encoding):
+    chunks = sample_chunks()
+    assert len(chunks) > 3
+    assert all(c['overlap_chars'] > 0 for c in chunks[1:])
+
+    passages = merge_adjacent(ranked(chunks[::-1]), encoding)
+    assert len(passages) == 1
+    assert passages[0]['text'] == TEXT
+    assert passages[0]['chunks'] == len(chunks)
+    assert passages[0]['rank'] == 0
+
+
+def test_gaps_and_other_samples_stay_separate(encoding):
+    chunks = sample_chunks()
+    other = sample_chunks(key="8")[:1]
+    passages = merge_adjacent(ranked([chunks[2], other[0], chunks[0], chunks[1], chunks[4]]), encoding)
+    assert [p['chunks'] for p in passages] == [3, 1, 1]
+    assert [p['rank'] for p in passages] == [0, 1, 4]
+    assert TEXT.startswith(passages[0]['text'])
+
+
+def test_chunks_without_overlap_chars_fall_back_to_retokenizing(encoding):
+    # Stores written before overlap_chars existed report -1
+    chunks = [dict(chunk, overlap_chars=-1) for chunk in sample_chunks(text="alpha beta gamma delta " * 6)]
+    passages = merge_adjacent(ranked(chunks), encoding)
+    assert passages[0]['text'] == "alpha beta gamma delta " * 6
+
+
+def test_build_context_packs_best_first_within_budget(encoding):
+    texts = ["first passage about the heart", "second passage about the knee", "third passage"]
+    cost = [len(encoding.encode(t)) for t in texts]
+    separator = len(encoding.encode(SEPARATOR))
+
+    context, info = build_context(texts, cost[0] + separator + cost[1])
+    assert context == SEPARATOR.join(texts[:2])
+    assert info == {'tokens': cost[0] + separator + cost[1], 'budget': cost[0] + separator + cost[1],
+                    'passages': 2, 'chunks': 2, 'dropped_chunks': 1}
+
+    # A passage that doesn't fit is skipped, but smaller later ones still go in
+    context, info = build_context([texts[0], texts[1] * 20, texts[2]], cost[0] + separator + cost[2])
+    assert context == SEPARATOR.join([texts[0], texts[2]])
+    assert info['dropped_chunks'] == 1
+
+
+def test_build_context_truncates_an_oversized_first_passage(encoding):
+    context, info = build_context([TEXT], 5)
+    assert info['tokens'] == 5 and info['chunks'] == 1
+    assert context == encoding.decode(encoding.encode(TEXT)[:5])
+    assert build_context([TEXT], 0) == ("", {'tokens': 0, 'budget': 0, 'passages': 0, 'chunks': 0,
+                                            'dropped_chunks': 1})
+
+
+def test_build_context_merges_stored_chunks(encoding):
+    chunks = sample_chunks()
+    context, info = build_context(chunks[1:3] + chunks[:1], 10_000)
+    merged = merge_adjacent(ranked(chunks[:3]), encoding)[0]['text']
+    assert context == merged and TEXT.startswith(merged)
+    assert info['passages'] == 1 and info['chunks'] == 3
@@ -0,0 +1,178 @@
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+import faiss
+import pytest
+
+from tools.chunk_store import ChunkStore
+from tools.ingest_pipeline import StreamingIndexer, run_ingest
+from tools.lexical_index import LexicalIndex
+
+WORDS = "pain fever cough knee heart kidney stone murmur swelling rash nausea biopsy".split()
+
+
+def transcription(i, words=60):
+    return " ".join(WORDS[(i * 7 + j) % len(WORDS)] for j in range(words)) + f". Sample {i}."
+
+
+def write_csv(path, rows):
+    """rows: {row id: transcription}; the id goes in the unnamed leading column, like MTSamples."""
+    frame = pd.DataFrame({'medical_specialty': [f"Specialty {i % 3}" for i in rows],
+                          'sample_name': [f"Sample {i}" for i in rows],
+                          'transcription': list(rows.values())}, index=list(rows))
+    frame.to_csv(path)
+
+
+class FakeEmbedder:
+    """Deterministic 8-d embeddings from the text hash; records every text it is asked for."""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, texts, on_batch=None):
+        self.calls.extend(texts)
+        vectors = [np.frombuffer(hashlib.sha256(t.encode()).digest()[:8], dtype=np.uint8).astype('float32') / 255
+                   for t in texts]
+        if on_batch:
+            on_batch(texts, vectors)
+        return vectors
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return {name: str(tmp_path / name) for name in
+            ("data.csv", "index.faiss", "store", "manifest.json", "cache.db", "lexical")}
+
+
+def ingest(paths, embedder, incremental=False, embed_model="test-embed", **kwargs):
+    return run_ingest(embedder, data_path=paths["data.csv"], index_path=paths["index.faiss"],
+                      chunk_store_path=paths["store"], manifest_path=paths["manifest.json"],
+                      cache_path=paths["cache.db"], embed_model=embed_model, chunk_model="gpt-4o-mini",
+                      chunk_size=16, chunk_overlap=4, incremental=incremental,
+                      lexical_index_path=paths["lexical"], **kwargs)
+
+
+def index_ids(paths):
+    index = faiss.read_index(paths["index.faiss"])
+    return sorted(faiss.vector_to_array(index.id_map).tolist())
+
+
+def live_ids(paths):
+    store = ChunkStore(paths["store"])
+    try:
+        return sorted(i for i in store.columns['id'].tolist() if i not in store.deleted)
+    finally:
+        store.close()
+
+
+def manifest(paths):
+    with open(paths["manifest.json"], encoding='utf-8') as f:
+        return json.load(f)
+
+
+@pytest.fixture
+def indexed(paths, encoding):
+    rows = {i: transcription(i) for i in range(10)}
+    write_csv(paths["data.csv"], rows)
+    embedder = FakeEmbedder()
+    assert ingest(paths, embedder)
+    return rows, embedder
+
+
+def test_full_ingest_indexes_every_chunk(paths, indexed):
+    _, embedder = indexed
+    ids = live_ids(paths)
+    assert len(ids) == len(embedder.calls) > 10
+    assert index_ids(paths) == ids
+    assert sorted(manifest(paths)['rows']) == [str(i) for i in range(10)]
+    _, found = LexicalIndex(paths["lexical"]).search("sample 3", 50)
+    assert len(found)
+
+
+def test_incremental_run_without_changes_embeds_nothing(paths, indexed):
+    before = live_ids(paths)
+    embedder = FakeEmbedder()
+    assert ingest(paths, embedder, incremental=True)
+    assert embedder.calls == []
+    assert live_ids(paths) == before == index_ids(paths)
+
+
+def test_incremental_run_updates_and_removes_rows(paths, indexed):
+    rows, _ = indexed
+    old_ids = manifest(paths)['rows']
+    rows = dict(rows)
+    rows[2] = transcription(2) + " Addendum: new finding."
+    del rows[5]
+    rows[10] = transcription(10)
+    write_csv(paths["data.csv"], rows)
+
+    embedder = FakeEmbedder()
+    assert ingest(paths, embedder, incremental=True)
+    new_ids = manifest(paths)['rows']
+    assert sorted(new_ids, key=int) == [str(i) for i in rows]
+    # Unchanged rows keep their chunks; changed and new rows get fresh IDs
+    assert new_ids['0'] == old_ids['0']
+    assert not set(new_ids['2']['ids']) & set(old_ids['2']['ids'])
+    assert not set(old_ids['5']['ids']) & set(live_ids(paths))
+    assert live_ids(paths) == index_ids(paths)
+    # Only text not already in the embedding cache is embedded
+    assert "Addendum" in " ".join(embedder.calls)
+    assert len(embedder.calls) < len(new_ids['2']['ids']) + len(new_ids['10']['ids'])
+
+
+def test_run_after_a_crash_before_the_manifest_is_saved(paths, indexed, monkeypatch):
+    rows, _ = indexed
+    rows = dict(rows)
+    rows[2] = transcription(2) + " Addendum."
+    write_csv(paths["data.csv"], rows)
+
+    def crash(self):
+        raise RuntimeError("killed before finish()")
+
+    # Chunks for the changed row are appended to the store, then the run dies
+    with monkeypatch.context() as patch:
+        patch.setattr(StreamingIndexer, "finish", crash)
+        with pytest.raises(RuntimeError):
+            ingest(paths, FakeEmbedder(), incremental=True)
+    saved = manifest(paths)
+    assert max(live_ids(paths)) >= saved['next_id']
+
+    assert ingest(paths, FakeEmbedder(), incremental=True)
+    new_ids = manifest(paths)['rows']['2']['ids']
+    assert min(new_ids) > max(saved['rows'][str(i)]['ids'][-1] for i in range(10))
+    assert live_ids(paths) == index_ids(paths)
+    assert sorted(i for key in manifest(paths)['rows'].values() for i in key['ids']) == live_ids(paths)
+
+
+def test_removed_rows_trigger_compaction(paths, indexed):
+    rows, _ = indexed
+    write_csv(paths["data.csv"], {i: text for i, text in rows.items() if i >= 3})
+    assert ingest(paths, FakeEmbedder(), incremental=True)
+
+    store = ChunkStore(paths["store"])
+    assert store.removed_ratio() == 0.0
+    store.close()
+    assert live_ids(paths) == index_ids(paths)
+
+
+def test_changed_embedding_model_forces_a_full_ingest(paths, indexed):
+    _, first = indexed
+    embedder = FakeEmbedder()
+    assert ingest(paths, embedder, incremental=True, embed_model="other-embed")
+    assert sorted(embedder.calls) == sorted(first.calls)
+    assert manifest(paths)['settings']['embed_model'] == "other-embed"
+    assert live_ids(paths) == list(range(len(first.calls)))
+
+
+def test_tokenize_batch_size_does_not_change_the_result(paths, encoding):
+    write_csv(paths["data.csv"], {i: transcription(i) for i in range(7)})
+    assert ingest(paths, FakeEmbedder(), batch_size=2, tokenize_batch_size=1)
+    store = ChunkStore(paths["store"])
+    small = [store.row(pos) for pos in range(len(store.columns['id']))]
+    store.close()
+
+    assert ingest(paths, FakeEmbedder(), batch_size=2, tokenize_batch_size=5)
+    store = ChunkStore(paths["store"])
+    assert [store.row(pos) for pos in range(len(store.columns['id']))] == small
+    store.close()
@@ -0,0 +1,60 @@
+import os
+import sys
+import sqlite3
+import numpy as np
+
+from tools.embedding_cache import EmbeddingCache
+from tools.keyed_cache import text_hash
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "pageindex-rag"))
+
+from pageindex.summary_cache import SummaryCache
+
+
+def test_embedding_cache_round_trip_and_counts(tmp_path):
+    path = str(tmp_path / "cache" / "embeddings.db")
+    cache = EmbeddingCache(path, "model-a")
+    texts = [f"chunk {i}" for i in range(1200)]  # more than one lookup batch
+    cache.put_many(texts[::2], [np.full(4, i, dtype=np.float32) for i in range(600)])
+
+    found = cache.get_many(texts)
+    assert [v is not None for v in found] == [i % 2 == 0 for i in range(1200)]
+    np.testing.assert_array_equal(found[10], np.full(4, 5, dtype=np.float32))
+    assert (cache.hits, cache.misses) == (600, 600)
+    cache.close()
+
+    # Another model's vectors are a different space
+    other = EmbeddingCache(path, "model-b")
+    assert other.get_many(texts[:2]) == [None, None]
+    other.close()
+
+
+def test_summary_cache_round_trip(tmp_path):
+    cache = SummaryCache(str(tmp_path / "summaries.db"))
+    assert cache.get("gpt-4o", "node text") is None
+    cache.put("gpt-4o", "node text", "A summary.")
+    assert cache.get("gpt-4o", "node text") == "A summary."
+    assert cache.get("gpt-4o-mini", "node text") is None
+    assert (cache.hits, cache.misses) == (1, 2)
+    cache.close()
+
+
+def test_reads_caches_written_by_the_earlier_classes(tmp_path):
+    path = str(tmp_path / "old.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE embeddings (model TEXT NOT NULL, text_hash TEXT NOT NULL,"
+                 " vector BLOB NOT NULL, PRIMARY KEY (model, text_hash))")
+    conn.execute("CREATE TABLE summaries (model TEXT NOT NULL, text_hash TEXT NOT NULL,"
+                 " summary TEXT NOT NULL, PRIMARY KEY (model, text_hash))")
+    conn.execute("INSERT INTO embeddings VALUES (?, ?, ?)",
+                 ("m", text_hash("old chunk"), np.ones(3, dtype=np.float32).tobytes()))
+    conn.execute("INSERT INTO summaries VALUES (?, ?, ?)", ("m", text_hash("old node"), "Old summary."))
+    conn.commit()
+    conn.close()
+
+    embeddings = EmbeddingCache(path, "m")
+    np.testing.assert_array_equal(embeddings.get_many(["old chunk"])[0], np.ones(3, dtype=np.float32))
+    embeddings.close()
+    summaries = SummaryCache(path)
+    assert summaries.get("m", "old node") == "Old summary."
+    summaries.close()
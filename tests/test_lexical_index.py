@@ -0,0 +1,92 @@
+import os
+import math
+import numpy as np
+import pytest
+
+from tools.chunk_store import ChunkStore, ChunkStoreWriter
+from tools.lexical_index import (LexicalIndex, build_lexical_index, build_lexical_index_from_texts,
+                                 lexical_index_exists, tokenize)
+
+DOCS = [
+    (10, "Chest pain radiating to the left arm."),
+    (11, "No chest pain. Mild headache and nausea."),
+    (12, "Knee replacement, post-operative knee swelling."),
+    (13, "Headache, headache and photophobia."),
+]
+
+
+@pytest.fixture
+def index(tmp_path):
+    path = str(tmp_path / "lexical")
+    assert build_lexical_index_from_texts(DOCS, path) == len(DOCS)
+    return LexicalIndex(path)
+
+
+def test_tokenize_drops_stopwords_and_keeps_compounds():
+    assert tokenize("The patient's post-operative X-ray, and 2 views") == [
+        "patient's", "post-operative", "x-ray", "2", "views"]
+
+
+def test_scores_match_bm25(index):
+    k1, b = 1.2, 0.75
+    lengths = [len(tokenize(text)) for _, text in DOCS]
+    avg_len = sum(lengths) / len(lengths)
+
+    def weight(tf, df, length):
+        idf = math.log(1 + (len(DOCS) - df + 0.5) / (df + 0.5))
+        return idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / avg_len))
+
+    scores, ids = index.search("headache", 10)
+    assert ids.tolist() == [13, 11]
+    np.testing.assert_allclose(scores, [weight(2, 2, lengths[3]), weight(1, 2, lengths[1])], rtol=1e-5)
+
+    scores, ids = index.search("chest pain knee", 10)
+    assert ids.tolist()[0] == 12
+    assert set(ids.tolist()) == {10, 11, 12}
+
+
+def test_allowed_ids_and_k(index):
+    _, ids = index.search("headache chest", 1)
+    assert len(ids) == 1
+    _, ids = index.search("headache chest", 10, allowed_ids=[10, 12])
+    assert ids.tolist() == [10]
+    scores, ids = index.search("unknown words only", 10)
+    assert len(scores) == len(ids) == 0
+
+
+def test_search_many_pads_with_minus_one(index):
+    scores, ids = index.search_many(["knee", "nothing matches", "headache"], 3)
+    assert ids.shape == scores.shape == (3, 3)
+    assert ids[0].tolist() == [12, -1, -1]
+    assert ids[1].tolist() == [-1, -1, -1]
+    assert ids[2].tolist() == [13, 11, -1]
+
+
+def test_build_from_store_skips_removed_chunks(tmp_path):
+    store_path = str(tmp_path / "store")
+    writer = ChunkStoreWriter(store_path, with_vectors=False)
+    writer.write({chunk_id: {'text': text, 'medical_specialty': "General", 'sample_name': "S",
+                             'row_key': str(chunk_id), 'ordinal': 0, 'token_start': 0, 'token_end': 1,
+                             'overlap_chars': 0}
+                  for chunk_id, text in DOCS})
+    writer.remove([13])
+    writer.close()
+
+    path = str(tmp_path / "lexical")
+    store = ChunkStore(store_path)
+    assert build_lexical_index(store, path) == 3
+    store.close()
+    assert lexical_index_exists(path)
+    _, ids = LexicalIndex(path).search("headache", 10)
+    assert ids.tolist() == [11]
+
+
+def test_rebuild_leaves_open_readers_intact(tmp_path):
+    path = str(tmp_path / "lexical")
+    build_lexical_index_from_texts(DOCS, path)
+    reader = LexicalIndex(path)
+
+    build_lexical_index_from_texts([(1, "knee")], path)
+    assert reader.search("headache", 10)[1].tolist() == [13, 11]
+    assert LexicalIndex(path).search("knee", 10)[1].tolist() == [1]
+    assert not os.path.exists(path + ".build") and not os.path.exists(path + ".old")
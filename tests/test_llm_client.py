@@ -0,0 +1,109 @@
+import asyncio
+import numpy as np
+import pytest
+
+import tools.llm_client
+from tools.llm_client import LLMClient, call_metrics, metrics
+from tools.mock_llm_server import embed_text
+
+MESSAGES = [{"role": "user", "content": "Summarize the cardiology note."}]
+
+
+@pytest.fixture(params=["openai", "ollama"])
+def client(request, mock_llm):
+    _, base_url = mock_llm
+    metrics.reset()
+    if request.param == "openai":
+        llm = LLMClient("openai", api_key="test", base_url=f"{base_url}/v1", max_retries=0, timeout=10)
+    else:
+        llm = LLMClient("ollama", base_url=base_url, max_retries=0, timeout=10)
+    yield llm
+    llm.close()
+
+
+def test_chat_and_embed(client, mock_llm):
+    server, _ = mock_llm
+    answer = client.chat("mock-model", MESSAGES)
+    assert len(answer.split(" ")) == server.answer_tokens
+
+    vectors = client.embed("mock-embed", ["chest pain", "knee"])
+    np.testing.assert_allclose(vectors, [embed_text("chest pain", 8), embed_text("knee", 8)], rtol=1e-6)
+
+    stats = call_metrics()
+    assert stats[f"{client.name}.chat"]["calls"] == 1
+    assert stats[f"{client.name}.chat"]["completion_tokens"] == server.answer_tokens
+    assert stats[f"{client.name}.embed"]["calls"] == 1
+
+
+def test_stream_yields_the_whole_answer(client):
+    streamed = "".join(client.chat_stream("mock-model", MESSAGES))
+    assert streamed == client.chat("mock-model", MESSAGES)
+    assert call_metrics()[f"{client.name}.chat_stream"]["calls"] == 1
+
+
+def test_closing_a_stream_early_frees_its_slot(client):
+    client.set_concurrency(1)
+    stream = client.chat_stream("mock-model", MESSAGES)
+    next(stream)
+    assert not client._slots.acquire(blocking=False)
+    stream.close()
+    assert client._slots.acquire(blocking=False)
+    client._slots.release()
+    assert client.chat("mock-model", MESSAGES)
+
+
+def test_rate_limited_calls_are_retried(client, mock_llm, monkeypatch):
+    server, _ = mock_llm
+    # Ollama errors carry no retry-after hint, so the backoff would apply
+    monkeypatch.setattr(tools.llm_client, "backoff_delay", lambda attempt: 0.001)
+    server.error_rate = 0.5
+    client.max_retries = 20
+    for _ in range(5):
+        client.chat("mock-model", MESSAGES)
+        client.embed("mock-embed", ["knee"])
+
+    limited = server.stats()["rate_limited"]
+    assert limited > 0
+    stats = call_metrics()
+    assert stats[f"{client.name}.chat"]["retries"] + stats[f"{client.name}.embed"]["retries"] == limited
+    assert stats[f"{client.name}.chat"]["errors"] == 0
+
+
+def test_retries_give_up_after_max_retries(client, mock_llm, monkeypatch):
+    server, _ = mock_llm
+    monkeypatch.setattr(tools.llm_client, "backoff_delay", lambda attempt: 0.001)
+    server.error_rate = 1.0
+    client.max_retries = 2
+    with pytest.raises(Exception) as error:
+        client.embed("mock-embed", ["knee"])
+    assert getattr(error.value, "status_code", None) == 429
+    assert server.stats()["rate_limited"] == 3
+    assert call_metrics()[f"{client.name}.embed"]["errors"] == 1
+
+
+def test_async_calls(client):
+    async def run():
+        try:
+            answers = await asyncio.gather(*(client.achat("mock-model", MESSAGES) for _ in range(3)))
+            vectors = await client.aembed("mock-embed", ["knee"])
+        finally:
+            await client.aclose()
+        return answers, vectors
+
+    answers, vectors = asyncio.run(run())
+    assert len(set(answers)) == 1 and answers[0]
+    np.testing.assert_allclose(vectors, [embed_text("knee", 8)], rtol=1e-6)
+
+
+def test_known_embedding_models_get_their_real_width(mock_llm):
+    _, base_url = mock_llm
+    llm = LLMClient("ollama", base_url=base_url, max_retries=0, timeout=10)
+    assert len(llm.embed("mxbai-embed-large", ["knee"])[0]) == 1024
+    assert len(llm.embed("mxbai-embed-large:latest", ["knee"])[0]) == 1024
+    assert len(llm.embed("unknown-embed", ["knee"])[0]) == 8
+    llm.close()
+
+
+def test_unknown_provider():
+    with pytest.raises(ValueError):
+        LLMClient("anthropic")
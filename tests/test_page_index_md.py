@@ -0,0 +1,95 @@
+import os
+import re
+import sys
+import time
+import shutil
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "pageindex-rag"))
+
+from pageindex.page_index_md import parse_markdown, parse_markdown_batch, MIN_FILES_PER_POOL
+from pageindex.utils import write_node_id
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "markdown")
+FIXTURE_FILES = sorted(os.path.join(FIXTURES, name) for name in os.listdir(FIXTURES))
+
+
+def reference_parse(md_path):
+    """The original whole-file parser, kept as the reference for parse_markdown()."""
+    with open(md_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    nodes = []
+    current_node = None
+    for line in content.split('\n'):
+        match = re.match(r'^(#+)\s+(.+)$', line)
+        if match:
+            node = {'title': match.group(2), 'level': len(match.group(1)), 'text': '', 'nodes': []}
+            nodes.append(node)
+            current_node = node
+        elif current_node:
+            current_node['text'] += line + '\n'
+
+    root_nodes = []
+    stack = []
+    for node in nodes:
+        while stack and stack[-1]['level'] >= node['level']:
+            stack.pop()
+        if stack:
+            stack[-1]['nodes'].append(node)
+        else:
+            root_nodes.append(node)
+        stack.append(node)
+    write_node_id(root_nodes)
+    return root_nodes
+
+
+@pytest.mark.parametrize("md_path", FIXTURE_FILES, ids=os.path.basename)
+def test_matches_the_original_parser(md_path):
+    assert parse_markdown(md_path) == reference_parse(md_path)
+
+
+def test_tree_shape():
+    tree = parse_markdown(os.path.join(FIXTURES, "consult.md"))
+    assert [node['title'] for node in tree] == ["Consultation Note", "Assessment   ", "Plan"]
+    history, exam = tree[0]['nodes']
+    assert history['text'] == "Two weeks of chest pain.\n#not-a-header because there is no space\n\n"
+    assert history['nodes'][0]['title'] == "Medications"
+    assert [tree[0]['node_id'], history['node_id'], history['nodes'][0]['node_id'], exam['node_id']] == [
+        "0000", "0001", "0002", "0003"]
+
+
+def test_crlf_and_empty_files(tmp_path):
+    crlf = tmp_path / "crlf.md"
+    crlf.write_bytes(b"# Title\r\nline one\r\n## Sub\r\nline two\r\n")
+    empty = tmp_path / "empty.md"
+    empty.write_text("")
+    for path in (str(crlf), str(empty)):
+        assert parse_markdown(path) == reference_parse(path)
+
+
+def test_batch_keeps_input_order_with_and_without_a_pool(tmp_path):
+    paths = []
+    for i in range(MIN_FILES_PER_POOL + 4):
+        path = str(tmp_path / f"doc{i:03d}.md")
+        shutil.copy(FIXTURE_FILES[i % len(FIXTURE_FILES)], path)
+        paths.append(path)
+    expected = [reference_parse(path) for path in paths]
+    assert parse_markdown_batch(paths, max_workers=2) == expected
+    assert parse_markdown_batch(paths[:3]) == expected[:3]
+    assert parse_markdown_batch(paths, max_workers=1) == expected
+
+
+def test_parse_time_grows_linearly_with_node_size(tmp_path):
+    def parse_seconds(lines):
+        path = tmp_path / f"long{lines}.md"
+        path.write_text("# One long section\n" + "a line of node text\n" * lines)
+        start = time.perf_counter()
+        tree = parse_markdown(str(path))
+        elapsed = time.perf_counter() - start
+        assert tree[0]['text'].count("\n") == lines + 1
+        return elapsed
+
+    parse_seconds(1000)  # warm-up
+    small, large = min(parse_seconds(20_000) for _ in range(3)), min(parse_seconds(200_000) for _ in range(3))
+    # 10x the lines: ~10x the time when linear, ~100x when quadratic
+    assert large < small * 30
@@ -0,0 +1,44 @@
+import os
+import sys
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "pageindex-rag"))
+
+from pageindex.store import ShardedDocs, store_exists, write_store
+
+
+def make_doc(i):
+    return {'doc_name': f"doc{i}.md", 'structure': [{'title': f"Doc {i}", 'summary': f"Summary {i}",
+                                                    'text': f"text {i} é", 'nodes': []}]}
+
+
+def test_round_trip_and_entries(tmp_path):
+    path = str(tmp_path / "store")
+    docs = [make_doc(i) for i in range(10)]
+    write_store(path, docs, shard_size=3)
+    assert store_exists(path)
+
+    loaded = ShardedDocs(path, cache_size=4)
+    assert len(loaded) == 10
+    assert loaded.entry(7)['summary'] == "Summary 7"
+    assert list(loaded) == docs
+    assert loaded[-1] == docs[-1]
+    assert len(loaded._cache) == 4
+
+
+def test_concurrent_reads_share_a_bounded_cache(tmp_path):
+    path = str(tmp_path / "store")
+    docs = [make_doc(i) for i in range(50)]
+    write_store(path, docs, shard_size=8)
+    loaded = ShardedDocs(path, cache_size=5)
+
+    def read(seed):
+        rng = random.Random(seed)
+        for _ in range(500):
+            i = rng.randrange(len(docs))
+            assert loaded[i] == docs[i]
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(read, range(8)))
+    assert len(loaded._cache) <= 5
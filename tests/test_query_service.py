@@ -0,0 +1,108 @@
+import json
+import time
+import socket
+import threading
+import http.client
+import pytest
+
+import tools.query_service
+from tools.query_service import QueryService, ResidentIndex
+from tools.streaming import StreamingAnswer
+
+CHUNKS = [{'text': "chunk", 'medical_specialty': "Urology"}]
+
+
+def query(question, filters=None):
+    return f"answer to {question} {filters or ''}".strip(), CHUNKS
+
+
+def query_stream(question, filters=None):
+    return StreamingAnswer(iter(["answer", " to ", question]), CHUNKS)
+
+
+@pytest.fixture(scope="module")
+def port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    service = QueryService(query, ResidentIndex(lambda: "index"), max_workers=2, stream_func=query_stream)
+    # serve() blocks until interrupted; the daemon thread ends with the test process
+    threading.Thread(target=service.serve, args=("127.0.0.1", port), daemon=True).start()
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            break
+        except OSError:
+            time.sleep(0.05)
+    return port
+
+
+def post(port, path, body):
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    connection.request("POST", path, body=body if isinstance(body, bytes) else json.dumps(body).encode())
+    response = connection.getresponse()
+    data = response.read().decode()
+    connection.close()
+    return response.status, data
+
+
+def test_query(port):
+    status, data = post(port, "/query", {'question': "pain?", 'filters': {'medical_specialty': "Urology"}})
+    assert status == 200
+    result = json.loads(data)
+    assert result['answer'] == "answer to pain? {'medical_specialty': 'Urology'}"
+    assert result['chunks'] == CHUNKS
+
+
+def test_stream(port):
+    status, data = post(port, "/query/stream", {'question': "pain?"})
+    assert status == 200
+    lines = [json.loads(line) for line in data.splitlines()]
+    assert "".join(line['token'] for line in lines[:-1]) == "answer to pain?"
+    assert lines[-1]['done'] and lines[-1]['chunks'] == CHUNKS
+
+
+@pytest.mark.parametrize("path", ["/query", "/query/stream"])
+@pytest.mark.parametrize("body", [
+    b"not json",
+    b"[1, 2]",
+    b"",
+    {'question': ""},
+    {'question': 42},
+    {'question': "pain?", 'filters': "Urology"},
+], ids=["not-json", "not-object", "empty", "blank-question", "non-string-question", "bad-filters"])
+def test_malformed_queries_get_400(port, path, body):
+    status, data = post(port, path, body)
+    assert status == 400
+    assert json.loads(data)['error']
+
+
+def test_unknown_path(port):
+    assert post(port, "/answers", {'question': "pain?"})[0] == 404
+
+
+def test_streams_share_the_worker_limit():
+    service = QueryService(query, ResidentIndex(lambda: "index"), max_workers=1, stream_func=query_stream)
+    stream = service.stream("first?")
+    next(stream)
+    done = []
+    waiting = threading.Thread(target=lambda: done.append(service.query("second?")))
+    waiting.start()
+    waiting.join(0.2)
+    assert not done
+    # Closing the stream early frees its slot
+    stream.close()
+    waiting.join(5)
+    assert done and done[0]['answer'] == "answer to second?"
+    service.shutdown()
+
+
+def test_stats_cover_a_bounded_window(monkeypatch):
+    monkeypatch.setattr(tools.query_service, "STATS_WINDOW", 3)
+    service = QueryService(query, ResidentIndex(lambda: "index"), max_workers=2, stream_func=query_stream)
+    service.query_many([f"q{i}?" for i in range(4)])
+    list(service.stream("q4?"))
+    stats = service.stats()
+    assert stats['queries'] == 5 and stats['window'] == 3
+    assert len(service._latencies) == 3
+    service.shutdown()
@@ -0,0 +1,81 @@
+import asyncio
+import types
+import pytest
+
+import tools.rate_limiter
+from tools.rate_limiter import AsyncTokenBucket, backoff_delay, retry_after_seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A fake monotonic clock that asyncio.sleep() in the limiter advances; records the sleeps."""
+    state = types.SimpleNamespace(now=0.0, sleeps=[])
+
+    async def sleep(seconds):
+        state.sleeps.append(seconds)
+        state.now += seconds
+
+    monkeypatch.setattr(tools.rate_limiter, "time", types.SimpleNamespace(monotonic=lambda: state.now))
+    monkeypatch.setattr(tools.rate_limiter, "asyncio", types.SimpleNamespace(Lock=asyncio.Lock, sleep=sleep))
+    return state
+
+
+def test_bucket_starts_full_then_paces_at_the_refill_rate(clock):
+    async def run():
+        bucket = AsyncTokenBucket(per_minute=120)
+        await bucket.acquire(120)
+        assert clock.sleeps == []
+        await bucket.acquire(4)
+        # 2 units per second: 4 units take 2 seconds to refill
+        assert clock.now == pytest.approx(2.0)
+        clock.now += 60
+        await bucket.acquire(120)
+        assert clock.now == pytest.approx(62.0)
+    asyncio.run(run())
+
+
+def test_oversized_request_waits_for_a_full_bucket_only(clock):
+    async def run():
+        bucket = AsyncTokenBucket(per_minute=60)
+        await bucket.acquire(30)
+        await bucket.acquire(1000)
+        assert clock.now == pytest.approx(30.0)
+    asyncio.run(run())
+
+
+def test_waiters_are_served_in_arrival_order(clock):
+    async def run():
+        bucket = AsyncTokenBucket(per_minute=60)
+        await bucket.acquire(60)
+        order = []
+
+        async def take(name, amount):
+            await bucket.acquire(amount)
+            order.append((name, clock.now))
+
+        await asyncio.gather(take("a", 5), take("b", 1), take("c", 2))
+        return order
+    assert asyncio.run(run()) == [("a", pytest.approx(5.0)), ("b", pytest.approx(6.0)), ("c", pytest.approx(8.0))]
+
+
+def error_with_headers(headers):
+    return Exception() if headers is None else types.SimpleNamespace(response=types.SimpleNamespace(headers=headers))
+
+
+@pytest.mark.parametrize("headers, expected", [
+    ({'retry-after-ms': "250", 'retry-after': "3"}, 0.25),
+    ({'retry-after': "3"}, 3.0),
+    ({'retry-after': "Wed, 21 Oct 2026 07:28:00 GMT"}, None),
+    ({}, None),
+    (None, None),
+])
+def test_retry_after_seconds(headers, expected):
+    assert retry_after_seconds(error_with_headers(headers)) == expected
+
+
+def test_backoff_delay_is_capped_full_jitter(monkeypatch):
+    monkeypatch.setattr(tools.rate_limiter.random, "uniform", lambda low, high: (low, high))
+    assert backoff_delay(0) == (0, 1.0)
+    assert backoff_delay(3, base=0.5) == (0, 4.0)
+    assert backoff_delay(10) == (0, 60.0)
+    assert backoff_delay(10, cap=5) == (0, 5)
@@ -0,0 +1,117 @@
+import numpy as np
+import faiss
+import pytest
+
+from tools.chunk_store import ChunkStore, ChunkStoreWriter
+from tools.lexical_index import LexicalIndex, build_lexical_index
+from tools.retrieval import (diversify, filtered_search, l2_top_k, mmr_select,
+                             reciprocal_rank_fusion, retrieve)
+
+SPECIALTIES = ["Urology", "Cardiology"]
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    """40 chunks with random 8-d vectors, alternating specialty, 4 chunks per sample."""
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(40, 8)).astype('float32')
+    texts = [f"note {i} kidney stone" if i % 2 == 0 else f"note {i} heart murmur" for i in range(40)]
+    path = str(tmp_path / "store")
+    writer = ChunkStoreWriter(path)
+    writer.write({i: {'text': texts[i], 'medical_specialty': SPECIALTIES[i % 2], 'sample_name': f"S{i // 4}",
+                      'row_key': str(i // 4), 'ordinal': i % 4, 'token_start': 0, 'token_end': 1,
+                      'overlap_chars': 0}
+                  for i in range(40)}, vectors=vectors)
+    writer.close()
+    store = ChunkStore(path)
+    build_lexical_index(store, str(tmp_path / "lexical"))
+    index = faiss.IndexIDMap(faiss.IndexFlatL2(8))
+    index.add_with_ids(vectors, np.arange(40, dtype='int64'))
+    yield store, index, LexicalIndex(str(tmp_path / "lexical")), vectors
+    store.close()
+
+
+def test_l2_top_k_matches_flat_index(corpus):
+    _, index, _, vectors = corpus
+    queries = np.random.default_rng(1).normal(size=(3, 8)).astype('float32')
+    distances, rows = l2_top_k(queries, vectors, 5)
+    expected_distances, expected_rows = index.search(queries, 5)
+    assert rows.tolist() == expected_rows.tolist()
+    np.testing.assert_allclose(distances, expected_distances, rtol=1e-4)
+
+    distances, rows = l2_top_k(queries[:1], vectors[:2], 4)
+    assert rows[0, 2:].tolist() == [-1, -1]
+    assert np.isinf(distances[0, 2:]).all()
+
+
+def test_filtered_search_matches_brute_force(corpus):
+    store, _, _, vectors = corpus
+    query = np.random.default_rng(2).normal(size=(1, 8)).astype('float32')
+    _, ids = filtered_search(store, query, {'medical_specialty': 'cardiology'}, 3)
+
+    odd = np.arange(1, 40, 2)
+    expected = odd[np.argsort(((vectors[odd] - query) ** 2).sum(axis=1))[:3]]
+    assert ids[0].tolist() == expected.tolist()
+
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([[1, 2, 3, -1], [3, 1, 4]], k=60)
+    # 1 and 3 appear in both lists; 1 ranks higher on average (1st + 2nd vs 3rd + 1st)
+    assert fused == [1, 3, 2, 4]
+    assert reciprocal_rank_fusion([[5, 6], [6, 5]], k=60, limit=1) in ([5], [6])
+    assert reciprocal_rank_fusion([[-1]]) == []
+
+
+def test_mmr_select_trades_relevance_for_novelty():
+    relevance = np.array([1.0, 0.95, 0.5], dtype=np.float32)
+    # Candidates 0 and 1 are near-identical
+    similarity = np.array([[1.0, 0.99, 0.0], [0.99, 1.0, 0.0], [0.0, 0.0, 1.0]], dtype=np.float32)
+    assert mmr_select(relevance, similarity, 2, mmr_lambda=1.0) == [0, 1]
+    assert mmr_select(relevance, similarity, 2, mmr_lambda=0.5) == [0, 2]
+    assert mmr_select(relevance, similarity, 5, mmr_lambda=0.5) == [0, 2, 1]
+
+
+def test_diversify_drops_near_duplicates_of_the_same_sample(tmp_path):
+    base = np.array([1, 0, 0, 0], dtype='float32')
+    vectors = np.stack([base, base * 2, base + [0, 0.01, 0, 0], np.array([0, 1, 0, 0], dtype='float32')])
+    path = str(tmp_path / "store")
+    writer = ChunkStoreWriter(path)
+    # Chunks 0 and 1 share a sample; chunk 2 is just as similar but from another sample
+    writer.write({i: {'text': "t", 'medical_specialty': "X", 'sample_name': "S", 'row_key': key,
+                      'ordinal': i, 'token_start': 0, 'token_end': 1, 'overlap_chars': 0}
+                  for i, key in enumerate(["a", "a", "b", "c"])}, vectors=vectors)
+    writer.close()
+    store = ChunkStore(path)
+
+    assert diversify(store, [0, 1, 2, 3], None, 4, mmr_lambda=None) == [0, 2, 3]
+    assert diversify(store, [0, 1, 2, 3], None, 4, mmr_lambda=None, dedupe_threshold=None) == [0, 1, 2, 3]
+    # With MMR the near-identical chunk 2 is picked after the novel chunk 3
+    assert diversify(store, [0, 1, 2, 3], base, 2, mmr_lambda=0.3) == [0, 3]
+    store.close()
+
+
+def test_retrieve_modes(corpus):
+    store, index, lexical, vectors = corpus
+    queries = vectors[[4, 9]] + 0.01
+
+    vector_ids = retrieve(index, store, lexical, ["kidney", "heart"], queries, 3)
+    assert [ids[0] for ids in vector_ids] == [4, 9]
+
+    bm25_ids = retrieve(index, store, lexical, ["kidney stone", "heart murmur"], None, 3, mode="bm25")
+    assert all(i % 2 == 0 for i in bm25_ids[0]) and all(i % 2 == 1 for i in bm25_ids[1])
+
+    filtered = retrieve(index, store, lexical, ["kidney"], queries[:1], 3,
+                        filters={'medical_specialty': 'Cardiology'})
+    assert filtered[0] and all(i % 2 == 1 for i in filtered[0])
+
+    hybrid = retrieve(index, store, lexical, ["note 4 kidney"], queries[:1], 3, mode="hybrid")
+    assert hybrid[0][0] == 4 and len(hybrid[0]) == 3
+
+    diverse = retrieve(index, store, lexical, ["kidney"], queries[:1], 3,
+                       diversity={'candidates': 10, 'mmr_lambda': 0.7, 'dedupe_threshold': 0.95})
+    assert len(diverse[0]) == 3 and diverse[0][0] == 4
+
+    with pytest.raises(ValueError):
+        retrieve(index, store, None, ["kidney"], None, 3, mode="bm25")
+    with pytest.raises(ValueError):
+        retrieve(index, store, lexical, ["kidney"], queries[:1], 3, mode="fuzzy")
@@ -0,0 +1,70 @@
+"""
+Chunking Benchmark
+------------------
+Compares the per-row chunking path (get_token_chunks called once per row
+from df.iterrows(), resolving the encoding on every call, as ingest used
+to) with the batch API (chunk_rows: cached encoding, encode_batch and a
+process pool for large inputs). Also checks that both produce the same chunks.
+
+Usage:
+    python tools/benchmark_chunking.py --rows 5000 --workers 4
+"""
+import os
+import sys
+import time
+import argparse
+import tiktoken
+
+# Add parent dir to path to import tools
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from tools.data_processor import load_and_clean_data, normalize_data, chunk_rows, chunk_offsets
+
+DATA_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "mtsamples.csv")
+
+
+def per_row_chunks(df, model, chunk_size, overlap):
+    """The original path: resolve the encoding and tokenize one row at a time."""
+    all_chunks = []
+    for idx, row in df.iterrows():
+        encoding = tiktoken.encoding_for_model(model)
+        tokens = encoding.encode(row['transcription'])
+        for start, end in chunk_offsets(len(tokens), chunk_size, overlap):
+            all_chunks.append(encoding.decode(tokens[start:end]))
+    return all_chunks
+
+
+def batch_chunks(df, model, chunk_size, overlap, num_workers):
+    rows = [row for _, row in df.iterrows()]
+    records = chunk_rows(rows, model=model, chunk_size=chunk_size, overlap=overlap, num_workers=num_workers)
+    return [chunk['text'] for row_records in records for chunk in row_records]
+
+
+def run_benchmark(rows=None, model="gpt-4o-mini", chunk_size=400, overlap=50, num_workers=None):
+    df = normalize_data(load_and_clean_data(DATA_PATH))
+    if rows:
+        df = df.head(rows)
+    print(f"Benchmarking chunking of {len(df)} rows (chunk_size={chunk_size}, overlap={overlap})...")
+
+    start_time = time.time()
+    baseline = per_row_chunks(df, model, chunk_size, overlap)
+    per_row_time = time.time() - start_time
+
+    start_time = time.time()
+    batched = batch_chunks(df, model, chunk_size, overlap, num_workers)
+    batch_time = time.time() - start_time
+
+    print(f"Per-row : {per_row_time:.2f}s ({len(df) / per_row_time:.0f} rows/sec, {len(baseline)} chunks)")
+    print(f"Batch   : {batch_time:.2f}s ({len(df) / batch_time:.0f} rows/sec, {len(batched)} chunks)")
+    print(f"Speedup : {per_row_time / batch_time:.1f}x")
+    print(f"Identical chunks: {baseline == batched}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark per-row vs batch token chunking.")
+    parser.add_argument("--rows", type=int, default=None, help="Limit to the first N rows.")
+    parser.add_argument("--model", default="gpt-4o-mini")
+    parser.add_argument("--chunk-size", type=int, default=400)
+    parser.add_argument("--overlap", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=None, help="Process pool size (default: CPU count).")
+    args = parser.parse_args()
+    run_benchmark(args.rows, args.model, args.chunk_size, args.overlap, args.workers)
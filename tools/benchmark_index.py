@@ -0,0 +1,124 @@
+"""
+Index Benchmark
+---------------
+Measures recall@k against exact (flat) search, plus p50/p99 single-query
+search latency, for each supported FAISS index type over a sweep of its
+search parameter (nprobe for IVF, efSearch for HNSW). Uses the vectors of
+a backend's existing index, which must have been built with INDEX_TYPE =
+"flat". A random sample of them is held out as queries.
+
+Usage:
+    python tools/benchmark_index.py openai-rag --queries 200 --k 5
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import importlib.util
+import numpy as np
+import faiss
+
+# Add parent dir to path to import tools
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from tools.faiss_index import build_index, configure_search
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+SWEEPS = {
+    "flat": [None],
+    "ivf_flat": [1, 4, 8, 16, 32],
+    "ivf_pq": [1, 4, 8, 16, 32],
+    "hnsw": [16, 32, 64, 128],
+}
+
+
+def load_config(folder_name):
+    spec = importlib.util.spec_from_file_location(f"{folder_name}.config", os.path.join(ROOT_DIR, folder_name, "config.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_vectors(index_path):
+    index = faiss.read_index(index_path)
+    base = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+    if not isinstance(base, faiss.IndexFlat):
+        raise ValueError("Benchmark needs the exact vectors: rebuild the index with INDEX_TYPE = 'flat'.")
+    return base.reconstruct_n(0, base.ntotal)
+
+
+def recall_at_k(found, truth, k):
+    hits = sum(len(set(f[:k]) & set(t[:k])) for f, t in zip(found, truth))
+    return hits / (len(truth) * k)
+
+
+def time_queries(index, queries, k):
+    """Searches one query at a time; returns (ids, latencies in ms)."""
+    ids, latencies = [], []
+    for q in queries:
+        start_time = time.perf_counter()
+        _, found = index.search(q.reshape(1, -1), k)
+        latencies.append((time.perf_counter() - start_time) * 1000)
+        ids.append(found[0])
+    return np.array(ids), np.array(latencies)
+
+
+def run_benchmark(folder_name, num_queries=200, k=5, seed=0):
+    config = load_config(folder_name)
+    vectors = load_vectors(config.INDEX_PATH)
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(len(vectors))
+    queries = np.ascontiguousarray(vectors[order[:num_queries]])
+    corpus = np.ascontiguousarray(vectors[order[num_queries:]])
+    ids = np.arange(len(corpus), dtype='int64')
+    print(f"Benchmarking on {len(corpus)} vectors (dim {corpus.shape[1]}), {len(queries)} held-out queries, k={k}")
+
+    truth_index = build_index(corpus, "flat")
+    truth_index.add_with_ids(corpus, ids)
+    truth, _ = time_queries(truth_index, queries, k)
+
+    rows = []
+    for index_type, sweep in SWEEPS.items():
+        start_time = time.time()
+        index = build_index(corpus, index_type, nlist=config.IVF_NLIST, pq_m=config.PQ_M, hnsw_m=config.HNSW_M)
+        index.add_with_ids(corpus, ids)
+        build_time = time.time() - start_time
+
+        for param in sweep:
+            if index_type.startswith("ivf"):
+                configure_search(index, nprobe=param)
+            elif index_type == "hnsw":
+                configure_search(index, ef_search=param)
+            found, latencies = time_queries(index, queries, k)
+            rows.append({
+                "index_type": index_type,
+                "param": param,
+                "recall": recall_at_k(found, truth, k),
+                "p50_ms": float(np.percentile(latencies, 50)),
+                "p99_ms": float(np.percentile(latencies, 99)),
+                "build_s": build_time,
+            })
+
+    print(f"\n{'index':<10}{'param':>8}{'recall@' + str(k):>12}{'p50 ms':>10}{'p99 ms':>10}{'build s':>10}")
+    for r in rows:
+        param = "-" if r["param"] is None else r["param"]
+        print(f"{r['index_type']:<10}{param:>8}{r['recall']:>12.3f}{r['p50_ms']:>10.3f}{r['p99_ms']:>10.3f}{r['build_s']:>10.2f}")
+
+    results_dir = os.path.join(ROOT_DIR, "evaluation", "results")
+    if not os.path.exists(results_dir):
+        os.makedirs(results_dir)
+    result_file = os.path.join(results_dir, f"index_benchmark_{folder_name}.json")
+    with open(result_file, "w") as f:
+        json.dump({"backend": folder_name, "k": k, "queries": len(queries), "results": rows}, f, indent=4)
+    print(f"\nSaved results to {result_file}")
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall/latency benchmark of FAISS index types.")
+    parser.add_argument("backend", choices=["openai-rag", "local-model-rag"])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+    run_benchmark(args.backend, args.queries, args.k)
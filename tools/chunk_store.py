@@ -0,0 +1,411 @@
+"""
+Columnar Chunk Store
+--------------------
+Compact on-disk storage for chunk text and metadata, replacing the pickled
+metadata list. A store is a directory of:
+
+    text.bin            UTF-8 chunk texts, concatenated
+    <column>.bin        one fixed-width binary column per field (chunk id,
+                        text offset/length, dictionary codes for specialty,
+                        sample name and row key, chunk ordinal, token offsets,
+                        characters shared with the previous chunk)
+    vocab.json          the values behind each dictionary-coded column
+    deleted.bin         IDs of removed chunks (tombstones)
+    vectors.bin         float32 embedding of each chunk, row-aligned with
+                        the columns
+    <field>.order.bin   partition index for medical_specialty/sample_name:
+    <field>.offsets.bin row numbers sorted by value, and where each value's
+                        run starts, so one value's rows are a single slice
+
+Readers open every file through mmap, so opening a store costs almost
+nothing whatever the corpus size, and only the rows a query retrieves are
+turned into Python objects. Writers append, so ingest can write metadata
+batch by batch and incremental runs can add to an existing store.
+
+A full write builds the new store beside the old one and swaps the
+directory in on close(), so a running service that has the old files
+mapped keeps reading them unchanged rather than seeing them truncated.
+
+Removing a chunk only records a tombstone; its row, text and vector stay
+on disk. compact_store() rewrites the store without them, and ingest runs
+it once removed rows reach COMPACT_RATIO of the store.
+"""
+import os
+import json
+import mmap
+import shutil
+import numpy as np
+
+TEXT_FILE = "text.bin"
+VOCAB_FILE = "vocab.json"
+DELETED_FILE = "deleted.bin"
+VECTORS_FILE = "vectors.bin"
+
+COLUMNS = {
+    'id': np.int64,
+    'text_offset': np.int64,
+    'text_length': np.int32,
+    'medical_specialty': np.int32,
+    'sample_name': np.int32,
+    'row_key': np.int32,
+    'ordinal': np.int32,
+    'token_start': np.int32,
+    'token_end': np.int32,
+    'overlap_chars': np.int32,
+}
+# Repeated string fields, stored as int32 codes into vocab.json
+DICTIONARY_FIELDS = ('medical_specialty', 'sample_name', 'row_key')
+# Integer fields copied as-is (-1 when a chunk doesn't have one)
+INT_FIELDS = ('ordinal', 'token_start', 'token_end', 'overlap_chars')
+# Fields retrieval can filter on, each with a partition index
+PARTITION_FIELDS = ('medical_specialty', 'sample_name')
+
+# Share of removed rows at which ingest compacts the store
+COMPACT_RATIO = 0.2
+
+
+def store_exists(path):
+    return os.path.exists(os.path.join(path, VOCAB_FILE))
+
+
+def replace_dir(tmp_path, path):
+    """
+    Moves directory `tmp_path` to `path`, replacing what is there. Files of
+    the old directory are unlinked, not rewritten, so open readers keep
+    their mapped copies.
+    """
+    old_path = path.rstrip(os.sep) + ".old"
+    if os.path.exists(old_path):
+        shutil.rmtree(old_path)
+    if os.path.exists(path):
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    if os.path.exists(old_path):
+        shutil.rmtree(old_path)
+
+
+def _write_array(array, path):
+    # Replaced rather than rewritten, for readers that have the old file mapped
+    array.tofile(path + ".tmp")
+    os.replace(path + ".tmp", path)
+
+
+def _normalize_value(value):
+    return str(value).strip().casefold()
+
+
+class ChunkStoreWriter:
+    """
+    Appends chunks to a store. Chunk IDs must be written in increasing
+    order, which the ingest manifest's monotonic ID allocation guarantees.
+    Partition indexes are rebuilt on close().
+
+    Without `append`, the store is written to `<path>.build` and replaces
+    `path` on close(); until then readers see the previous store.
+    """
+
+    def __init__(self, path, append=False, with_vectors=True):
+        append = append and store_exists(path)
+        self.final_path = path
+        self.path = path if append else path.rstrip(os.sep) + ".build"
+        if not append and os.path.exists(self.path):
+            shutil.rmtree(self.path)  # left by an interrupted write
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+        path = self.path
+        mode = 'ab' if append else 'wb'
+
+        if append:
+            self._backfill_columns()
+        self._columns = {name: open(os.path.join(path, f"{name}.bin"), mode) for name in COLUMNS}
+        self._text = open(os.path.join(path, TEXT_FILE), mode)
+        self._deleted = open(os.path.join(path, DELETED_FILE), mode)
+        self._text_offset = os.path.getsize(os.path.join(path, TEXT_FILE))
+        # A store written before vectors were kept stays vector-less when appended to
+        vectors_path = os.path.join(path, VECTORS_FILE)
+        keep_vectors = with_vectors and (not append or os.path.exists(vectors_path))
+        self._vectors = open(vectors_path, mode) if keep_vectors else None
+
+        self.vocab = {field: [] for field in DICTIONARY_FIELDS}
+        self._last_id = -1
+        if append:
+            with open(os.path.join(path, VOCAB_FILE), 'r', encoding='utf-8') as f:
+                self.vocab = json.load(f)
+            ids = np.fromfile(os.path.join(path, "id.bin"), dtype=np.int64)
+            self._last_id = int(ids[-1]) if len(ids) else -1
+        self._codes = {field: {v: i for i, v in enumerate(values)} for field, values in self.vocab.items()}
+        self._save_vocab()
+
+    def _backfill_columns(self):
+        """Adds columns newer than the store, as -1 for its existing rows."""
+        rows = os.path.getsize(os.path.join(self.path, "id.bin")) // np.dtype(np.int64).itemsize
+        for name, dtype in COLUMNS.items():
+            column_path = os.path.join(self.path, f"{name}.bin")
+            if not os.path.exists(column_path):
+                np.full(rows, -1, dtype=dtype).tofile(column_path)
+
+    @property
+    def last_id(self):
+        """Highest chunk ID in the store (-1 if empty)."""
+        return self._last_id
+
+    def _code(self, field, value):
+        value = str(value)
+        codes = self._codes[field]
+        if value not in codes:
+            codes[value] = len(self.vocab[field])
+            self.vocab[field].append(value)
+        return codes[value]
+
+    def write(self, entries, vectors=None):
+        """
+        Appends {chunk_id: chunk} where each chunk has 'text' plus metadata
+        fields. `vectors` holds the chunks' embeddings in increasing chunk-ID
+        order.
+        """
+        columns = {name: [] for name in COLUMNS}
+        blobs = []
+        for chunk_id, chunk in sorted(entries.items()):
+            if chunk_id <= self._last_id:
+                raise ValueError(f"Chunk IDs must be written in increasing order (got {chunk_id} after {self._last_id}).")
+            self._last_id = chunk_id
+            data = chunk['text'].encode('utf-8')
+            columns['id'].append(chunk_id)
+            columns['text_offset'].append(self._text_offset)
+            columns['text_length'].append(len(data))
+            self._text_offset += len(data)
+            blobs.append(data)
+            for field in DICTIONARY_FIELDS:
+                columns[field].append(self._code(field, chunk.get(field, '')))
+            for field in INT_FIELDS:
+                columns[field].append(chunk.get(field, -1))
+
+        self._text.write(b"".join(blobs))
+        self._text.flush()
+        for name, dtype in COLUMNS.items():
+            self._columns[name].write(np.asarray(columns[name], dtype=dtype).tobytes())
+            self._columns[name].flush()
+        if self._vectors is not None:
+            if vectors is None or len(vectors) != len(entries):
+                raise ValueError("write() needs one vector per chunk.")
+            self._vectors.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+            self._vectors.flush()
+        self._save_vocab()
+
+    def remove(self, ids):
+        if ids:
+            self._deleted.write(np.asarray(ids, dtype=np.int64).tobytes())
+            self._deleted.flush()
+
+    def _save_vocab(self):
+        tmp_path = os.path.join(self.path, VOCAB_FILE + ".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.vocab, f, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(self.path, VOCAB_FILE))
+
+    def _write_partitions(self):
+        for field in PARTITION_FIELDS:
+            codes = np.fromfile(os.path.join(self.path, f"{field}.bin"), dtype=np.int32)
+            order = np.argsort(codes, kind='stable').astype(np.int64)
+            offsets = np.searchsorted(codes[order], np.arange(len(self.vocab[field]) + 1)).astype(np.int64)
+            _write_array(order, os.path.join(self.path, f"{field}.order.bin"))
+            _write_array(offsets, os.path.join(self.path, f"{field}.offsets.bin"))
+
+    def close(self):
+        for f in self._columns.values():
+            f.close()
+        self._text.close()
+        self._deleted.close()
+        if self._vectors is not None:
+            self._vectors.close()
+        self._write_partitions()
+        if self.path != self.final_path:
+            replace_dir(self.path, self.final_path)
+
+
+def _map_array(path, dtype, rows=0):
+    if not os.path.exists(path):
+        # A column added after the store was written: -1 ("not recorded") throughout
+        return np.full(rows, -1, dtype=dtype)
+    if os.path.getsize(path) == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r')
+
+
+class ChunkStore:
+    """
+    Read-only, memory-mapped view of a store. Supports `store[chunk_id]`,
+    `store.get_many(ids)`, `chunk_id in store` and `len(store)`; each lookup
+    materializes just the requested rows as chunk dicts.
+    """
+
+    def __init__(self, path):
+        if not store_exists(path):
+            raise FileNotFoundError(f"Chunk store not found at {path}. Run ingest.py first.")
+        self.path = path
+        rows = os.path.getsize(os.path.join(path, "id.bin")) // np.dtype(np.int64).itemsize
+        self.columns = {name: _map_array(os.path.join(path, f"{name}.bin"), dtype, rows)
+                        for name, dtype in COLUMNS.items()}
+        with open(os.path.join(path, VOCAB_FILE), 'r', encoding='utf-8') as f:
+            self.vocab = json.load(f)
+
+        self._text_file = open(os.path.join(path, TEXT_FILE), 'rb')
+        if os.path.getsize(os.path.join(path, TEXT_FILE)) > 0:
+            self._text = mmap.mmap(self._text_file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._text = b""
+        self._deleted_ids = np.fromfile(os.path.join(path, DELETED_FILE), dtype=np.int64)
+        self.deleted = set(self._deleted_ids.tolist())
+        self.vectors = self._map_vectors()
+        self._partitions = {}
+
+    def __len__(self):
+        return len(self.columns['id']) - len(self.deleted)
+
+    def removed_ratio(self):
+        """Share of the store's rows that are removed but still on disk."""
+        rows = len(self.columns['id'])
+        return len(self.deleted) / rows if rows else 0.0
+
+    def _map_vectors(self):
+        """(rows, dim) memmap of chunk embeddings, or None if the store has none."""
+        path = os.path.join(self.path, VECTORS_FILE)
+        rows = len(self.columns['id'])
+        if not rows or not os.path.exists(path):
+            return None
+        size = os.path.getsize(path)
+        if size == 0 or size % (4 * rows):
+            return None
+        return np.memmap(path, dtype=np.float32, mode='r', shape=(rows, size // (4 * rows)))
+
+    def _partition_index(self, field):
+        """(order, offsets) for a partition field, read once per store."""
+        if field not in self._partitions:
+            order_path = os.path.join(self.path, f"{field}.order.bin")
+            offsets_path = os.path.join(self.path, f"{field}.offsets.bin")
+            index = None
+            if os.path.exists(order_path) and os.path.exists(offsets_path):
+                order = _map_array(order_path, np.int64)
+                offsets = np.fromfile(offsets_path, dtype=np.int64)
+                if len(order) == len(self.columns['id']) and len(offsets) == len(self.vocab[field]) + 1:
+                    index = (order, offsets)
+            if index is None:
+                # Missing or stale (e.g. written by an older version): build it in memory
+                codes = np.asarray(self.columns[field])
+                order = np.argsort(codes, kind='stable')
+                offsets = np.searchsorted(codes[order], np.arange(len(self.vocab[field]) + 1))
+                index = (order, offsets)
+            self._partitions[field] = index
+        return self._partitions[field]
+
+    def partition(self, field, values):
+        """
+        Sorted row numbers of live chunks whose `field` equals any of
+        `values` (compared case-insensitively, ignoring surrounding spaces).
+        Cost is proportional to the size of the partition, not the store.
+        """
+        if field not in PARTITION_FIELDS:
+            raise ValueError(f"Can't filter on '{field}'. Choose one of {PARTITION_FIELDS}.")
+        if isinstance(values, str):
+            values = [values]
+        wanted = {_normalize_value(v) for v in values}
+        order, offsets = self._partition_index(field)
+        runs = [order[offsets[code]:offsets[code + 1]]
+                for code, value in enumerate(self.vocab[field]) if _normalize_value(value) in wanted]
+        positions = np.sort(np.concatenate(runs)) if runs else np.zeros(0, dtype=np.int64)
+        if len(self._deleted_ids) and len(positions):
+            positions = positions[~np.isin(self.columns['id'][positions], self._deleted_ids)]
+        return positions
+
+    def filter_ids(self, filters):
+        """Chunk IDs matching `filters` (see filter_positions)."""
+        return np.asarray(self.columns['id'])[self.filter_positions(filters)]
+
+    def filter_positions(self, filters):
+        """Row numbers matching every {field: value or [values]} in `filters`."""
+        positions = None
+        for field, values in filters.items():
+            matched = self.partition(field, values)
+            positions = matched if positions is None else np.intersect1d(positions, matched, assume_unique=True)
+        return positions if positions is not None else np.zeros(0, dtype=np.int64)
+
+    def position(self, chunk_id):
+        """Row number of a chunk ID in the columns, or -1 if absent/deleted."""
+        ids = self.columns['id']
+        pos = int(np.searchsorted(ids, chunk_id))
+        if pos < len(ids) and ids[pos] == chunk_id and int(chunk_id) not in self.deleted:
+            return pos
+        return -1
+
+    def positions(self, chunk_ids):
+        """Vectorized position(): row numbers of `chunk_ids`, -1 where absent/deleted."""
+        ids = self.columns['id']
+        chunk_ids = np.asarray(chunk_ids, dtype=np.int64)
+        pos = np.searchsorted(ids, chunk_ids)
+        found = pos < len(ids)
+        found[found] = ids[pos[found]] == chunk_ids[found]
+        if len(self._deleted_ids):
+            found &= ~np.isin(chunk_ids, self._deleted_ids)
+        return np.where(found, pos, -1)
+
+    def __contains__(self, chunk_id):
+        return self.position(chunk_id) != -1
+
+    def text(self, pos):
+        """Chunk text at column row `pos`."""
+        offset = int(self.columns['text_offset'][pos])
+        length = int(self.columns['text_length'][pos])
+        return self._text[offset:offset + length].decode('utf-8')
+
+    def row(self, pos):
+        """Materializes the chunk dict at column row `pos`."""
+        chunk = {'text': self.text(pos)}
+        for field in DICTIONARY_FIELDS:
+            chunk[field] = self.vocab[field][self.columns[field][pos]]
+        for field in INT_FIELDS:
+            chunk[field] = int(self.columns[field][pos])
+        return chunk
+
+    def __getitem__(self, chunk_id):
+        pos = self.position(chunk_id)
+        if pos == -1:
+            raise KeyError(chunk_id)
+        return self.row(pos)
+
+    def get_many(self, ids):
+        """Chunk dicts for `ids`, skipping any that are missing."""
+        chunks = []
+        for chunk_id in ids:
+            pos = self.position(chunk_id)
+            if pos != -1:
+                chunks.append(self.row(pos))
+        return chunks
+
+    def close(self):
+        if isinstance(self._text, mmap.mmap):
+            self._text.close()
+        self._text_file.close()
+
+
+def compact_store(path, batch_size=10000):
+    """
+    Rewrites the store at `path` without its removed chunks, reclaiming
+    their rows, text and vectors. Chunk IDs are unchanged, so the FAISS
+    and BM25 indexes built over the store stay valid. Returns the number of
+    rows dropped.
+    """
+    store = ChunkStore(path)
+    try:
+        ids = np.asarray(store.columns['id'])
+        live = np.flatnonzero(~np.isin(ids, store._deleted_ids))
+        # Written beside the store and swapped in on close()
+        writer = ChunkStoreWriter(path, with_vectors=store.vectors is not None)
+        for start in range(0, len(live), batch_size):
+            positions = live[start:start + batch_size]
+            vectors = store.vectors[positions] if store.vectors is not None else None
+            writer.write({int(ids[pos]): store.row(pos) for pos in positions}, vectors=vectors)
+        writer.close()
+        dropped = len(ids) - len(live)
+    finally:
+        store.close()
+    return dropped
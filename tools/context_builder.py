@@ -0,0 +1,111 @@
+"""
+Context Builder
+---------------
+Assembles the retrieved chunks into the prompt context under a token
+budget, for all three backends:
+
+    1. Adjacent chunks of the same sample (consecutive ordinals) are merged
+       into one passage, with the text they share through CHUNK_OVERLAP
+       stripped from the later one.
+    2. Passages are ranked by their best-ranked chunk.
+    3. Passages are packed greedily, best first, while they fit the budget;
+       the first passage is truncated if it alone is over budget.
+
+Chunks are either chunk dicts from the chunk store (with row_key, ordinal,
+token offsets and overlap_chars) or plain strings, which are treated as independent
+passages in the order given.
+"""
+from tools.data_processor import get_encoding
+
+SEPARATOR = "\n\n---\n\n"
+
+
+def _as_chunk(chunk, rank):
+    if isinstance(chunk, str):
+        return {'text': chunk, 'rank': rank}
+    return dict(chunk, rank=rank)
+
+
+def _without_overlap(previous, chunk, encoding):
+    """`chunk`'s text minus the part it shares with the previous chunk of its sample."""
+    if chunk.get('overlap_chars', -1) >= 0:
+        # Measured at chunking time on the original tokens: exact
+        return chunk['text'][chunk['overlap_chars']:]
+    # Older stores: re-tokenize, which can be off by a token where BPE
+    # merges differ at the chunk boundary
+    previous_end, start = previous.get('token_end', -1), chunk.get('token_start', -1)
+    overlap = max(0, previous_end - start) if previous_end >= 0 and start >= 0 else 0
+    return encoding.decode(encoding.encode(chunk['text'])[overlap:])
+
+
+def merge_adjacent(chunks, encoding):
+    """
+    Groups chunks of the same sample with consecutive ordinals into
+    passages. Returns [{'text', 'rank', 'chunks'}], where rank is the best
+    rank among the passage's chunks.
+    """
+    runs = {}
+    for chunk in chunks:
+        key = chunk.get('row_key')
+        if key is None or chunk.get('ordinal', -1) < 0:
+            runs[('rank', chunk['rank'])] = [chunk]
+        else:
+            runs.setdefault(('sample', key), []).append(chunk)
+
+    passages = []
+    for members in runs.values():
+        members.sort(key=lambda c: c.get('ordinal', 0))
+        current = None
+        for chunk in members:
+            if current is not None and chunk['ordinal'] == current['last']['ordinal'] + 1:
+                current['text'] += _without_overlap(current['last'], chunk, encoding)
+                current['rank'] = min(current['rank'], chunk['rank'])
+                current['chunks'] += 1
+                current['last'] = chunk
+            else:
+                if current is not None:
+                    passages.append(current)
+                current = {'text': chunk['text'], 'rank': chunk['rank'], 'chunks': 1, 'last': chunk}
+        if current is not None:
+            passages.append(current)
+
+    for passage in passages:
+        del passage['last']
+    passages.sort(key=lambda p: p['rank'])
+    return passages
+
+
+def build_context(chunks, token_budget, model="gpt-4o-mini", separator=SEPARATOR):
+    """
+    Builds the context string from `chunks` (best first) within
+    `token_budget` tokens of `model`'s encoding.
+
+    Returns:
+        tuple: (context, info) where info has 'tokens' (used), 'budget',
+        'passages' (included), 'chunks' (included) and 'dropped_chunks'.
+    """
+    encoding = get_encoding(model)
+    passages = merge_adjacent([_as_chunk(c, rank) for rank, c in enumerate(chunks)], encoding)
+    separator_tokens = len(encoding.encode(separator))
+
+    parts, used, included_chunks = [], 0, 0
+    for passage in passages:
+        cost = len(encoding.encode(passage['text'])) + (separator_tokens if parts else 0)
+        if used + cost <= token_budget:
+            parts.append(passage['text'])
+            used += cost
+            included_chunks += passage['chunks']
+        elif not parts and token_budget > 0:
+            # The best passage alone is over budget: keep as much of it as fits
+            parts.append(encoding.decode(encoding.encode(passage['text'])[:token_budget]))
+            used = token_budget
+            included_chunks += passage['chunks']
+
+    info = {
+        'tokens': used,
+        'budget': token_budget,
+        'passages': len(parts),
+        'chunks': included_chunks,
+        'dropped_chunks': len(chunks) - included_chunks,
+    }
+    return separator.join(parts), info
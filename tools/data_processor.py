@@ -2,6 +2,10 @@ import pandas as pd
 import os
 import tiktoken
 import re
+import math
+import hashlib
+import functools
+from concurrent.futures import ProcessPoolExecutor
 
 def normalize_query(text):
     """
@@ -11,18 +15,71 @@ def normalize_query(text):
     text = re.sub(r'[^\w\s?]', '', text)
     return text
 
+@functools.lru_cache(maxsize=None)
+def get_encoding(model="gpt-4o-mini"):
+    """
+    Returns the tiktoken encoding for a model, resolved once per process.
+    """
+    return tiktoken.encoding_for_model(model)
+
+def chunk_offsets(n_tokens, chunk_size=512, overlap=50):
+    """
+    Token (start, end) boundaries of each chunk of a document with
+    `n_tokens` tokens. Consecutive chunks share `overlap` tokens.
+    """
+    return [(i, min(i + chunk_size, n_tokens)) for i in range(0, n_tokens, chunk_size - overlap)]
+
 def get_token_chunks(text, model="gpt-4o-mini", chunk_size=512, overlap=50):
     """
     Step 3 of Embedding Strategy: Consistent token-based chunking.
     """
-    encoding = tiktoken.encoding_for_model(model)
+    encoding = get_encoding(model)
     tokens = encoding.encode(text)
+    return [encoding.decode(tokens[start:end]) for start, end in chunk_offsets(len(tokens), chunk_size, overlap)]
+
+def _encode_shard(args):
+    texts, model = args
+    return get_encoding(model).encode_batch(texts)
+
+# Fewest documents worth the start-up cost of a tokenizer process pool
+PARALLEL_TOKENIZE_THRESHOLD = 2000
+
+def tokenize_batch(texts, model="gpt-4o-mini", num_workers=None, parallel_threshold=PARALLEL_TOKENIZE_THRESHOLD):
+    """
+    Tokenizes many documents at once with `encode_batch`. Inputs of at least
+    `parallel_threshold` documents are split into shards across a process
+    pool of `num_workers` (default: CPU count).
     
-    chunks = []
-    for i in range(0, len(tokens), chunk_size - overlap):
-        chunk_tokens = tokens[i : i + chunk_size]
-        chunks.append(encoding.decode(chunk_tokens))
-    return chunks
+    Returns:
+        list: One token list per input text, in input order.
+    """
+    if num_workers == 1 or len(texts) < parallel_threshold:
+        return get_encoding(model).encode_batch(texts)
+    
+    num_workers = num_workers or os.cpu_count() or 1
+    shard_size = math.ceil(len(texts) / num_workers)
+    shards = [(texts[i:i + shard_size], model) for i in range(0, len(texts), shard_size)]
+    with ProcessPoolExecutor(max_workers=num_workers) as pool:
+        return [tokens for shard in pool.map(_encode_shard, shards) for tokens in shard]
+
+def get_token_chunks_batch(texts, model="gpt-4o-mini", chunk_size=512, overlap=50, num_workers=None):
+    """
+    Batch counterpart of get_token_chunks. Instead of decoded strings it
+    returns, per document, its tokens and the (start, end) token offsets of
+    each chunk, so any chunk can be decoded later with decode_chunk().
+    
+    Returns:
+        list: One (tokens, offsets) tuple per input text.
+    """
+    token_lists = tokenize_batch(texts, model=model, num_workers=num_workers)
+    return [(tokens, chunk_offsets(len(tokens), chunk_size, overlap)) for tokens in token_lists]
+
+def decode_chunk(tokens, offsets, model="gpt-4o-mini"):
+    """
+    Decodes the chunk at token `offsets` (start, end) of a tokenized document.
+    """
+    start, end = offsets
+    return get_encoding(model).decode(tokens[start:end])
 
 def load_and_clean_data(file_path):
     """
@@ -69,6 +126,73 @@ def normalize_data(df):
     
     return df
 
+def iter_clean_rows(file_path, chunksize=1000):
+    """
+    Streaming counterpart of load_and_clean_data + normalize_data. Reads the
+    CSV `chunksize` rows at a time and yields (row_index, row) for every
+    cleaned row, so memory stays flat however large the file is.
+    
+    Args:
+        file_path (str): Path to the mtsamples.csv file.
+        chunksize (int): Rows read from disk per step.
+    Yields:
+        tuple: (index label, pd.Series) in file order, like DataFrame.iterrows().
+    """
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"Dataset not found at {file_path}")
+    
+    print(f"Streaming dataset from {file_path}...")
+    # Only a 16-byte digest per row is kept to drop duplicates across chunks
+    seen = set()
+    for frame in pd.read_csv(file_path, chunksize=chunksize):
+        frame = frame.dropna(subset=['transcription'])
+        digests = [hashlib.md5("\x1f".join(map(str, values)).encode("utf-8")).digest()
+                   for values in frame.itertuples(index=False)]
+        keep = []
+        for digest in digests:
+            keep.append(digest not in seen)
+            seen.add(digest)
+        frame = normalize_data(frame[keep].copy())
+        # MTSamples carries its own row id in an unnamed leading column; use it
+        # as the row label so keys survive rows being removed or reordered
+        if 'unnamed: 0' in frame.columns:
+            frame = frame.set_index('unnamed: 0', drop=False)
+        yield from frame.iterrows()
+
+def chunk_rows(rows, model="gpt-4o-mini", chunk_size=512, overlap=50, num_workers=None):
+    """
+    Chunks a batch of normalized rows in one tokenizer pass.
+    
+    Args:
+        rows (list): pd.Series rows with transcription/medical_specialty/sample_name.
+    Returns:
+        list: Per row, its chunk dicts (text plus metadata). Each chunk records
+        its position within the row ('ordinal'), its token offsets, and how
+        many leading characters of its text repeat the previous chunk
+        ('overlap_chars'), measured on the original tokens so that adjacent
+        chunks can later be joined without re-tokenizing.
+    """
+    tokenized = get_token_chunks_batch([row['transcription'] for row in rows], model=model,
+                                       chunk_size=chunk_size, overlap=overlap, num_workers=num_workers)
+    records = []
+    for row, (tokens, offsets) in zip(rows, tokenized):
+        previous_end = 0
+        chunks = []
+        for ordinal, span in enumerate(offsets):
+            shared = (span[0], max(span[0], previous_end))
+            chunks.append({
+                'text': decode_chunk(tokens, span, model),
+                'medical_specialty': row['medical_specialty'],
+                'sample_name': row['sample_name'],
+                'ordinal': ordinal,
+                'token_start': span[0],
+                'token_end': span[1],
+                'overlap_chars': len(decode_chunk(tokens, shared, model)),
+            })
+            previous_end = span[1]
+        records.append(chunks)
+    return records
+
 
 if __name__ == "__main__":
     # Test loading
@@ -0,0 +1,34 @@
+"""
+Content-Addressed Embedding Cache
+---------------------------------
+A persistent SQLite store of embeddings keyed by (embedding model, SHA-256 of
+the chunk text). Ingest scripts look chunks up here before calling the
+embedding API, so re-ingesting unchanged text makes no model calls.
+"""
+import numpy as np
+
+from tools.keyed_cache import KeyedCache
+
+
+class EmbeddingCache(KeyedCache):
+    """
+    On-disk embedding cache for a single embedding model. Vectors are stored
+    as raw float32 bytes. Hit and miss counts are kept for reporting.
+    `model` names the vector space: the model, plus anything else that
+    changes its vectors (e.g. a different endpoint or normalization).
+    """
+
+    def __init__(self, path, model):
+        super().__init__(path, "embeddings", "vector", "BLOB", label="Embedding cache")
+        self.model = model
+
+    def get_many(self, texts):
+        """
+        Returns a list aligned with `texts`: the cached vector (float32 array)
+        for each hit and None for each miss.
+        """
+        return [np.frombuffer(blob, dtype=np.float32) if blob is not None else None
+                for blob in self.get_values(self.model, texts)]
+
+    def put_many(self, texts, vectors):
+        self.put_values(self.model, texts, [np.asarray(v, dtype=np.float32).tobytes() for v in vectors])
@@ -0,0 +1,100 @@
+"""
+FAISS Index Factory
+-------------------
+Builds the vector index selected by a backend's config.py and applies its
+query-time search parameters. Supported types:
+
+    flat      exact linear scan (IndexFlatL2)
+    ivf_flat  inverted lists over full vectors; tune `nprobe`
+    ivf_pq    inverted lists over product-quantized codes; tune `nprobe`
+    hnsw      graph search; tune `efSearch`
+
+Every index is addressable by chunk ID (IndexIDMap2 for flat/hnsw, native
+IDs for IVF). IVF types are trained automatically from the first vectors
+ingested.
+"""
+import math
+import numpy as np
+import faiss
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+
+
+def needs_training(index_type):
+    return index_type in ("ivf_flat", "ivf_pq")
+
+
+def supports_removal(index_type):
+    """HNSW graphs can't delete vectors, so incremental updates need a rebuild."""
+    return index_type != "hnsw"
+
+
+def training_size(index_type, nlist=100):
+    """
+    Vectors to collect before training: FAISS recommends ~39 points per
+    centroid, and IVF-PQ also needs enough for its 256-entry codebooks.
+    """
+    if index_type == "ivf_pq":
+        return max(39 * nlist, 39 * 256)
+    return 39 * nlist
+
+
+def build_index(vectors, index_type="flat", nlist=100, pq_m=32, hnsw_m=32):
+    """
+    Creates an empty ID-addressable index for vectors of this dimension,
+    training it on `vectors` if the type needs it. nlist and the PQ code
+    size are reduced when there are too few training vectors.
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown INDEX_TYPE '{index_type}'. Choose one of {INDEX_TYPES}.")
+    vectors = np.ascontiguousarray(vectors, dtype='float32')
+    n, dimension = vectors.shape
+
+    if index_type == "flat":
+        return faiss.IndexIDMap2(faiss.IndexFlatL2(dimension))
+    if index_type == "hnsw":
+        return faiss.IndexIDMap2(faiss.IndexHNSWFlat(dimension, hnsw_m))
+
+    nlist = max(1, min(nlist, n // 39 or n))
+    quantizer = faiss.IndexFlatL2(dimension)
+    if index_type == "ivf_flat":
+        index = faiss.IndexIVFFlat(quantizer, dimension, nlist)
+    else:
+        if dimension % pq_m != 0:
+            raise ValueError(f"PQ_M={pq_m} must divide the embedding dimension {dimension}.")
+        nbits = min(8, max(1, int(math.log2(n))))
+        index = faiss.IndexIVFPQ(quantizer, dimension, nlist, pq_m, nbits)
+
+    print(f"Training {index_type} index (nlist={nlist}) on {n} vectors...")
+    index.train(vectors)
+    return index
+
+
+def read_index(path, mmap=True):
+    """
+    Loads an index for querying. With mmap=True the file is memory-mapped
+    read-only where the index type supports it, so load time and resident
+    memory barely depend on index size; other types are read normally.
+    """
+    if mmap:
+        try:
+            return faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError:
+            pass
+    return faiss.read_index(path)
+
+
+def configure_search(index, nprobe=None, ef_search=None):
+    """Applies query-time parameters that are meaningful for this index."""
+    params = faiss.ParameterSpace()
+    if nprobe is not None and faiss.try_extract_index_ivf(index) is not None:
+        params.set_index_parameter(index, "nprobe", nprobe)
+    if ef_search is not None and _is_hnsw(index):
+        params.set_index_parameter(index, "efSearch", ef_search)
+    return index
+
+
+def _is_hnsw(index):
+    if isinstance(index, faiss.IndexIDMap):
+        index = faiss.downcast_index(index.index)
+    return isinstance(index, faiss.IndexHNSW)
@@ -0,0 +1,79 @@
+"""
+Ingest Manifest
+---------------
+Records which source rows are already in a vector index, a fingerprint of
+each row's content and the FAISS IDs of its chunks. Incremental ingestion
+checks each CSV row against it, so only new or changed rows get embedded
+and only stale vectors get removed.
+"""
+import os
+import json
+import hashlib
+
+
+def row_fingerprint(row):
+    """Hash of every field that ends up in a row's chunks or their metadata."""
+    parts = [str(row['transcription']), str(row['medical_specialty']), str(row['sample_name'])]
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+class IngestManifest:
+    """
+    Maps a row key (the row's position label in mtsamples.csv) to its
+    fingerprint and chunk IDs. Chunk IDs are allocated monotonically and
+    never reused, so a removed vector can't be confused with a new one.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.rows = {}
+        self.next_id = 0
+        # Build settings the index was created with (e.g. index type)
+        self.settings = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.rows = data.get('rows', {})
+            self.next_id = data.get('next_id', 0)
+            self.settings = data.get('settings', {})
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def reset(self):
+        """Starts over for a full rebuild."""
+        self.rows = {}
+        self.next_id = 0
+        self.settings = {}
+
+    def is_current(self, key, fingerprint):
+        """True if the row is indexed and unchanged since it was."""
+        entry = self.rows.get(key)
+        return entry is not None and entry['hash'] == fingerprint
+
+    def ids_for(self, keys):
+        ids = []
+        for key in keys:
+            ids.extend(self.rows.get(key, {}).get('ids', []))
+        return ids
+
+    def allocate_ids(self, n):
+        ids = list(range(self.next_id, self.next_id + n))
+        self.next_id += n
+        return ids
+
+    def record(self, key, fingerprint, ids):
+        """
+        Stores a row's chunk IDs. Pass fingerprint=None for a row whose
+        chunks were only partly embedded, so the next run retries it.
+        """
+        self.rows[key] = {'hash': fingerprint, 'ids': list(ids)}
+
+    def forget(self, key):
+        self.rows.pop(key, None)
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'next_id': self.next_id, 'settings': self.settings, 'rows': self.rows}, f)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,293 @@
+"""
+Streaming Ingest Pipeline
+-------------------------
+The ingest loop shared by the vector backends. CSV rows are read in chunks,
+split into token chunks, embedded a batch at a time and added to the FAISS
+index as they go, with chunk text, metadata and vectors appended to the
+chunk store per batch. Apart from the index itself, memory stays flat in
+the size of the corpus.
+
+Each backend supplies only its embedding function.
+
+Incremental runs leave removed chunks in the chunk store as tombstones;
+the store is compacted once they reach COMPACT_RATIO of its rows.
+"""
+import os
+import time
+import itertools
+import numpy as np
+import faiss
+
+from tools.data_processor import iter_clean_rows, chunk_rows, PARALLEL_TOKENIZE_THRESHOLD
+from tools.embedding_cache import EmbeddingCache
+from tools.ingest_manifest import IngestManifest, row_fingerprint
+from tools.chunk_store import ChunkStore, ChunkStoreWriter, store_exists, compact_store, COMPACT_RATIO
+from tools.lexical_index import build_lexical_index, lexical_index_exists
+from tools.faiss_index import build_index, needs_training, supports_removal, training_size
+
+
+class StreamingIndexer:
+    """
+    Owns the index, manifest, chunk store writer and embedding cache for one
+    ingest run, and applies one batch of rows at a time.
+
+    `embed_func(texts, on_batch)` must return one vector per text (None for
+    a text that could not be embedded) and call `on_batch(texts, vectors)`
+    for each sub-batch as it completes.
+
+    `index_params` (index_type, nlist, pq_m, hnsw_m) select the FAISS index
+    type. Types that need training buffer vectors until there are enough to
+    train on, then build the index and add the buffer.
+
+    If `lexical_index_path` is given, the BM25 index is rebuilt from the
+    chunk store once the chunks are written.
+    """
+
+    def __init__(self, embed_func, index_path, chunk_store_path, manifest_path,
+                 cache_path, embed_model, index_params=None, incremental=False,
+                 lexical_index_path=None):
+        self.embed_func = embed_func
+        self.index_path = index_path
+        self.chunk_store_path = chunk_store_path
+        self.lexical_index_path = lexical_index_path
+        self.manifest = IngestManifest(manifest_path)
+        self.index = None
+        self.index_params = dict(index_params or {'index_type': 'flat'})
+        self.index_type = self.index_params['index_type']
+        self._pending_vectors, self._pending_ids = [], []
+
+        resume = (incremental and self.manifest.exists()
+                  and os.path.exists(index_path) and store_exists(chunk_store_path))
+        if incremental and not resume:
+            print("No existing manifest/index found. Running a full ingest.")
+        elif resume and self.manifest.settings.get('index_params') != self.index_params:
+            print("Index settings changed since the last ingest. Running a full ingest.")
+            resume = False
+        elif resume and self.manifest.settings.get('embed_model') != embed_model:
+            # Vectors from another model or endpoint must not share the index
+            print("Embedding model changed since the last ingest. Running a full ingest.")
+            resume = False
+        elif resume and not supports_removal(self.index_type):
+            print(f"A {self.index_type} index can't remove vectors. Running a full ingest.")
+            resume = False
+
+        if resume:
+            self.index = faiss.read_index(index_path)
+        else:
+            self.manifest.reset()
+            self.manifest.settings['index_params'] = self.index_params
+            self.manifest.settings['embed_model'] = embed_model
+        self.incremental = resume
+
+        self.metadata = ChunkStoreWriter(chunk_store_path, append=resume)
+        if resume:
+            self._drop_orphans()
+        self.cache = EmbeddingCache(cache_path, embed_model)
+        self.stats = {'rows': 0, 'unchanged': 0, 'chunks': 0, 'skipped_chunks': 0, 'removed_rows': 0}
+
+    def _drop_orphans(self):
+        """
+        A run that stopped after appending chunks but before saving the
+        manifest leaves chunks the manifest never recorded, with IDs at or
+        above its next_id. Their rows are not marked current, so this run
+        re-ingests them; the stale chunks are removed and new IDs are
+        allocated past them.
+        """
+        store = ChunkStore(self.chunk_store_path)
+        try:
+            ids = np.asarray(store.columns['id'])
+            orphans = [int(i) for i in ids[ids >= self.manifest.next_id] if int(i) not in store.deleted]
+        finally:
+            store.close()
+        if orphans:
+            print(f"Removing {len(orphans)} chunks left by an interrupted ingest.")
+            self.remove(orphans)
+        self.manifest.next_id = max(self.manifest.next_id, self.metadata.last_id + 1)
+
+    def add_rows(self, rows):
+        """
+        Embeds and indexes a batch of (row_key, fingerprint, chunk_records).
+        Vectors of rows that were indexed before are replaced.
+        """
+        chunks = [(key, chunk) for key, _, records in rows for chunk in records]
+        texts = [chunk['text'] for _, chunk in chunks]
+
+        # Only chunks whose text is not already cached go to the model
+        vectors = self.cache.get_many(texts)
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        if missing:
+            fresh = self.embed_func([texts[i] for i in missing], on_batch=self._store)
+            for i, vector in zip(missing, fresh):
+                vectors[i] = vector
+
+        self.remove(self.manifest.ids_for(key for key, _, _ in rows))
+
+        # Keep chunks and embeddings aligned: a chunk is only indexed if it has a vector
+        kept = [i for i, v in enumerate(vectors) if v is not None]
+        incomplete = {chunks[i][0] for i, v in enumerate(vectors) if v is None}
+        ids = self.manifest.allocate_ids(len(kept))
+        if kept:
+            embeddings = np.asarray([vectors[i] for i in kept], dtype='float32')
+            self._add(embeddings, np.array(ids, dtype='int64'))
+            self.metadata.write({chunk_id: dict(chunks[i][1], row_key=chunks[i][0])
+                                 for chunk_id, i in zip(ids, kept)}, vectors=embeddings)
+
+        row_ids = {}
+        for chunk_id, i in zip(ids, kept):
+            row_ids.setdefault(chunks[i][0], []).append(chunk_id)
+        for key, fingerprint, _ in rows:
+            # Rows that lost chunks are stored without a fingerprint so the next run retries them
+            self.manifest.record(key, None if key in incomplete else fingerprint, row_ids.get(key, []))
+
+        self.stats['rows'] += len(rows)
+        self.stats['chunks'] += len(kept)
+        self.stats['skipped_chunks'] += len(texts) - len(kept)
+
+    def _add(self, embeddings, ids):
+        if self.index is None:
+            self._pending_vectors.append(embeddings)
+            self._pending_ids.append(ids)
+            buffered = sum(len(v) for v in self._pending_vectors)
+            if needs_training(self.index_type) and buffered < training_size(self.index_type, self.index_params.get('nlist', 100)):
+                return
+            self._build_from_pending()
+        else:
+            self.index.add_with_ids(embeddings, ids)
+
+    def _build_from_pending(self):
+        vectors = np.concatenate(self._pending_vectors)
+        self.index = build_index(vectors, **self.index_params)
+        self.index.add_with_ids(vectors, np.concatenate(self._pending_ids))
+        self._pending_vectors, self._pending_ids = [], []
+
+    def remove(self, ids):
+        if ids and self.index is not None:
+            self.index.remove_ids(np.array(ids, dtype='int64'))
+            self.metadata.remove(ids)
+
+    def remove_rows(self, keys):
+        """Drops rows that are no longer in the source."""
+        self.remove(self.manifest.ids_for(keys))
+        for key in keys:
+            self.manifest.forget(key)
+        self.stats['removed_rows'] += len(keys)
+
+    def _store(self, texts, vectors):
+        done = [(t, v) for t, v in zip(texts, vectors) if v is not None]
+        if done:
+            self.cache.put_many([t for t, _ in done], [v for _, v in done])
+
+    def finish(self):
+        """Writes the index and manifest. Returns False if nothing was indexed."""
+        self.metadata.close()
+        self.cache.report()
+        self.cache.close()
+        if self.index is None and self._pending_vectors:
+            # Fewer vectors than the training target: train on what there is
+            self._build_from_pending()
+        if self.index is None:
+            return False
+        changed = not self.incremental or self.stats['rows'] or self.stats['removed_rows']
+        if changed or (self.lexical_index_path and not lexical_index_exists(self.lexical_index_path)):
+            self._build_lexical_index()
+        if not changed:
+            print("Index is already up to date.")
+            return True
+        print(f"Saving index to {self.index_path}...")
+        # Replaced, not rewritten in place: a running service may have the old index mapped
+        faiss.write_index(self.index, self.index_path + ".tmp")
+        os.replace(self.index_path + ".tmp", self.index_path)
+        self.manifest.save()
+        if self.incremental:
+            # Last, so a crash before here leaves the old store fully intact
+            self._compact_if_needed()
+        return True
+
+    def _compact_if_needed(self):
+        store = ChunkStore(self.chunk_store_path)
+        try:
+            removed, ratio = len(store.deleted), store.removed_ratio()
+        finally:
+            store.close()
+        if ratio >= COMPACT_RATIO:
+            dropped = compact_store(self.chunk_store_path)
+            print(f"Compacted chunk store: dropped {dropped} removed chunks.")
+        elif removed:
+            print(f"Chunk store holds {removed} removed chunks ({ratio:.0%}); "
+                  f"it is compacted at {COMPACT_RATIO:.0%}.")
+
+    def _build_lexical_index(self):
+        if not self.lexical_index_path:
+            return
+        store = ChunkStore(self.chunk_store_path)
+        try:
+            count = build_lexical_index(store, self.lexical_index_path)
+        finally:
+            store.close()
+        print(f"Built BM25 index over {count} chunks at {self.lexical_index_path}.")
+
+
+def run_ingest(embed_func, data_path, index_path, chunk_store_path, manifest_path,
+               cache_path, embed_model, chunk_model, chunk_size, chunk_overlap,
+               sample_limit=None, batch_size=200, index_params=None, incremental=False,
+               lexical_index_path=None, tokenize_batch_size=PARALLEL_TOKENIZE_THRESHOLD):
+    """
+    Streams `data_path` through chunking, embedding and indexing.
+
+    Args:
+        embed_func: Backend embedding function (see StreamingIndexer).
+        sample_limit (int): Only the first N cleaned rows are ingested (None for all).
+        batch_size (int): Rows per embed/index step.
+        tokenize_batch_size (int): Rows chunked per tokenizer pass; at the
+            default, each pass is large enough to use the process pool.
+        index_params (dict): index_type, nlist, pq_m, hnsw_m (see tools/faiss_index.py).
+        incremental (bool): Skip rows that are unchanged since the last run.
+        lexical_index_path (str): Where to build the BM25 index (None to skip).
+    Returns:
+        bool: True if an index was written.
+    """
+    indexer = StreamingIndexer(embed_func, index_path, chunk_store_path, manifest_path,
+                               cache_path, embed_model, index_params=index_params,
+                               incremental=incremental, lexical_index_path=lexical_index_path)
+    start_time = time.time()
+
+    rows = iter_clean_rows(data_path)
+    if sample_limit:
+        print(f"Limiting to {sample_limit} samples for standardized comparison.")
+        rows = itertools.islice(rows, sample_limit)
+
+    def flush(pending):
+        # One tokenizer pass over many rows, then embedding/indexing batch by batch
+        records = chunk_rows([row for _, _, row in pending], model=chunk_model,
+                             chunk_size=chunk_size, overlap=chunk_overlap)
+        for start in range(0, len(pending), batch_size):
+            batch = zip(pending[start:start + batch_size], records[start:start + batch_size])
+            indexer.add_rows([(key, fingerprint, recs) for (key, fingerprint, _), recs in batch])
+            print(f"Indexed {indexer.stats['chunks']} chunks from {indexer.stats['rows']} rows "
+                  f"({time.time() - start_time:.1f}s elapsed)...")
+
+    seen = set()
+    pending = []
+    for idx, row in rows:
+        key = str(idx)
+        seen.add(key)
+        fingerprint = row_fingerprint(row)
+        if indexer.incremental and indexer.manifest.is_current(key, fingerprint):
+            indexer.stats['unchanged'] += 1
+            continue
+
+        pending.append((key, fingerprint, row))
+        if len(pending) >= max(batch_size, tokenize_batch_size):
+            flush(pending)
+            pending = []
+
+    if pending:
+        flush(pending)
+
+    if indexer.incremental:
+        indexer.remove_rows([key for key in indexer.manifest.rows if key not in seen])
+
+    stats = indexer.stats
+    print(f"Rows ingested: {stats['rows']}, unchanged: {stats['unchanged']}, removed: {stats['removed_rows']}. "
+          f"Chunks indexed: {stats['chunks']}, skipped: {stats['skipped_chunks']}.")
+    return indexer.finish()
@@ -0,0 +1,92 @@
+"""
+Keyed SQLite Cache
+------------------
+A persistent SQLite table of values keyed by (model, SHA-256 of a text),
+shared by the embedding cache (tools/embedding_cache.py) and PageIndex's
+node summary cache. Each table is
+
+    model TEXT, text_hash TEXT, <value column>, PRIMARY KEY (model, text_hash)
+
+so caches written before this module existed are read as they are.
+"""
+import os
+import hashlib
+import sqlite3
+import threading
+
+# SQLite caps the number of bound parameters per statement
+LOOKUP_BATCH = 500
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class KeyedCache:
+    """
+    One cache table, safe to share between threads. Values are stored as
+    given (bytes for a BLOB column, str for TEXT); subclasses convert them.
+    Hit and miss counts are kept for report().
+    """
+
+    def __init__(self, path, table, value_column, value_type, label):
+        self.path = path
+        self.table = table
+        self.value_column = value_column
+        self.label = label
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        cache_dir = os.path.dirname(path)
+        if cache_dir and not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            " model TEXT NOT NULL,"
+            " text_hash TEXT NOT NULL,"
+            f" {value_column} {value_type} NOT NULL,"
+            " PRIMARY KEY (model, text_hash))"
+        )
+        self._conn.commit()
+
+    def get_values(self, model, texts):
+        """A list aligned with `texts`: the stored value for each hit, None for each miss."""
+        hashes = [text_hash(t) for t in texts]
+        found = {}
+        with self._lock:
+            for i in range(0, len(hashes), LOOKUP_BATCH):
+                batch = hashes[i:i + LOOKUP_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, {self.value_column} FROM {self.table}"
+                    f" WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model] + batch,
+                ).fetchall()
+                found.update(rows)
+
+            results = [found.get(h) for h in hashes]
+            hit_count = sum(1 for r in results if r is not None)
+            self.hits += hit_count
+            self.misses += len(results) - hit_count
+        return results
+
+    def put_values(self, model, texts, values):
+        rows = [(model, text_hash(t), v) for t, v in zip(texts, values)]
+        with self._lock:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO {self.table} (model, text_hash, {self.value_column}) VALUES (?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+
+    def report(self):
+        total = self.hits + self.misses
+        rate = (self.hits / total * 100) if total else 0.0
+        print(f"{self.label}: {self.hits} hits, {self.misses} misses ({rate:.1f}% hit rate).")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
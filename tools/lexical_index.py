@@ -0,0 +1,154 @@
+"""
+Lexical (BM25) Index
+--------------------
+A compact on-disk inverted index over chunk text, built at the end of each
+ingest from the chunk store (or from any (ID, text) pairs; PageIndex uses
+one over its doc summaries). An index is a directory of:
+
+    lexical.json    terms (position = term ID), chunk count, average
+                    chunk length and the BM25 parameters used
+    offsets.bin     int64 start of each term's postings (n_terms + 1)
+    doc_ids.bin     int64 chunk IDs of all postings, grouped by term
+    weights.bin     float32 BM25 weight of the term in that chunk
+
+Weights are precomputed (idf x saturated, length-normalized term
+frequency), so scoring a query is a gather of its terms' postings and a
+sum per chunk; no embedding call is needed. Files are memory-mapped, so a
+rebuild is written beside the index and swapped in whole.
+"""
+import os
+import re
+import json
+from collections import Counter
+import shutil
+import numpy as np
+
+from tools.chunk_store import replace_dir
+
+META_FILE = "lexical.json"
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-'][a-z0-9]+)*")
+STOPWORDS = frozenset("""
+a an and are as at be but by for from had has have he her his i if in into is it its
+of on or she that the their there they this to was were which with who will you your
+""".split())
+
+
+def tokenize(text):
+    return [t for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOPWORDS]
+
+
+def lexical_index_exists(path):
+    return os.path.exists(os.path.join(path, META_FILE))
+
+
+def build_lexical_index(store, path, k1=1.2, b=0.75):
+    """
+    Builds the index for every live chunk of `store` (a ChunkStore) and
+    writes it to `path`. Returns the number of chunks indexed.
+    """
+    ids = store.columns['id']
+    documents = ((int(ids[pos]), store.text(pos)) for pos in range(len(ids))
+                 if int(ids[pos]) not in store.deleted)
+    return build_lexical_index_from_texts(documents, path, k1, b)
+
+
+def build_lexical_index_from_texts(documents, path, k1=1.2, b=0.75):
+    """
+    Builds the index over (integer ID, text) pairs and writes it to
+    `path`; searches then return those IDs. Returns the number indexed.
+    """
+    terms = {}
+    term_ids, doc_ids, tfs, lengths = [], [], [], []
+    # Position in `lengths` of each posting's chunk
+    posting_docs = []
+    for chunk_id, text in documents:
+        counts = Counter(tokenize(text))
+        for term, tf in counts.items():
+            term_ids.append(terms.setdefault(term, len(terms)))
+            doc_ids.append(chunk_id)
+            tfs.append(tf)
+            posting_docs.append(len(lengths))
+        lengths.append(sum(counts.values()))
+
+    term_ids = np.asarray(term_ids, dtype=np.int64)
+    doc_ids = np.asarray(doc_ids, dtype=np.int64)
+    tfs = np.asarray(tfs, dtype=np.float32)
+    num_docs = len(lengths)
+    avg_len = float(np.mean(lengths)) if lengths else 0.0
+
+    posting_lengths = np.asarray(lengths, dtype=np.float32)[np.asarray(posting_docs, dtype=np.int64)]
+
+    df = np.bincount(term_ids, minlength=len(terms)).astype(np.float32)
+    idf = np.log(1 + (num_docs - df + 0.5) / (df + 0.5))
+    norm = k1 * (1 - b + b * posting_lengths / (avg_len or 1.0))
+    weights = (idf[term_ids] * tfs * (k1 + 1) / (tfs + norm)).astype(np.float32)
+
+    order = np.argsort(term_ids, kind='stable')
+    offsets = np.concatenate([[0], np.cumsum(df.astype(np.int64))]).astype(np.int64)
+
+    # A running service may have the current index mapped: build a new
+    # directory and swap it in rather than rewriting its files
+    build_path = path.rstrip(os.sep) + ".build"
+    if os.path.exists(build_path):
+        shutil.rmtree(build_path)
+    os.makedirs(build_path)
+    offsets.tofile(os.path.join(build_path, "offsets.bin"))
+    doc_ids[order].tofile(os.path.join(build_path, "doc_ids.bin"))
+    weights[order].tofile(os.path.join(build_path, "weights.bin"))
+    meta = {'terms': list(terms), 'num_docs': num_docs, 'avg_len': avg_len, 'k1': k1, 'b': b}
+    with open(os.path.join(build_path, META_FILE), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+    replace_dir(build_path, path)
+    return num_docs
+
+
+def _map_array(path, dtype):
+    if os.path.getsize(path) == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r')
+
+
+class LexicalIndex:
+    """Read-only, memory-mapped BM25 index. Search results are chunk IDs."""
+
+    def __init__(self, path):
+        if not lexical_index_exists(path):
+            raise FileNotFoundError(f"Lexical index not found at {path}. Run ingest.py first.")
+        with open(os.path.join(path, META_FILE), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        self.term_ids = {term: i for i, term in enumerate(meta['terms'])}
+        self.num_docs = meta['num_docs']
+        self.offsets = np.fromfile(os.path.join(path, "offsets.bin"), dtype=np.int64)
+        self.doc_ids = _map_array(os.path.join(path, "doc_ids.bin"), np.int64)
+        self.weights = _map_array(os.path.join(path, "weights.bin"), np.float32)
+
+    def search(self, query, k, allowed_ids=None):
+        """
+        BM25 top-k for one query string. Returns (scores, chunk IDs), best
+        first; only chunks in `allowed_ids` are considered if it is given.
+        """
+        terms = {self.term_ids[t] for t in tokenize(query) if t in self.term_ids}
+        if not terms:
+            return np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int64)
+        ids = np.concatenate([self.doc_ids[self.offsets[t]:self.offsets[t + 1]] for t in terms])
+        weights = np.concatenate([self.weights[self.offsets[t]:self.offsets[t + 1]] for t in terms])
+        chunk_ids, inverse = np.unique(ids, return_inverse=True)
+        scores = np.bincount(inverse, weights=weights).astype(np.float32)
+        if allowed_ids is not None:
+            keep = np.isin(chunk_ids, allowed_ids)
+            chunk_ids, scores = chunk_ids[keep], scores[keep]
+        if len(scores) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            chunk_ids, scores = chunk_ids[top], scores[top]
+        ranked = np.argsort(-scores, kind='stable')
+        return scores[ranked], chunk_ids[ranked]
+
+    def search_many(self, queries, k, allowed_ids=None):
+        """search() for each query, shaped like index.search: (n, k) arrays padded with -1."""
+        scores = np.zeros((len(queries), k), dtype=np.float32)
+        ids = np.full((len(queries), k), -1, dtype=np.int64)
+        for row, query in enumerate(queries):
+            found_scores, found_ids = self.search(query, k, allowed_ids)
+            scores[row, :len(found_ids)] = found_scores
+            ids[row, :len(found_ids)] = found_ids
+        return scores, ids
@@ -0,0 +1,321 @@
+"""
+LLM Client Layer
+----------------
+The one way the backends and the evaluator call model providers (OpenAI
+and Ollama) for chat and embeddings:
+
+    pooling       one long-lived SDK client per (provider, API key, base
+                  URL), shared by every caller, so HTTP connections are
+                  kept alive and reused. Async calls get one client per
+                  event loop.
+    retries       retryable failures (rate limits, 5xx, timeouts, dropped
+                  connections) are retried with the server's retry-after
+                  hint or exponential backoff with full jitter; the SDKs'
+                  own retries are turned off. Streams retry only until the
+                  first token.
+    concurrency   at most `max_concurrency` requests in flight per client
+                  (PROVIDER_CONCURRENCY by default), for sync and, per
+                  event loop, async calls.
+    metrics       calls, errors, retries, latency and prompt/completion
+                  token counts per client name (the provider unless
+                  named, e.g. "judge") and call kind (call_metrics()).
+
+SDKs are imported when a client for their provider is first used, so the
+OpenAI backends do not need `ollama` installed and vice versa.
+"""
+import time
+import asyncio
+import threading
+import weakref
+
+from tools.rate_limiter import retry_after_seconds, backoff_delay
+
+PROVIDERS = ("openai", "ollama")
+
+# Default requests in flight per client: API quota vs. one local GPU
+PROVIDER_CONCURRENCY = {"openai": 16, "ollama": 4}
+
+RETRYABLE_STATUS = (408, 409, 429)
+
+
+def is_retryable(error):
+    """True for errors worth retrying: connection/timeout failures, rate limits and 5xx."""
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    try:
+        import openai
+        if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError)):
+            return True
+    except ImportError:
+        pass
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return isinstance(status, int) and (status in RETRYABLE_STATUS or status >= 500)
+
+
+def _token_usage(response):
+    """(prompt tokens, completion tokens) reported by an OpenAI or Ollama response."""
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        return getattr(usage, "prompt_tokens", 0) or 0, getattr(usage, "completion_tokens", 0) or 0
+    return getattr(response, "prompt_eval_count", 0) or 0, getattr(response, "eval_count", 0) or 0
+
+
+class CallMetrics:
+    """Thread-safe counters per (client name, call kind)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, name, kind, latency, prompt_tokens=0, completion_tokens=0, retries=0, error=False):
+        with self._lock:
+            stats = self._stats.setdefault(f"{name}.{kind}", {
+                "calls": 0, "errors": 0, "retries": 0, "total_latency": 0.0, "max_latency": 0.0,
+                "prompt_tokens": 0, "completion_tokens": 0,
+            })
+            stats["calls"] += 1
+            stats["errors"] += int(error)
+            stats["retries"] += retries
+            stats["total_latency"] += latency
+            stats["max_latency"] = max(stats["max_latency"], latency)
+            stats["prompt_tokens"] += prompt_tokens
+            stats["completion_tokens"] += completion_tokens
+
+    def snapshot(self):
+        with self._lock:
+            return {key: dict(stats, avg_latency=stats["total_latency"] / stats["calls"])
+                    for key, stats in self._stats.items()}
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+metrics = CallMetrics()
+
+
+def call_metrics():
+    """Per-call counters of every client in this process, keyed "name.kind"."""
+    return metrics.snapshot()
+
+
+class LLMClient:
+    """
+    Pooled, rate-limited client for one provider. Use get_client() to
+    share instances. Latency is measured per call, including retries.
+    """
+
+    def __init__(self, provider, api_key=None, base_url=None, max_concurrency=None,
+                 max_retries=5, timeout=120.0, name=None):
+        if provider not in PROVIDERS:
+            raise ValueError(f"Unknown provider '{provider}'. Choose one of {PROVIDERS}.")
+        self.provider = provider
+        self.name = name or provider
+        self.api_key = api_key
+        self.base_url = base_url
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self._client = None
+        self._client_lock = threading.Lock()
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._async_slots = weakref.WeakKeyDictionary()
+        self.set_concurrency(max_concurrency or PROVIDER_CONCURRENCY[provider])
+
+    def set_concurrency(self, max_concurrency):
+        """Changes the in-flight limit; call before issuing requests."""
+        self.max_concurrency = max_concurrency
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._async_slots = weakref.WeakKeyDictionary()
+
+    def _new_client(self, asynchronous=False):
+        if self.provider == "openai":
+            import openai
+            cls = openai.AsyncOpenAI if asynchronous else openai.OpenAI
+            # Retries happen here, inside the concurrency limit, not in the SDK
+            return cls(api_key=self.api_key, base_url=self.base_url, max_retries=0, timeout=self.timeout)
+        import ollama
+        cls = ollama.AsyncClient if asynchronous else ollama.Client
+        return cls(host=self.base_url, timeout=self.timeout)
+
+    @property
+    def client(self):
+        """The shared synchronous SDK client, created on first use."""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = self._new_client()
+        return self._client
+
+    def _loop_state(self):
+        loop = asyncio.get_running_loop()
+        if loop not in self._async_clients:
+            self._async_clients[loop] = self._new_client(asynchronous=True)
+            self._async_slots[loop] = asyncio.Semaphore(self.max_concurrency)
+        elif loop not in self._async_slots:
+            self._async_slots[loop] = asyncio.Semaphore(self.max_concurrency)
+        return self._async_clients[loop], self._async_slots[loop]
+
+    # Provider-specific request shapes
+
+    def _chat_request(self, client, model, messages, kwargs, stream=False):
+        if self.provider == "openai":
+            return client.chat.completions.create(model=model, messages=messages, stream=stream, **kwargs)
+        return client.chat(model=model, messages=messages, stream=stream, **kwargs)
+
+    def _chat_text(self, response):
+        if self.provider == "openai":
+            return response.choices[0].message.content
+        return response['message']['content']
+
+    def _stream_text(self, chunk):
+        if self.provider == "openai":
+            return chunk.choices[0].delta.content if chunk.choices else None
+        return chunk['message']['content']
+
+    def _embed_request(self, model, inputs, kwargs):
+        if self.provider == "openai":
+            return self.client.embeddings.create(input=inputs, model=model, **kwargs)
+        return self.client.embed(model=model, input=inputs, **kwargs)
+
+    def _embed_vectors(self, response):
+        if self.provider == "openai":
+            return [d.embedding for d in sorted(response.data, key=lambda d: d.index)]
+        return list(response['embeddings'])
+
+    # Synchronous calls
+
+    def _call(self, kind, request):
+        start = time.perf_counter()
+        for attempt in range(self.max_retries + 1):
+            try:
+                with self._slots:
+                    response = request()
+                break
+            except Exception as e:
+                if attempt == self.max_retries or not is_retryable(e):
+                    metrics.record(self.name, kind, time.perf_counter() - start, retries=attempt, error=True)
+                    raise
+                time.sleep(retry_after_seconds(e) or backoff_delay(attempt))
+        metrics.record(self.name, kind, time.perf_counter() - start, *_token_usage(response), retries=attempt)
+        return response
+
+    def chat_response(self, model, messages, **kwargs):
+        """The provider's raw chat response (e.g. for finish_reason)."""
+        return self._call("chat", lambda: self._chat_request(self.client, model, messages, kwargs))
+
+    def chat(self, model, messages, **kwargs):
+        """The assistant message text for `messages`."""
+        return self._chat_text(self.chat_response(model, messages, **kwargs))
+
+    def chat_stream(self, model, messages, **kwargs):
+        """
+        Yields the answer text as it streams in. Retries only until the
+        first piece arrives. The open stream holds one concurrency slot until
+        it is exhausted or closed: callers that stop reading early must
+        close() the generator (StreamingAnswer.close() does), or the slot is
+        only freed when the generator is garbage-collected.
+        """
+        start = time.perf_counter()
+        pieces, prompt_tokens, completion_tokens = 0, 0, 0
+        for attempt in range(self.max_retries + 1):
+            try:
+                self._slots.acquire()
+                try:
+                    response = self._chat_request(self.client, model, messages, kwargs, stream=True)
+                    try:
+                        for chunk in response:
+                            # Ollama reports token counts on the final chunk
+                            usage = _token_usage(chunk)
+                            prompt_tokens, completion_tokens = prompt_tokens + usage[0], completion_tokens + usage[1]
+                            text = self._stream_text(chunk)
+                            if text:
+                                pieces += 1
+                                yield text
+                    finally:
+                        # Also runs on close(): drops the HTTP response early
+                        if hasattr(response, "close"):
+                            response.close()
+                finally:
+                    self._slots.release()
+                break
+            except Exception as e:
+                if pieces or attempt == self.max_retries or not is_retryable(e):
+                    metrics.record(self.name, "chat_stream", time.perf_counter() - start,
+                                   retries=attempt, error=True)
+                    raise
+                time.sleep(retry_after_seconds(e) or backoff_delay(attempt))
+        metrics.record(self.name, "chat_stream", time.perf_counter() - start,
+                       prompt_tokens, completion_tokens or pieces, retries=attempt)
+
+    def embed(self, model, inputs, **kwargs):
+        """One vector per input, in input order."""
+        return self._embed_vectors(self._call("embed", lambda: self._embed_request(model, inputs, kwargs)))
+
+    # Asynchronous calls (one client and one limit per event loop)
+
+    async def achat(self, model, messages, **kwargs):
+        """Async chat(): the assistant message text."""
+        client, slots = self._loop_state()
+        start = time.perf_counter()
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with slots:
+                    response = await self._chat_request(client, model, messages, kwargs)
+                break
+            except Exception as e:
+                if attempt == self.max_retries or not is_retryable(e):
+                    metrics.record(self.name, "chat", time.perf_counter() - start, retries=attempt, error=True)
+                    raise
+                await asyncio.sleep(retry_after_seconds(e) or backoff_delay(attempt))
+        metrics.record(self.name, "chat", time.perf_counter() - start, *_token_usage(response), retries=attempt)
+        return self._chat_text(response)
+
+    async def aembed(self, model, inputs, **kwargs):
+        """Async embed(): one vector per input, in input order."""
+        client, slots = self._loop_state()
+        start = time.perf_counter()
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with slots:
+                    if self.provider == "openai":
+                        response = await client.embeddings.create(input=inputs, model=model, **kwargs)
+                    else:
+                        response = await client.embed(model=model, input=inputs, **kwargs)
+                break
+            except Exception as e:
+                if attempt == self.max_retries or not is_retryable(e):
+                    metrics.record(self.name, "embed", time.perf_counter() - start, retries=attempt, error=True)
+                    raise
+                await asyncio.sleep(retry_after_seconds(e) or backoff_delay(attempt))
+        metrics.record(self.name, "embed", time.perf_counter() - start, *_token_usage(response), retries=attempt)
+        return self._embed_vectors(response)
+
+    async def aclose(self):
+        """Closes the running loop's async client; call before the loop ends."""
+        client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.close()
+
+    def close(self):
+        with self._client_lock:
+            if self._client is not None and hasattr(self._client, "close"):
+                self._client.close()
+            self._client = None
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(provider, api_key=None, base_url=None, name=None, **options):
+    """
+    The shared LLMClient for (provider, api_key, base_url, name). `options`
+    (max_concurrency, max_retries, timeout) apply when it is first created.
+    """
+    key = (provider, api_key, base_url, name)
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = LLMClient(provider, api_key=api_key, base_url=base_url, name=name, **options)
+        return _clients[key]
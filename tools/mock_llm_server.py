@@ -0,0 +1,334 @@
+"""
+Mock LLM Server
+---------------
+A local stand-in for the OpenAI and Ollama HTTP APIs these pipelines call,
+for benchmarking ingest and query performance without network access or
+cost:
+
+    POST /v1/chat/completions   OpenAI chat, plain or streamed (SSE)
+    POST /v1/embeddings         OpenAI embeddings
+    POST /api/chat              Ollama chat, plain or streamed (NDJSON)
+    POST /api/embed             Ollama embeddings
+    POST /api/show, /api/pull   Ollama model checks (always succeed)
+    GET  /stats                 requests, injected errors and tokens served
+
+Embeddings are deterministic: words are feature-hashed into a unit vector,
+so the same text always gets the same vector and texts sharing words are
+close, which keeps retrieval meaningful. Chat answers are deterministic
+too, and recognise the evaluation judge and PageIndex selection prompts so
+those parse.
+
+Latency is sampled from seeded distributions: time to first token is
+log-normal around --ttft-ms, tokens are then emitted at a normally
+distributed rate around --tokens-per-sec, and embedding requests take
+--embed-ms plus --embed-ms-per-input per input. --error-rate injects 429
+responses (with a retry-after-ms hint) at that probability.
+
+Point the backends at it with OPENAI_BASE_URL=http://127.0.0.1:8900/v1 and
+OLLAMA_HOST=http://127.0.0.1:8900 (any non-empty API key works).
+
+Usage:
+    python tools/mock_llm_server.py --port 8900 --ttft-ms 300 --error-rate 0.05
+"""
+import re
+import json
+import math
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Embedding size per model; anything else gets --dim
+EMBEDDING_DIMS = {
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+    "text-embedding-ada-002": 1536,
+    "nomic-embed-text": 768,
+    "mxbai-embed-large": 1024,
+}
+
+
+def _word_hash(word):
+    return int.from_bytes(hashlib.md5(word.encode("utf-8")).digest()[:8], "little")
+
+
+def embed_text(text, dim):
+    """Deterministic unit vector: each word adds +-1 to one hashed dimension."""
+    vector = [0.0] * dim
+    for word in WORD_PATTERN.findall(text.lower()):
+        h = _word_hash(word)
+        vector[h % dim] += 1.0 if (h >> 32) & 1 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector))
+    if norm == 0:
+        vector[0] = 1.0
+        return vector
+    return [v / norm for v in vector]
+
+
+def count_tokens(text):
+    # Close enough to BPE counts for usage reporting
+    return max(1, len(text) // 4) if text else 0
+
+
+def _prompt_text(messages):
+    return "\n".join(m.get("content") or "" for m in messages if isinstance(m, dict))
+
+
+def mock_answer(messages, answer_tokens):
+    """A deterministic reply; judge and doc-selection prompts get a parseable one."""
+    prompt = _prompt_text(messages)
+    if "Relevance:" in prompt and "Faithfulness:" in prompt:
+        return "Relevance: 7\nFaithfulness: 7\nReasoning: Mock evaluation."
+    if "Return a list of boolean values" in prompt:
+        chunks = len(re.findall(r"Chunk \d+:", prompt))
+        return "[" + ", ".join("True" if i % 2 == 0 else "False" for i in range(chunks)) + "]"
+    if "Return a list of indices" in prompt:
+        return str([int(i) for i in re.findall(r"Doc (\d+):", prompt)[:3]])
+    words = WORD_PATTERN.findall(prompt.lower()) or ["mock"]
+    rng = random.Random(hashlib.md5(prompt.encode("utf-8")).hexdigest())
+    return " ".join(rng.choice(words) for _ in range(answer_tokens))
+
+
+class MockLLMServer:
+    """Serves the mock APIs; every random draw comes from one seeded generator."""
+
+    def __init__(self, ttft_ms=200.0, latency_sigma=0.5, tokens_per_sec=50.0, tokens_per_sec_sd=10.0,
+                 embed_ms=20.0, embed_ms_per_input=0.5, error_rate=0.0, retry_after_ms=100,
+                 answer_tokens=64, dim=768, seed=0):
+        self.ttft_ms = ttft_ms
+        self.latency_sigma = latency_sigma
+        self.tokens_per_sec = tokens_per_sec
+        self.tokens_per_sec_sd = tokens_per_sec_sd
+        self.embed_ms = embed_ms
+        self.embed_ms_per_input = embed_ms_per_input
+        self.error_rate = error_rate
+        self.retry_after_ms = retry_after_ms
+        self.answer_tokens = answer_tokens
+        self.dim = dim
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._stats = {"requests": {}, "rate_limited": 0, "prompt_tokens": 0, "completion_tokens": 0}
+
+    # Sampling
+
+    def _ttft(self):
+        with self._lock:
+            return self._rng.lognormvariate(math.log(max(self.ttft_ms, 1e-3) / 1000.0), self.latency_sigma)
+
+    def _token_interval(self):
+        with self._lock:
+            rate = self._rng.gauss(self.tokens_per_sec, self.tokens_per_sec_sd)
+        return 1.0 / max(rate, 1.0)
+
+    def _rate_limited(self):
+        with self._lock:
+            return self.error_rate > 0 and self._rng.random() < self.error_rate
+
+    def _count(self, endpoint, prompt_tokens=0, completion_tokens=0, rate_limited=False):
+        with self._lock:
+            self._stats["requests"][endpoint] = self._stats["requests"].get(endpoint, 0) + 1
+            self._stats["rate_limited"] += int(rate_limited)
+            self._stats["prompt_tokens"] += prompt_tokens
+            self._stats["completion_tokens"] += completion_tokens
+
+    def stats(self):
+        with self._lock:
+            return json.loads(json.dumps(self._stats))
+
+    def embedding_dim(self, model):
+        # Ollama names may carry a tag, e.g. "mxbai-embed-large:latest"
+        return EMBEDDING_DIMS.get(model.split(":")[0], self.dim)
+
+    # HTTP
+
+    def make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive, so client connection pooling behaves as against the real APIs
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status, payload, headers=None):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _start_stream(self, content_type):
+                # No Content-Length: the body ends when the connection closes
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.close_connection = True
+
+            def _write(self, data):
+                self.wfile.write(data.encode("utf-8"))
+                self.wfile.flush()
+
+            def do_GET(self):
+                if self.path == "/stats":
+                    self._send_json(200, server.stats())
+                else:
+                    self._send_json(404, {"error": "not found"})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                routes = {
+                    "/v1/chat/completions": self._openai_chat,
+                    "/v1/embeddings": self._openai_embeddings,
+                    "/api/chat": self._ollama_chat,
+                    "/api/embed": self._ollama_embed,
+                    "/api/show": lambda p: self._send_json(200, {"modelfile": "", "template": "",
+                                                                 "details": {}, "model_info": {}}),
+                    "/api/pull": lambda p: self._send_json(200, {"status": "success"}),
+                }
+                route = routes.get(self.path.split("?")[0])
+                if route is None:
+                    self._send_json(404, {"error": "not found"})
+                    return
+                if self.path.startswith(("/v1/", "/api/chat", "/api/embed")) and server._rate_limited():
+                    server._count(self.path, rate_limited=True)
+                    self._send_json(429, {"error": {"message": "Rate limit reached (mock).",
+                                                    "type": "requests", "code": "rate_limit_exceeded"}},
+                                    {"retry-after-ms": str(server.retry_after_ms)})
+                    return
+                try:
+                    route(payload)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # the client closed a stream early
+
+            def _answer(self, payload):
+                messages = payload.get("messages", [])
+                answer = mock_answer(messages, server.answer_tokens)
+                return answer, count_tokens(_prompt_text(messages))
+
+            def _pieces(self, answer):
+                """Answer words, paced like generation: TTFT, then one per token interval."""
+                time.sleep(server._ttft())
+                for i, word in enumerate(answer.split(" ")):
+                    if i:
+                        time.sleep(server._token_interval())
+                    yield word if i == 0 else " " + word
+
+            def _openai_chat(self, payload):
+                answer, prompt_tokens = self._answer(payload)
+                completion_tokens = len(answer.split(" "))
+                server._count(self.path, prompt_tokens, completion_tokens)
+                base = {"id": "chatcmpl-mock", "created": int(time.time()), "model": payload.get("model", "mock")}
+                if not payload.get("stream"):
+                    for _ in self._pieces(answer):
+                        pass
+                    self._send_json(200, dict(base, object="chat.completion", choices=[{
+                        "index": 0, "finish_reason": "stop",
+                        "message": {"role": "assistant", "content": answer}}],
+                        usage={"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                               "total_tokens": prompt_tokens + completion_tokens}))
+                    return
+                self._start_stream("text/event-stream")
+                for piece in self._pieces(answer):
+                    chunk = dict(base, object="chat.completion.chunk", choices=[{
+                        "index": 0, "finish_reason": None, "delta": {"content": piece}}])
+                    self._write(f"data: {json.dumps(chunk)}\n\n")
+                final = dict(base, object="chat.completion.chunk", choices=[{
+                    "index": 0, "finish_reason": "stop", "delta": {}}])
+                self._write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n")
+
+            def _embed(self, payload):
+                texts = payload.get("input", [])
+                if isinstance(texts, str):
+                    texts = [texts]
+                time.sleep((server.embed_ms + server.embed_ms_per_input * len(texts)) / 1000.0)
+                dim = server.embedding_dim(payload.get("model", ""))
+                prompt_tokens = sum(count_tokens(t) for t in texts)
+                server._count(self.path, prompt_tokens)
+                return [embed_text(t, dim) for t in texts], prompt_tokens
+
+            def _openai_embeddings(self, payload):
+                vectors, prompt_tokens = self._embed(payload)
+                self._send_json(200, {
+                    "object": "list", "model": payload.get("model", "mock"),
+                    "data": [{"object": "embedding", "index": i, "embedding": v} for i, v in enumerate(vectors)],
+                    "usage": {"prompt_tokens": prompt_tokens, "total_tokens": prompt_tokens}})
+
+            def _ollama_embed(self, payload):
+                vectors, prompt_tokens = self._embed(payload)
+                self._send_json(200, {"model": payload.get("model", "mock"), "embeddings": vectors,
+                                      "prompt_eval_count": prompt_tokens})
+
+            def _ollama_chat(self, payload):
+                answer, prompt_tokens = self._answer(payload)
+                completion_tokens = len(answer.split(" "))
+                server._count(self.path, prompt_tokens, completion_tokens)
+                model = payload.get("model", "mock")
+                final = {"model": model, "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                         "done": True, "done_reason": "stop",
+                         "prompt_eval_count": prompt_tokens, "eval_count": completion_tokens}
+                if payload.get("stream") is False:
+                    for _ in self._pieces(answer):
+                        pass
+                    self._send_json(200, dict(final, message={"role": "assistant", "content": answer}))
+                    return
+                # Ollama streams unless told otherwise
+                self._start_stream("application/x-ndjson")
+                for piece in self._pieces(answer):
+                    self._write(json.dumps({"model": model, "created_at": final["created_at"], "done": False,
+                                            "message": {"role": "assistant", "content": piece}}) + "\n")
+                self._write(json.dumps(dict(final, message={"role": "assistant", "content": ""})) + "\n")
+
+        return Handler
+
+    def start(self, host="127.0.0.1", port=0):
+        """Serves on a background thread; returns the HTTP server (port 0 picks a free port)."""
+        httpd = ThreadingHTTPServer((host, port), self.make_handler())
+        httpd.daemon_threads = True
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        return httpd
+
+    def serve(self, host="127.0.0.1", port=8900):
+        httpd = ThreadingHTTPServer((host, port), self.make_handler())
+        httpd.daemon_threads = True
+        print(f"Mock LLM server listening on http://{host}:{port} "
+              f"(OpenAI base URL http://{host}:{port}/v1, Ollama host http://{host}:{port})")
+        try:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            httpd.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve mock OpenAI/Ollama APIs for offline benchmarking.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--ttft-ms", type=float, default=200.0, help="Median time to first token.")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="Log-normal spread of the TTFT.")
+    parser.add_argument("--tokens-per-sec", type=float, default=50.0, help="Mean generation rate.")
+    parser.add_argument("--tokens-per-sec-sd", type=float, default=10.0, help="Std. dev. of the generation rate.")
+    parser.add_argument("--embed-ms", type=float, default=20.0, help="Fixed latency per embedding request.")
+    parser.add_argument("--embed-ms-per-input", type=float, default=0.5, help="Added latency per embedded text.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probability of answering 429.")
+    parser.add_argument("--retry-after-ms", type=int, default=100, help="Retry hint sent with each 429.")
+    parser.add_argument("--answer-tokens", type=int, default=64, help="Words per generated answer.")
+    parser.add_argument("--dim", type=int, default=768, help="Embedding size for models not in EMBEDDING_DIMS.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    MockLLMServer(ttft_ms=args.ttft_ms, latency_sigma=args.latency_sigma, tokens_per_sec=args.tokens_per_sec,
+                  tokens_per_sec_sd=args.tokens_per_sec_sd, embed_ms=args.embed_ms,
+                  embed_ms_per_input=args.embed_ms_per_input, error_rate=args.error_rate,
+                  retry_after_ms=args.retry_after_ms, answer_tokens=args.answer_tokens,
+                  dim=args.dim, seed=args.seed).serve(args.host, args.port)
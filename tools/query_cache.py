@@ -0,0 +1,186 @@
+"""
+Query Cache
+-----------
+Two-level in-memory cache in front of a RAG backend's query():
+
+    1. EmbeddingLRU         normalized query string -> query embedding,
+                            so a repeated question skips the embedding call
+    2. SemanticAnswerCache  query embedding -> (answer, chunks), returned
+                            when a new query's embedding is within a cosine
+                            similarity threshold of a cached one, so a
+                            near-identical question skips retrieval and
+                            generation
+
+Answers depend on the index, so the answer cache is cleared whenever the
+index version (a signature of its files on disk) changes. Embeddings only
+depend on the embedding model and are kept.
+"""
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+
+
+def index_version(*paths):
+    """
+    Signature of the given files/directories: the name, mtime and size of
+    each file. It changes whenever ingest rewrites any of them.
+    """
+    signature = []
+    for path in paths:
+        if os.path.isdir(path):
+            for entry in sorted(os.scandir(path), key=lambda e: e.name):
+                stat = entry.stat()
+                signature.append((entry.path, stat.st_mtime_ns, stat.st_size))
+        elif os.path.exists(path):
+            stat = os.stat(path)
+            signature.append((path, stat.st_mtime_ns, stat.st_size))
+        else:
+            signature.append((path, None, None))
+    return tuple(signature)
+
+
+class EmbeddingLRU:
+    """Least-recently-used map from normalized query text to its embedding."""
+
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, text):
+        with self._lock:
+            vector = self._entries.get(text)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(text)
+            self.hits += 1
+            return vector
+
+    def put(self, text, vector):
+        with self._lock:
+            self._entries[text] = vector
+            self._entries.move_to_end(text)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+class SemanticAnswerCache:
+    """
+    Stores answers by query embedding. A lookup matches the most similar
+    cached query if its cosine similarity is at least `threshold`. Entries
+    live in one preallocated matrix, so a lookup is a single matrix-vector
+    product; when full, the least recently used entry is overwritten.
+    """
+
+    def __init__(self, threshold=0.95, max_size=256):
+        self.threshold = threshold
+        self.max_size = max_size
+        self.version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.clear()
+
+    def clear(self):
+        self._vectors = None
+        self._values = [None] * self.max_size
+        self._last_used = np.zeros(self.max_size, dtype=np.int64)
+        self._size = 0
+        self._clock = 0
+
+    def check_version(self, version):
+        """Drops every entry if the index version has changed."""
+        with self._lock:
+            if version != self.version:
+                if self._size:
+                    print("Index changed: answer cache cleared.")
+                self.clear()
+                self.version = version
+
+    @staticmethod
+    def _unit(embedding):
+        vector = np.asarray(embedding, dtype='float32').ravel()
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, embedding):
+        vector = self._unit(embedding)
+        with self._lock:
+            if self._size:
+                similarities = self._vectors[:self._size] @ vector
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    self._clock += 1
+                    self._last_used[best] = self._clock
+                    self.hits += 1
+                    return self._values[best]
+            self.misses += 1
+            return None
+
+    def store(self, embedding, value):
+        vector = self._unit(embedding)
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_size, len(vector)), dtype='float32')
+            if self._size < self.max_size:
+                slot = self._size
+                self._size += 1
+            else:
+                slot = int(np.argmin(self._last_used))
+            self._clock += 1
+            self._vectors[slot] = vector
+            self._values[slot] = value
+            self._last_used[slot] = self._clock
+
+
+class QueryCache:
+    """
+    Both cache levels for one backend. `version_func` returns the current
+    index version (see index_version); a threshold of None disables the
+    answer cache and keeps only the embedding cache.
+    """
+
+    def __init__(self, version_func, threshold=0.95, max_embeddings=1024, max_answers=256):
+        self.version_func = version_func
+        self.embeddings = EmbeddingLRU(max_embeddings)
+        self.answers = SemanticAnswerCache(threshold, max_answers) if threshold is not None else None
+
+    def embed(self, questions, embed_func):
+        """
+        Embeddings for normalized `questions` as a float32 matrix. Cached
+        ones are reused; the rest are embedded with one `embed_func(texts)`
+        call, which must return one vector per text.
+        """
+        vectors = [self.embeddings.get(q) for q in questions]
+        missing = list(dict.fromkeys(q for q, v in zip(questions, vectors) if v is None))
+        if missing:
+            fresh = {q: np.asarray(vector, dtype='float32') for q, vector in zip(missing, embed_func(missing))}
+            for q, vector in fresh.items():
+                self.embeddings.put(q, vector)
+            vectors = [v if v is not None else fresh[q] for q, v in zip(questions, vectors)]
+        return np.vstack(vectors).astype('float32')
+
+    def lookup_answer(self, embedding):
+        """Cached (answer, chunks) for a semantically equivalent query, or None."""
+        if self.answers is None:
+            return None
+        self.answers.check_version(self.version_func())
+        return self.answers.lookup(embedding)
+
+    def store_answer(self, embedding, value):
+        if self.answers is not None:
+            self.answers.store(embedding, value)
+
+    def disable_answers(self):
+        """Turns the answer cache off, e.g. so concurrent runs can't depend on completion order."""
+        self.answers = None
+
+    def stats(self):
+        stats = {"embedding_hits": self.embeddings.hits, "embedding_misses": self.embeddings.misses}
+        if self.answers is not None:
+            stats.update({"answer_hits": self.answers.hits, "answer_misses": self.answers.misses})
+        return stats
@@ -0,0 +1,262 @@
+"""
+Resident Query Service
+----------------------
+Keeps a backend's FAISS index and chunk metadata loaded in memory and serves
+many queries against it concurrently, either in-process or over a small local
+HTTP server. Index load time is measured once and reported separately from the
+per-query latencies. At most `max_workers` queries, streamed or not, run at
+once; /stats reports over the last STATS_WINDOW queries.
+
+Usage:
+    python tools/query_service.py openai-rag --port 8000
+    curl -X POST localhost:8000/query -d '{"question": "..."}'
+    curl -N -X POST localhost:8000/query/stream -d '{"question": "..."}'
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import importlib.util
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# Latencies kept for /stats, so a long-running service uses bounded memory
+STATS_WINDOW = 1000
+
+
+class ResidentIndex:
+    """
+    Load-once holder for whatever a backend's `load_index()` returns.
+    The first caller pays the load cost; every later caller gets the
+    resident objects back immediately.
+    """
+
+    def __init__(self, load_func):
+        self._load_func = load_func
+        self._lock = threading.Lock()
+        self._value = None
+        self.load_time = None
+
+    def get(self):
+        if self._value is None:
+            with self._lock:
+                if self._value is None:
+                    start_time = time.time()
+                    value = self._load_func()
+                    self.load_time = time.time() - start_time
+                    print(f"Index loaded in {self.load_time:.3f}s (kept resident).")
+                    self._value = value
+        return self._value
+
+    def reload(self):
+        """Drops the resident copy so the next `get()` re-reads it from disk."""
+        with self._lock:
+            self._value = None
+            self.load_time = None
+
+
+class QueryService:
+    """
+    Serves a backend's `query()` function from a thread pool against its
+    resident index. `resident_index` is the module's `ResidentIndex`, used to
+    warm up the index and report its load time.
+    """
+
+    def __init__(self, query_func, resident_index, max_workers=8, stream_func=None):
+        self.query_func = query_func
+        self.stream_func = stream_func
+        self.resident_index = resident_index
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        # Shared by queries and streams; streams run on the HTTP handler's thread
+        self._slots = threading.BoundedSemaphore(max_workers)
+        self._stats_lock = threading.Lock()
+        self._queries = 0
+        self._latencies = deque(maxlen=STATS_WINDOW)
+        self._ttfts = deque(maxlen=STATS_WINDOW)
+
+    def start(self):
+        """Loads the index up-front so no query pays for it."""
+        self.resident_index.get()
+        return self
+
+    def query(self, question, filters=None):
+        with self._slots:
+            start_time = time.time()
+            answer, chunks = self.query_func(question, filters) if filters else self.query_func(question)
+            latency = time.time() - start_time
+        with self._stats_lock:
+            self._queries += 1
+            self._latencies.append(latency)
+        return {"answer": answer, "chunks": chunks, "latency": latency}
+
+    def stream(self, question, filters=None):
+        """
+        Runs the backend's `query_stream()` and yields its answer pieces;
+        TTFT and total latency are added to the stats once it finishes. The
+        generator's return value is the finished StreamingAnswer. The stream
+        holds one of the `max_workers` slots until it finishes or is closed.
+        """
+        with self._slots:
+            streamed = self.stream_func(question, filters) if filters else self.stream_func(question)
+            yield from streamed
+        with self._stats_lock:
+            self._queries += 1
+            self._latencies.append(streamed.metrics["total_latency"])
+            if streamed.metrics["ttft"] is not None:
+                self._ttfts.append(streamed.metrics["ttft"])
+        return streamed
+
+    def submit(self, question, filters=None):
+        return self._executor.submit(self.query, question, filters)
+
+    def query_many(self, questions):
+        """Runs the questions concurrently and returns results in input order."""
+        futures = [self.submit(q) for q in questions]
+        return [f.result() for f in futures]
+
+    def stats(self):
+        with self._stats_lock:
+            queries = self._queries
+            latencies = list(self._latencies)
+            ttfts = list(self._ttfts)
+        return {
+            "load_time": self.resident_index.load_time,
+            "queries": queries,
+            "window": len(latencies),
+            "avg_query_latency": sum(latencies) / len(latencies) if latencies else 0.0,
+            "max_query_latency": max(latencies) if latencies else 0.0,
+            "avg_ttft": sum(ttfts) / len(ttfts) if ttfts else None,
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+    def serve(self, host="127.0.0.1", port=8000):
+        """
+        Exposes the service over HTTP:
+            POST /query          {"question": "..."}  -> {"answer", "chunks", "latency"}
+            POST /query/stream   {"question": "..."}  -> NDJSON: {"token"} lines, then
+                                                        {"done", "chunks", "metrics"}
+            GET  /stats                              -> load time, query latencies, TTFT
+        Query bodies may also carry "filters", e.g.
+        {"medical_specialty": "Urology"}, to search one partition only.
+        """
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _send_json(self, status, payload):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path == "/stats":
+                    self._send_json(200, service.stats())
+                else:
+                    self._send_json(404, {"error": "not found"})
+
+            def _stream(self, question, filters):
+                # No Content-Length: the body is written line by line and ends
+                # when the connection closes
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.end_headers()
+                pieces = service.stream(question, filters)
+                try:
+                    while True:
+                        piece = next(pieces)
+                        self.wfile.write((json.dumps({"token": piece}) + "\n").encode("utf-8"))
+                        self.wfile.flush()
+                except StopIteration as done:
+                    streamed = done.value
+                    final = {"done": True, "chunks": streamed.chunks, "metrics": streamed.metrics}
+                    self.wfile.write((json.dumps(final) + "\n").encode("utf-8"))
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # client went away; the finally below stops generation
+                except Exception as e:
+                    self.wfile.write((json.dumps({"error": str(e)}) + "\n").encode("utf-8"))
+                finally:
+                    pieces.close()
+
+            def _read_query(self):
+                """(question, filters) from the request body; ValueError if malformed."""
+                try:
+                    length = int(self.headers.get("Content-Length", 0))
+                    payload = json.loads(self.rfile.read(length) or b"{}")
+                except ValueError:
+                    raise ValueError("request body must be a JSON object") from None
+                if not isinstance(payload, dict):
+                    raise ValueError("request body must be a JSON object")
+                question = payload.get("question")
+                if not isinstance(question, str) or not question.strip():
+                    raise ValueError('"question" must be a non-empty string')
+                filters = payload.get("filters")
+                if filters is not None and not isinstance(filters, dict):
+                    raise ValueError('"filters" must be an object, e.g. {"medical_specialty": "Urology"}')
+                return question, filters
+
+            def do_POST(self):
+                stream = self.path == "/query/stream" and service.stream_func is not None
+                if self.path != "/query" and not stream:
+                    self._send_json(404, {"error": "not found"})
+                    return
+                # Validated before any response is started, so bad input gets a 400
+                try:
+                    question, filters = self._read_query()
+                except ValueError as e:
+                    self._send_json(400, {"error": str(e)})
+                    return
+                if stream:
+                    self._stream(question, filters)
+                    return
+                try:
+                    result = service.submit(question, filters).result()
+                    self._send_json(200, result)
+                except Exception as e:
+                    self._send_json(500, {"error": str(e)})
+
+        self.start()
+        server = ThreadingHTTPServer((host, port), Handler)
+        print(f"Query service listening on http://{host}:{port}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.shutdown()
+
+
+def load_backend(folder_name):
+    """Imports `<folder_name>/query.py` with its own config.py on the path."""
+    file_path = os.path.join(ROOT_DIR, folder_name, "query.py")
+    spec = importlib.util.spec_from_file_location(f"{folder_name}.query", file_path)
+    module = importlib.util.module_from_spec(spec)
+    sys.path.insert(0, os.path.join(ROOT_DIR, folder_name))
+    if 'config' in sys.modules:
+        del sys.modules['config']
+    spec.loader.exec_module(module)
+    sys.path.pop(0)
+    return module
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a RAG backend with a resident index.")
+    parser.add_argument("backend", choices=["openai-rag", "local-model-rag"])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    backend = load_backend(args.backend)
+    QueryService(backend.query, backend.resident_index, max_workers=args.workers,
+                 stream_func=backend.query_stream).serve(args.host, args.port)
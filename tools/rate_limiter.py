@@ -0,0 +1,64 @@
+"""
+Rate Limiting Helpers
+---------------------
+An asyncio token bucket for provider quotas (tokens-per-minute and
+requests-per-minute), plus the retry delay policy used when a provider
+still answers with a rate-limit error.
+"""
+import time
+import random
+import asyncio
+
+
+class AsyncTokenBucket:
+    """
+    Refills continuously at `per_minute / 60` units per second up to a
+    capacity of one minute's quota. `acquire(n)` waits until n units are
+    available. Waiters are served in arrival order.
+    """
+
+    def __init__(self, per_minute):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount=1):
+        # A single request larger than the whole quota can never fit; let it
+        # through once the bucket is full rather than waiting forever.
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+
+def retry_after_seconds(error):
+    """
+    Reads the server's retry hint from an OpenAI API error, if any.
+    Checks `retry-after-ms` first, then `retry-after` (in seconds).
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000.0
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+def backoff_delay(attempt, base=1.0, cap=60.0):
+    """Exponential backoff with full jitter: uniform in [0, min(cap, base * 2^attempt)]."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
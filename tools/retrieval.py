@@ -0,0 +1,185 @@
+"""
+Retrieval Helpers
+-----------------
+Search paths shared by the vector backends on top of their FAISS index and
+chunk store.
+
+Filtered search: filters such as {'medical_specialty': 'Cardiovascular /
+Pulmonary'} are resolved through the chunk store's partition index to the
+matching rows, and the query is scored exactly against just those rows'
+stored vectors. A filtered query therefore costs time proportional to the
+partition, not the whole index.
+
+Retrieval modes: "vector" (FAISS), "bm25" (the lexical index, no embedding
+needed) and "hybrid", which fuses the two rankings with reciprocal-rank
+fusion.
+
+Diversification (optional): over-fetch candidates, drop chunks that are
+near-duplicates of a better-ranked chunk of the same sample (overlapping
+neighbours, mostly), then pick the final top-k by maximal marginal
+relevance. Both steps run in NumPy on the chunk store's stored vectors.
+"""
+import numpy as np
+
+RETRIEVAL_MODES = ("vector", "bm25", "hybrid")
+
+
+def l2_top_k(queries, vectors, k):
+    """
+    Exact squared-L2 top-k of each query against `vectors`, like
+    IndexFlatL2. Returns (distances, row numbers into `vectors`), padded
+    with (inf, -1) when there are fewer than k vectors.
+    """
+    queries = np.asarray(queries, dtype='float32')
+    n = len(queries)
+    distances = np.full((n, k), np.inf, dtype='float32')
+    rows = np.full((n, k), -1, dtype='int64')
+    if len(vectors) == 0:
+        return distances, rows
+
+    scores = ((queries ** 2).sum(axis=1)[:, None]
+              - 2 * queries @ vectors.T
+              + (vectors ** 2).sum(axis=1)[None, :])
+    top = min(k, len(vectors))
+    candidates = np.argpartition(scores, top - 1, axis=1)[:, :top]
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    ranked = np.argsort(candidate_scores, axis=1, kind='stable')
+    rows[:, :top] = np.take_along_axis(candidates, ranked, axis=1)
+    distances[:, :top] = np.take_along_axis(candidate_scores, ranked, axis=1)
+    return distances, rows
+
+
+def filtered_search(store, query_embeddings, filters, k):
+    """
+    Top-k chunks among those matching `filters` ({field: value or
+    [values]}) for each query. Returns (distances, chunk IDs) shaped like
+    index.search, with -1 padding.
+    """
+    if store.vectors is None:
+        raise ValueError("This chunk store has no stored vectors; re-run a full ingest to enable filters.")
+    positions = store.filter_positions(filters)
+    vectors = np.asarray(store.vectors[positions], dtype='float32')
+    distances, rows = l2_top_k(query_embeddings, vectors, k)
+    chunk_ids = np.asarray(store.columns['id'])[positions]
+    ids = np.full_like(rows, -1)
+    found = rows >= 0
+    ids[found] = chunk_ids[rows[found]]
+    return distances, ids
+
+
+def reciprocal_rank_fusion(rankings, k=60, limit=None):
+    """
+    Fuses ranked lists of chunk IDs (-1 entries ignored): each ID scores
+    sum(1 / (k + rank)) over the lists it appears in. Returns the IDs best
+    first, at most `limit` of them.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate((int(i) for i in ranking if i != -1), start=1):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (k + rank)
+    fused = sorted(scores, key=lambda chunk_id: -scores[chunk_id])
+    return fused[:limit] if limit is not None else fused
+
+
+def _unit_rows(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def mmr_select(relevance, similarity, k, mmr_lambda=0.7):
+    """
+    Maximal marginal relevance: repeatedly picks the candidate maximizing
+    lambda * relevance - (1 - lambda) * (max similarity to those already
+    picked). Returns candidate indices in pick order.
+    """
+    n = len(relevance)
+    selected = []
+    max_similarity = np.zeros(n, dtype=np.float32)
+    available = np.ones(n, dtype=bool)
+    for _ in range(min(k, n)):
+        scores = mmr_lambda * relevance - (1 - mmr_lambda) * max_similarity
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        max_similarity = np.maximum(max_similarity, similarity[best])
+    return selected
+
+
+def diversify(store, ranked_ids, query_embedding, k, mmr_lambda=0.7, dedupe_threshold=0.95):
+    """
+    Reduces a ranked candidate list to `k` distinct chunks. A candidate is
+    dropped if a better-ranked candidate from the same sample has cosine
+    similarity >= `dedupe_threshold` (None disables); the rest are chosen
+    by MMR (`mmr_lambda` None keeps their order). Relevance is cosine
+    similarity to `query_embedding`, or the candidate's rank when there is
+    no embedding (BM25).
+    """
+    if store.vectors is None:
+        raise ValueError("This chunk store has no stored vectors; re-run a full ingest to enable diversification.")
+    if len(ranked_ids) <= 1:
+        return list(ranked_ids)[:k]
+    positions = store.positions(ranked_ids)
+    ranked_ids = np.asarray(ranked_ids)[positions >= 0]
+    positions = positions[positions >= 0]
+    vectors = _unit_rows(np.asarray(store.vectors[positions], dtype='float32'))
+    similarity = vectors @ vectors.T
+
+    keep = np.ones(len(positions), dtype=bool)
+    if dedupe_threshold is not None:
+        samples = np.asarray(store.columns['row_key'])[positions]
+        duplicate = (similarity >= dedupe_threshold) & (samples[:, None] == samples[None, :])
+        for i in range(1, len(positions)):
+            if duplicate[i, :i][keep[:i]].any():
+                keep[i] = False
+    ranked_ids, vectors, similarity = ranked_ids[keep], vectors[keep], similarity[np.ix_(keep, keep)]
+
+    if mmr_lambda is None:
+        return [int(i) for i in ranked_ids[:k]]
+    if query_embedding is not None:
+        relevance = vectors @ _unit_rows(np.asarray(query_embedding, dtype='float32').reshape(1, -1))[0]
+    else:
+        relevance = 1.0 - np.arange(len(ranked_ids), dtype=np.float32) / len(ranked_ids)
+    return [int(ranked_ids[i]) for i in mmr_select(relevance, similarity, k, mmr_lambda)]
+
+
+def retrieve(index, store, lexical, questions, query_embeddings, top_k, filters=None,
+             mode="vector", candidates=20, rrf_k=60, diversity=None):
+    """
+    Ranked chunk IDs (lists, best first) for each question.
+
+    `query_embeddings` may be None in "bm25" mode. `lexical` is the
+    backend's LexicalIndex (needed for "bm25"/"hybrid"). In "hybrid" mode
+    each retriever contributes its top `candidates` before fusion.
+
+    `diversity` enables diversification: a dict with `candidates` (how
+    many to over-fetch), `mmr_lambda` and `dedupe_threshold` (see
+    diversify()).
+    """
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Unknown retrieval mode '{mode}'. Choose one of {RETRIEVAL_MODES}.")
+    if mode != "vector" and lexical is None:
+        raise ValueError(f"'{mode}' retrieval needs the lexical index; re-run ingest to build it.")
+    if diversity:
+        ranked = retrieve(index, store, lexical, questions, query_embeddings,
+                          max(top_k, diversity.get('candidates', candidates)),
+                          filters=filters, mode=mode, candidates=candidates, rrf_k=rrf_k)
+        return [diversify(store, ids, query_embeddings[i] if query_embeddings is not None else None, top_k,
+                          diversity.get('mmr_lambda'), diversity.get('dedupe_threshold'))
+                for i, ids in enumerate(ranked)]
+    k = max(candidates, top_k) if mode == "hybrid" else top_k
+
+    if mode != "bm25":
+        if filters:
+            _, vector_ids = filtered_search(store, query_embeddings, filters, k)
+        else:
+            _, vector_ids = index.search(query_embeddings, k)
+    if mode != "vector":
+        allowed_ids = store.filter_ids(filters) if filters else None
+        _, lexical_ids = lexical.search_many(questions, k, allowed_ids)
+
+    if mode == "vector":
+        return [[int(i) for i in row if i != -1] for row in vector_ids]
+    if mode == "bm25":
+        return [[int(i) for i in row if i != -1] for row in lexical_ids]
+    return [reciprocal_rank_fusion([v, l], rrf_k, top_k) for v, l in zip(vector_ids, lexical_ids)]
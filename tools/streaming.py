@@ -0,0 +1,84 @@
+"""
+Streaming Answers
+-----------------
+Wraps a backend's token stream so callers can show the answer as it is
+generated while the timings are recorded:
+
+    ttft              seconds from the start of the query (retrieval
+                      included) to the first token
+    total_latency     seconds from the start of the query to the last token
+    tokens            streamed tokens (one per chunk from OpenAI / Ollama)
+    tokens_per_sec    generation rate between the first and last token
+"""
+import time
+
+
+class StreamingAnswer:
+    """
+    Iterable over answer text pieces, returned by a backend's
+    `query_stream()`. Retrieval has already run, so `chunks` is available
+    immediately; `answer` and `metrics` are complete once iteration ends,
+    at which point `on_complete(answer, chunks)` is called if given.
+    A caller that stops iterating early should call close() so the model
+    stream (and its concurrency slot) is released right away.
+    """
+
+    def __init__(self, pieces, chunks, start_time=None, on_complete=None):
+        self._pieces = pieces
+        self.chunks = chunks
+        self.start_time = start_time if start_time is not None else time.perf_counter()
+        self.on_complete = on_complete
+        self.parts = []
+        self.metrics = {}
+
+    @property
+    def answer(self):
+        return "".join(self.parts)
+
+    def __iter__(self):
+        first_token_time = None
+        try:
+            for piece in self._pieces:
+                if not piece:
+                    continue
+                if first_token_time is None:
+                    first_token_time = time.perf_counter()
+                self.parts.append(piece)
+                yield piece
+        finally:
+            # Reached early when the caller closes this iterator
+            self.close()
+        end_time = time.perf_counter()
+
+        tokens = len(self.parts)
+        generation_time = end_time - first_token_time if first_token_time is not None else 0.0
+        self.metrics = {
+            "ttft": first_token_time - self.start_time if first_token_time is not None else None,
+            "total_latency": end_time - self.start_time,
+            "tokens": tokens,
+            "tokens_per_sec": tokens / generation_time if generation_time > 0 else None,
+        }
+        if self.on_complete is not None:
+            self.on_complete(self.answer, self.chunks)
+
+    def close(self):
+        """Stops the underlying token stream, e.g. when the client went away."""
+        if hasattr(self._pieces, "close"):
+            self._pieces.close()
+
+    def consume(self, echo=False):
+        """Drains the stream (printing it if `echo`) and returns the full answer."""
+        for piece in self:
+            if echo:
+                print(piece, end="", flush=True)
+        if echo:
+            print()
+        return self.answer
+
+
+def format_metrics(metrics):
+    ttft = metrics.get("ttft")
+    rate = metrics.get("tokens_per_sec")
+    return (f"TTFT {ttft:.2f}s | " if ttft is not None else "TTFT n/a | ") + \
+           (f"{rate:.1f} tokens/s | " if rate is not None else "") + \
+           f"total {metrics['total_latency']:.2f}s"
@@ -0,0 +1,147 @@
+"""
+Query Tracing
+-------------
+Lightweight per-query stage timings. A caller opens a trace around one
+query; code along the query path marks its stages with `span()`:
+
+    with start_trace() as trace:
+        answer, chunks = query(question)       # spans recorded inside
+    trace.to_dict()   # {'spans': [{'stage', 'start', 'duration'}], 'stages': {stage: total}}
+
+Stages used by the backends: normalize, index_load, embed, search,
+shortlist and select (PageIndex document selection), context_build,
+generate, and judge (evaluation). The current trace lives in a context
+variable, so concurrent queries on different threads keep separate traces,
+and `span()` outside a trace is a no-op. Work handed to a thread pool is
+traced by submitting `in_current_trace(func)`.
+
+stage_percentiles() summarizes many traces as p50/p95/p99 per stage;
+span_percentiles() does the same for the spans of one (batch) trace.
+"""
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+import numpy as np
+
+_current = contextvars.ContextVar("trace", default=None)
+
+
+class Trace:
+    """Spans of one query, with start times relative to the trace start."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, stage, start, duration):
+        with self._lock:
+            self.spans.append({"stage": stage, "start": start - self.start, "duration": duration})
+
+    @contextmanager
+    def span(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, start, time.perf_counter() - start)
+
+    def stages(self):
+        """Total seconds per stage (a stage may occur more than once)."""
+        totals = {}
+        with self._lock:
+            for s in self.spans:
+                totals[s["stage"]] = totals.get(s["stage"], 0.0) + s["duration"]
+        return totals
+
+    def to_dict(self):
+        with self._lock:
+            spans = [dict(s) for s in self.spans]
+        return {"spans": spans, "stages": self.stages()}
+
+
+@contextmanager
+def start_trace():
+    """Makes a new Trace current for the enclosed code and yields it."""
+    trace = Trace()
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+
+
+def current_trace():
+    return _current.get()
+
+
+@contextmanager
+def span(stage):
+    """Times the enclosed code as `stage` in the current trace, if there is one."""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    with trace.span(stage):
+        yield
+
+
+def in_current_trace(func):
+    """
+    Wraps `func` so it records into the caller's current trace from any
+    thread, e.g. for pool.map(). Safe to call concurrently.
+    """
+    trace = _current.get()
+
+    def run(*args, **kwargs):
+        token = _current.set(trace)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _current.reset(token)
+    return run
+
+
+def stage_percentiles(traces, percentiles=(50, 95, 99)):
+    """
+    Per-stage summary over traces (Trace objects or their to_dict()):
+    {stage: {'count', 'mean', 'p50', 'p95', 'p99'}} in seconds, from each
+    trace's total time in that stage.
+    """
+    per_stage = {}
+    for trace in traces:
+        stages = trace["stages"] if isinstance(trace, dict) else trace.stages()
+        for stage, duration in stages.items():
+            per_stage.setdefault(stage, []).append(duration)
+    return _summarize(per_stage, percentiles)
+
+
+def span_percentiles(trace, percentiles=(50, 95, 99)):
+    """
+    Like stage_percentiles(), but over the individual spans of one trace,
+    e.g. a batch whose per-question generate spans share a single trace.
+    """
+    spans = trace["spans"] if isinstance(trace, dict) else trace.to_dict()["spans"]
+    per_stage = {}
+    for s in spans:
+        per_stage.setdefault(s["stage"], []).append(s["duration"])
+    return _summarize(per_stage, percentiles)
+
+
+def _summarize(per_stage, percentiles):
+    summary = {}
+    for stage, durations in per_stage.items():
+        values = np.asarray(durations, dtype=np.float64)
+        summary[stage] = {"count": len(values), "mean": float(values.mean())}
+        summary[stage].update({f"p{p}": float(np.percentile(values, p)) for p in percentiles})
+    return summary
+
+
+def format_stage_table(summary):
+    """Plain-text table of stage_percentiles() output, in milliseconds."""
+    lines = [f"{'stage':<14}{'n':>5}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"]
+    for stage, stats in sorted(summary.items(), key=lambda item: -item[1]["p50"]):
+        lines.append(f"{stage:<14}{stats['count']:>5}{stats['p50'] * 1000:>10.1f}"
+                     f"{stats['p95'] * 1000:>10.1f}{stats['p99'] * 1000:>10.1f}")
+    return "\n".join(lines)